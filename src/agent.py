@@ -5,9 +5,16 @@ Agent 主类 - 简单的包装器
 """
 
 import asyncio
-from typing import Optional
+from typing import Optional, Dict, Any, AsyncIterator, Tuple, Union
 
 from .graph.builder import GraphFactory
+from .graph.graph_config import HTTP_POOL_CONFIG, USAGE_CONFIG, PREFETCH_CONFIG, NODE_PARAMS
+from .llms.client_registry import get_client_registry
+from .llms.cassette import get_cassette
+from .llms.usage import UsageTracker, track_usage
+from .tools.circuit_breaker import get_circuit_breaker
+from .tools.prefetch import PrefetchStore
+from .tools.doc_store import DocumentStore
 from .utils import load_config
 
 
@@ -18,23 +25,156 @@ class StructuredReportAgent:
     使用方式:
         agent = StructuredReportAgent()
         report = agent.generate_report("宁德时代投资价值分析")
+    
+    离线回放（不调用 DashScope / LightRAG）:
+        configure_cassette("tests/cassettes/report.jsonl.gz", mode="replay")
+        agent = StructuredReportAgent()
     """
     
-    def __init__(self):
-        """初始化 Agent"""
-        self.graph = GraphFactory.create_graph()
+    def __init__(self, embedder=None):
+        """
+        初始化 Agent
+        
+        Args:
+            embedder: 本地向量检索使用的向量化函数，见 GraphFactory.create_graph
+        """
+        self.graph = GraphFactory.create_graph(embedder=embedder)
+        # 最近一次运行的 LLM 用量明细，可 export_jsonl 导出
+        self.last_usage: Optional[UsageTracker] = None
         print("✅ StructuredReportAgent 初始化完成")
     
-    async def run(self, query: str) -> str:
+    async def run(self, query: str, with_usage: bool = False) -> Union[str, Tuple[str, Dict[str, Any]]]:
         """
         异步执行报告生成
         
         Args:
             query: 查询/主题文本
+            with_usage: 是否同时返回 LLM 用量汇总
+        
+        Returns:
+            生成的 Markdown 报告；with_usage 为 True 时返回 (报告, 用量汇总)，
+            用量汇总格式见 UsageTracker.summary
+        """
+        usage = UsageTracker()
+        report = await self._run_graph(query, {"recursion_limit": 50}, usage)
+        if with_usage:
+            return report, usage.summary()
+        return report
+    
+    async def astream_report(self, query: str) -> AsyncIterator[Tuple[Optional[str], str]]:
+        """
+        流式执行报告生成，边写边推送段落内容
+        
+        使用方式:
+            async for section_title, delta in agent.astream_report(query):
+                ...
+        
+        Args:
+            query: 查询/主题文本
+        
+        Yields:
+            (section_title, delta) 事件:
+            - 段落每开始一版新草稿（初稿或重写）时先推送一个空 delta，消费方应清空该段落已显示的内容
+            - 之后推送该版草稿的增量文本
+            - 最后一个事件的 section_title 为 None，delta 为编译完成的完整报告
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        
+        def on_section_delta(section_title: str, delta: str):
+            # 同步节点运行在线程池中，统一经由事件循环投递
+            loop.call_soon_threadsafe(queue.put_nowait, (section_title, delta))
+        
+        config = {
+            "recursion_limit": 50,
+            "configurable": {"on_section_delta": on_section_delta}
+        }
+        
+        task = asyncio.create_task(self._run_graph(query, config))
+        task.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, done))
+        
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                yield item
+            
+            yield None, await task
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    async def _run_graph(self, query: str, config: Dict[str, Any],
+                         usage: Optional[UsageTracker] = None) -> str:
+        """
+        执行图并返回最终报告
+        
+        Args:
+            query: 查询/主题文本
+            config: 传给 graph.astream 的运行配置
+            usage: 记录本次运行 LLM 用量的 UsageTracker，None 时新建
         
         Returns:
             生成的 Markdown 报告
         """
+        usage = usage if usage is not None else UsageTracker()
+        self.last_usage = usage
+        before = self.retrieval_status()
+        
+        # 每次运行独立的文档存储与检索预取存储，经 configurable 传给各节点；
+        # 状态中只流转文档引用句柄，正文在文档存储中只存一份
+        doc_store = DocumentStore()
+        configurable = {**config.get("configurable", {}), "doc_store": doc_store}
+        prefetch = None
+        if PREFETCH_CONFIG.get("enabled"):
+            prefetch = PrefetchStore(
+                max_results=NODE_PARAMS.get("search", {}).get("max_results", 5),
+                **{k: v for k, v in PREFETCH_CONFIG.items() if k != "enabled"}
+            )
+            configurable["prefetch"] = prefetch
+        config = {**config, "configurable": configurable}
+        
+        try:
+            with track_usage(usage):
+                final_output = await self._stream_graph(query, config)
+        finally:
+            if prefetch is not None:
+                prefetch.close()
+        
+        if prefetch is not None and prefetch.queries:
+            stats = prefetch.stats()
+            print(f"  🚚 [预取] {stats['queries']} 个预取检索词，命中 {stats['hits']} / 未命中 {stats['misses']}")
+        docs = doc_store.stats()
+        print(f"  📚 [文档] 检索到 {docs['puts']} 条结果，去重后存储 {docs['documents']} 篇 ({docs['chars']} 字)")
+        if docs["missing"]:
+            print(f"  ⚠️ [文档] {docs['missing']} 次引用的文档不存在，对应参考资料显示为“未知来源”")
+        
+        after = self.retrieval_status()
+        if before is not None and after is not None and after["rejected"] > before["rejected"]:
+            print(f"  ⚠️ [检索] 本次运行 {after['rejected'] - before['rejected']} 次检索因熔断被跳过，"
+                  f"报告可能缺少部分资料（当前状态: {after['state']}）")
+        
+        total = usage.summary()["total"]
+        print(f"  📊 [用量] LLM 调用 {total['calls']} 次 (缓存 {total['cached_calls']})，"
+              f"输入 {total['prompt_tokens']} / 输出 {total['completion_tokens']} tokens")
+        if USAGE_CONFIG.get("export_path"):
+            usage.export_jsonl(USAGE_CONFIG["export_path"])
+        return final_output
+    
+    def retrieval_status(self) -> Optional[Dict[str, Any]]:
+        """
+        检索服务熔断状态
+        
+        Returns:
+            CircuitBreaker.stats() 的结果，未启用熔断时返回 None
+        """
+        breaker = get_circuit_breaker()
+        return breaker.stats() if breaker is not None else None
+    
+    async def _stream_graph(self, query: str, config: Dict[str, Any]) -> str:
+        """执行图，打印进度并返回最终报告"""
         inputs = {
             "query": query,
             "sections": [],
@@ -44,28 +184,38 @@ class StructuredReportAgent:
         final_output = None
         print(f"🚀 开始执行: {query}")
         
-        # 流式处理图事件
-        async for event in self.graph.astream(
-            inputs,
-            config={"recursion_limit": 50}
-        ):
-            for node_name, value in event.items():
-                # 大纲生成
-                if node_name == "generate_structure":
-                    sections_count = len(value.get('sections', []))
-                    print(f"  📋 [大纲] 已生成 {sections_count} 个段落任务")
-                
-                # 段落处理进度
-                elif node_name == "section_worker":
-                    if "completed_sections" in value:
-                        completed = len(value.get('completed_sections', []))
-                        print(f"  ✍️ [进度] 已完成 {completed} 个段落")
-                
-                # 报告编译完成
-                elif node_name == "compile":
-                    final_output = value.get("final_report")
-                    print(f"  📝 [编译] 报告已生成 ({len(final_output)} 字)")
+        # 大纲生成期间在后台预热连接，段落并发展开时无需再握手
+        warm_up = None
+        cassette = get_cassette()
+        replaying = cassette is not None and cassette.replaying
+        if HTTP_POOL_CONFIG.get("warm_up_on_run") and not replaying:
+            warm_up = asyncio.create_task(get_client_registry().awarm_up())
         
+        # 流式处理图事件；图执行出错或被取消时也要停止预热，避免遗留后台任务
+        try:
+            async for event in self.graph.astream(
+                inputs,
+                config=config
+            ):
+                for node_name, value in event.items():
+                    # 大纲生成
+                    if node_name == "generate_structure":
+                        sections_count = len(value.get('sections', []))
+                        print(f"  📋 [大纲] 已生成 {sections_count} 个段落任务")
+                    
+                    # 段落处理进度
+                    elif node_name == "section_worker":
+                        if "completed_sections" in value:
+                            completed = len(value.get('completed_sections', []))
+                            print(f"  ✍️ [进度] 已完成 {completed} 个段落")
+                    
+                    # 报告编译完成
+                    elif node_name == "compile":
+                        final_output = value.get("final_report")
+                        print(f"  📝 [编译] 报告已生成 ({len(final_output)} 字)")
+        finally:
+            if warm_up is not None and not warm_up.done():
+                warm_up.cancel()
         return final_output
     
     def generate_report(self, query: str) -> str:
@@ -84,4 +234,4 @@ class StructuredReportAgent:
 # 便利函数
 def create_agent() -> StructuredReportAgent:
     """创建 Agent 实例"""
-    return StructuredReportAgent()
\ No newline at end of file
+    return StructuredReportAgent()
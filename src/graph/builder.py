@@ -3,27 +3,84 @@ src/graph/builder.py
 图构建器 - 负责组装 LangGraph
 """
 from ..llms.qwen_llm import QwenLLM
-from typing import Any, Callable, Dict, List
+from ..llms.cache import LLMResponseCache
+from ..llms.rate_limiter import configure_rate_limiter, get_rate_limiter
+from ..llms.client_registry import configure_client_registry, has_client_registry
+from ..llms.hedging import configure_hedger, get_hedger
+from ..llms.cassette import configure_cassette, get_cassette
+from typing import Any, Callable, Dict, List, Optional
 from langgraph.graph import StateGraph, END, START
 from langgraph.constants import Send
 import re
+import importlib
 
-from .graph_config import SUBGRAPH_TOPOLOGY, MAIN_GRAPH_TOPOLOGY, EXECUTION_CONFIG
+from .graph_config import (
+    SUBGRAPH_TOPOLOGY, MAIN_GRAPH_TOPOLOGY, EXECUTION_CONFIG, NODE_PARAMS,
+    LLM_CACHE_CONFIG, RATE_LIMIT_CONFIG, HEDGING_CONFIG, HTTP_POOL_CONFIG, CASSETTE_CONFIG,
+    LIGHTRAG_CONFIG, RETRIEVAL_CACHE_CONFIG, RETRIEVAL_CONFIG, LOCAL_BM25_CONFIG, LOCAL_VECTOR_CONFIG,
+    CIRCUIT_BREAKER_CONFIG, ONLINE_SEARCH_CONFIG, RETRIEVAL_ROUTER_CONFIG,
+    RERANK_CONFIG, CONTEXT_BUDGET_CONFIG, REVISION_CONFIG, COMPRESSION_CONFIG,
+)
 from ..state import SectionState, AgentState
-from ..nodes.structure_node import generate_structure_node
-from ..nodes.writer_node import write_section_node
-from ..nodes.reflector_node import reflector_node, should_continue
-from ..nodes.search_node import search_node
+from ..nodes.structure_node import generate_structure_node, agenerate_structure_node
+from ..nodes.writer_node import write_section_node, awrite_section_node
+from ..nodes.reflector_node import reflector_node, areflector_node, should_continue
+from ..nodes.search_node import search_node, asearch_node
+from ..tools.lightrag_search import LightRAGSearch
+from ..tools.retrieval_cache import RetrievalCache
+from ..tools.local_bm25 import LocalBM25Search
+from ..tools.local_vector import LocalVectorSearch, Embedder, hash_embedding
+from ..tools.tavily_search import TavilySearch
+from ..tools.retrieval_router import RetrievalRouter
+from ..tools.doc_store import DocumentStore, resolve_refs
+from ..tools.prefetch import PrefetchStore, prefetch_query
+from ..tools.circuit_breaker import configure_circuit_breaker, get_circuit_breaker
 from ..utils import load_config
 
 
+def _get_delta_callback(config: Optional[Dict[str, Any]]) -> Optional[Callable[[str, str], None]]:
+    """从运行配置中取出段落增量回调 (由 StructuredReportAgent.astream_report 注入)"""
+    return ((config or {}).get("configurable") or {}).get("on_section_delta")
+
+
+def _get_prefetch(config: Optional[Dict[str, Any]]) -> Optional[PrefetchStore]:
+    """从运行配置中取出本次运行的检索预取存储 (由 StructuredReportAgent 注入)"""
+    return ((config or {}).get("configurable") or {}).get("prefetch")
+
+
+def _get_doc_store(config: Optional[Dict[str, Any]]) -> Optional[DocumentStore]:
+    """从运行配置中取出本次运行的文档存储 (由 StructuredReportAgent 注入)"""
+    return ((config or {}).get("configurable") or {}).get("doc_store")
+
+
+def _prefetch_queries(state: AgentState, result: Dict[str, Any]) -> List[str]:
+    """大纲生成后各段落的预取检索词"""
+    topic = state.get("query", "")
+    return [prefetch_query(topic, sec) for sec in result.get("sections", []) if isinstance(sec, dict)]
+
+
 class SubGraphBuilder:
     """子图构建器"""
     
-    def __init__(self, llm):
+    def __init__(self, llm, async_nodes: bool = True, node_llms: Optional[Dict[str, Any]] = None,
+                 retriever=None):
+        """
+        Args:
+            llm: 默认 LLM
+            async_nodes: 是否使用异步节点
+            node_llms: 节点名 → LLM 适配器，未指定的节点使用默认 LLM
+            retriever: 检索客户端（需提供 search，可选 asearch），None 时使用搜索节点的默认客户端
+        """
         self.llm = llm
+        self.node_llms = node_llms or {}
+        self.async_nodes = async_nodes
+        self.retriever = retriever
         self.config = SUBGRAPH_TOPOLOGY
     
+    def _llm(self, node: str):
+        """获取节点对应的 LLM"""
+        return self.node_llms.get(node, self.llm)
+    
     def build(self) -> Any:
         """
         构建子图
@@ -52,9 +109,51 @@ class SubGraphBuilder:
     
     def _add_nodes(self, workflow: StateGraph):
         """添加所有节点"""
-        workflow.add_node("search", lambda s: search_node(s, self.llm))
-        workflow.add_node("write", lambda s: write_section_node(s, self.llm))
-        workflow.add_node("reflect", lambda s: reflector_node(s, self.llm))
+        search_llm = self._llm("search")
+        write_llm = self._llm("write")
+        reflect_llm = self._llm("reflect")
+        repair_llm = self.node_llms.get("repair")
+        rerank = {k: v for k, v in RERANK_CONFIG.items() if k != "enabled"} if RERANK_CONFIG.get("enabled") else None
+        context_budget = (
+            {k: v for k, v in CONTEXT_BUDGET_CONFIG.items() if k != "enabled"}
+            if CONTEXT_BUDGET_CONFIG.get("enabled") else None
+        )
+        revision = bool(REVISION_CONFIG.get("enabled"))
+        search_params = {k: v for k, v in NODE_PARAMS.get("search", {}).items() if k in ("max_results", "timeout")}
+        compression = (
+            {k: v for k, v in COMPRESSION_CONFIG.items() if k != "enabled"}
+            if COMPRESSION_CONFIG.get("enabled") else None
+        )
+        
+        if self.async_nodes:
+            async def search(s, config):
+                return await asearch_node(s, search_llm, retriever=self.retriever, rerank=rerank,
+                                          prefetch=_get_prefetch(config), doc_store=_get_doc_store(config),
+                                          search_params=search_params)
+            
+            async def write(s, config):
+                return await awrite_section_node(s, write_llm, on_delta=_get_delta_callback(config),
+                                                 repair_llm=repair_llm, doc_store=_get_doc_store(config),
+                                                 context_budget=context_budget, revision=revision,
+                                                 compression=compression)
+            
+            async def reflect(s):
+                return await areflector_node(s, reflect_llm, repair_llm=repair_llm)
+            
+            workflow.add_node("search", search)
+            workflow.add_node("write", write)
+            workflow.add_node("reflect", reflect)
+        else:
+            workflow.add_node("search", lambda s, config: search_node(
+                s, search_llm, retriever=self.retriever, rerank=rerank, prefetch=_get_prefetch(config),
+                doc_store=_get_doc_store(config), search_params=search_params
+            ))
+            workflow.add_node("write", lambda s, config: write_section_node(
+                s, write_llm, on_delta=_get_delta_callback(config), repair_llm=repair_llm,
+                doc_store=_get_doc_store(config), context_budget=context_budget, revision=revision,
+                compression=compression
+            ))
+            workflow.add_node("reflect", lambda s: reflector_node(s, reflect_llm, repair_llm=repair_llm))
         workflow.add_node("format_output", self._create_format_output_node())
     
     def _add_edges(self, workflow: StateGraph):
@@ -80,7 +179,7 @@ class SubGraphBuilder:
         """
         创建 format_output 节点
         
-        作用: 把段落内容和搜索结果打包成 SectionOutput
+        作用: 把段落内容和搜索结果打包成 SectionOutput（使用文档存储时 local_refs 为引用句柄）
         """
         def format_output(state: SectionState):
             section_def = state['section_def']
@@ -106,9 +205,21 @@ class SubGraphBuilder:
 class MainGraphBuilder:
     """主图构建器"""
     
-    def __init__(self, llm, subgraph: Any):
+    def __init__(self, llm, subgraph: Any, async_nodes: bool = True,
+                 node_llms: Optional[Dict[str, Any]] = None, retriever=None):
+        """
+        Args:
+            llm: 默认 LLM
+            subgraph: 已编译的段落子图
+            async_nodes: 是否使用异步节点
+            node_llms: 节点名 → LLM 适配器，未指定的节点使用默认 LLM
+            retriever: 检索客户端，大纲生成后用于预取各段落的检索结果
+        """
         self.llm = llm
+        self.retriever = retriever
+        self.node_llms = node_llms or {}
         self.subgraph = subgraph
+        self.async_nodes = async_nodes
         self.config = MAIN_GRAPH_TOPOLOGY
     
     def build(self) -> Any:
@@ -137,7 +248,30 @@ class MainGraphBuilder:
     
     def _add_nodes(self, workflow: StateGraph):
         """添加所有节点"""
-        workflow.add_node("generate_structure", lambda s: generate_structure_node(s, self.llm))
+        structure_llm = self.node_llms.get("structure", self.llm)
+        repair_llm = self.node_llms.get("repair")
+        inline_search_query = NODE_PARAMS.get("structure", {}).get("inline_search_query", False)
+        
+        # 大纲生成后立即在后台为所有段落发起预取检索，段落 worker 展开时结果已在路上
+        if self.async_nodes:
+            async def generate_structure(s, config):
+                result = await agenerate_structure_node(s, structure_llm, inline_search_query,
+                                                        repair_llm=repair_llm)
+                prefetch = _get_prefetch(config)
+                if prefetch is not None and self.retriever is not None:
+                    prefetch.astart(self.retriever, _prefetch_queries(s, result), s.get("query", ""))
+                return result
+            
+            workflow.add_node("generate_structure", generate_structure)
+        else:
+            def generate_structure(s, config):
+                result = generate_structure_node(s, structure_llm, inline_search_query, repair_llm=repair_llm)
+                prefetch = _get_prefetch(config)
+                if prefetch is not None and self.retriever is not None:
+                    prefetch.start(self.retriever, _prefetch_queries(s, result), s.get("query", ""))
+                return result
+            
+            workflow.add_node("generate_structure", generate_structure)
         workflow.add_node("section_worker", self.subgraph)
         workflow.add_node("compile", self._create_compile_node())
     
@@ -161,8 +295,9 @@ class MainGraphBuilder:
         
         作用: 汇总所有段落，生成全局引用映射，替换本地引用为��局引用
         """
-        def compile_report(state: AgentState):
+        def compile_report(state: AgentState, config=None):
             sections_data = state.get("completed_sections", [])
+            doc_store = _get_doc_store(config)
             
             # --- 阶段 1: 构建全局引用库 ---
             global_refs = []
@@ -170,7 +305,7 @@ class MainGraphBuilder:
             
             # 遍历所有段落，收集所有引用
             for sec in sections_data:
-                local_refs = sec.get("local_refs", [])
+                local_refs = resolve_refs(sec.get("local_refs", []), doc_store)
                 
                 for ref in local_refs:
                     url = ref.get('url', '')
@@ -194,7 +329,7 @@ class MainGraphBuilder:
             
             for sec in sections_data:
                 original_text = sec["content"]
-                local_refs = sec.get("local_refs", [])
+                local_refs = resolve_refs(sec.get("local_refs", []), doc_store)
                 
                 # 建立局部 ID → 全局 ID 映射
                 local_id_map = {}
@@ -387,7 +522,11 @@ class MainGraphBuilder:
                 "search_results": [],
                 "current_content": "",
                 "is_satisfactory": False,
-                "completed_sections": []
+                "completed_sections": [],
+                # 大纲附带的首次搜索词（inline_search_query 开启时）
+                "initial_search_query": sec.get("search_query") if isinstance(sec, dict) else None,
+                # 本段落的预取检索词（与 _prefetch_queries 一致），搜索节点只取用该检索词的预取结果
+                "prefetch_key": prefetch_query(query, sec) if isinstance(sec, dict) else None
             })
             tasks.append(task)
         
@@ -398,18 +537,195 @@ class GraphFactory:
     """图工厂 - 统一管理图的创建"""
     
     @staticmethod
-    def create_graph() -> Any:
-        """创建完整的图（子图 + 主图）"""
-        # 初始化 LLM
+    def create_graph(embedder: Optional[Embedder] = None) -> Any:
+        """
+        创建完整的图（子图 + 主图）
+        
+        Args:
+            embedder: 本地向量检索 (RETRIEVAL_CONFIG["backend"] == "vector") 使用的向量化函数，
+                      None 时使用 LOCAL_VECTOR_CONFIG["embedder"]
+        """
+        # 初始化全局限流器（进程内只配置一次，多份报告共享同一预算）
+        if RATE_LIMIT_CONFIG.get("enabled") and get_rate_limiter() is None:
+            configure_rate_limiter(**{
+                k: v for k, v in RATE_LIMIT_CONFIG.items() if k != "enabled"
+            })
+        
+        # 初始化共享连接池（进程内只配置一次，多个 LLM 实例复用）
+        if not has_client_registry():
+            configure_client_registry(**{
+                k: v for k, v in HTTP_POOL_CONFIG.items() if k != "warm_up_on_run"
+            })
+        
+        # 初始化录制 / 回放（已通过 configure_cassette 配置时不覆盖）
+        if CASSETTE_CONFIG.get("mode") and get_cassette() is None:
+            configure_cassette(**CASSETTE_CONFIG)
+        
+        # 初始化全局对冲器（进程内只配置一次，延迟样本跨报告累积）；
+        # 录制 / 回放时不对冲，原因同 LLM 响应缓存（补发的请求会重复录制同一请求键）
+        if HEDGING_CONFIG.get("enabled") and get_hedger() is None and get_cassette() is None:
+            configure_hedger(**{
+                k: v for k, v in HEDGING_CONFIG.items() if k != "enabled"
+            })
+        
+        # 初始化 LLM（按 NODE_PARAMS 为每个节点选择模型并绑定参数）
         config = load_config()
-        llm = QwenLLM(api_key=config.dashscope_api_key)
+        api_key = config.dashscope_api_key
+        cassette = get_cassette()
+        if not api_key and cassette is not None and cassette.replaying:
+            api_key = "cassette-replay"  # 离线回放不会发出请求
+        llm, node_llms = GraphFactory._create_node_llms(api_key)
+        async_nodes = EXECUTION_CONFIG.get("async_nodes", True)
+        
+        # 初始化检索客户端（各段落共享）
+        retriever = GraphFactory._create_retriever(config, embedder)
         
         # 构建子图
-        subgraph_builder = SubGraphBuilder(llm)
+        subgraph_builder = SubGraphBuilder(llm, async_nodes=async_nodes, node_llms=node_llms,
+                                           retriever=retriever)
         subgraph = subgraph_builder.build()
         
         # 构建主图
-        main_graph_builder = MainGraphBuilder(llm, subgraph)
+        main_graph_builder = MainGraphBuilder(llm, subgraph, async_nodes=async_nodes, node_llms=node_llms,
+                                              retriever=retriever)
         main_graph = main_graph_builder.build()
         
-        return main_graph
\ No newline at end of file
+        return main_graph
+    
+    @staticmethod
+    def _create_retriever(config, embedder=None) -> Any:
+        """
+        创建检索客户端：RETRIEVAL_CONFIG 指定的本地 / LightRAG 检索，
+        启用网络搜索时再与 Tavily 组成多路检索路由
+        
+        Args:
+            config: 全局配置（本地索引的源文件取自 target_files）
+            embedder: 本地向量索引使用的向量化函数，None 时使用 LOCAL_VECTOR_CONFIG["embedder"]
+        """
+        retriever = GraphFactory._create_primary_retriever(config, embedder)
+        web = GraphFactory._create_web_search(config)
+        if web is None:
+            return retriever
+        providers = {RETRIEVAL_CONFIG.get("backend") or "lightrag": retriever, "tavily": web}
+        return RetrievalRouter(providers, **RETRIEVAL_ROUTER_CONFIG)
+    
+    @staticmethod
+    def _create_web_search(config) -> Optional[TavilySearch]:
+        """ENABLE_ONLINE_SEARCH 开启且配置了 TAVILY_API_KEY 时创建网络搜索客户端"""
+        if not getattr(config, "enable_online_search", False):
+            return None
+        api_key = getattr(config, "tavily_api_key", None)
+        cassette = get_cassette()
+        if not api_key and cassette is not None and cassette.replaying:
+            api_key = "cassette-replay"  # 离线回放不会发出请求
+        if not api_key:
+            print("  ⚠️ [检索] 已开启网络搜索但未配置 TAVILY_API_KEY，仅使用本地检索")
+            return None
+        try:
+            return TavilySearch(api_key=api_key, **ONLINE_SEARCH_CONFIG)
+        except ImportError as e:
+            print(f"  ⚠️ [检索] {e}，仅使用本地检索")
+            return None
+    
+    @staticmethod
+    def _create_primary_retriever(config, embedder=None) -> Any:
+        """根据 RETRIEVAL_CONFIG 创建本地 / LightRAG 检索客户端"""
+        backend = RETRIEVAL_CONFIG.get("backend")
+        sources = getattr(config, "target_files", None) or []
+        if backend == "bm25":
+            retriever = LocalBM25Search(sources=sources, **LOCAL_BM25_CONFIG)
+            retriever.ensure_index()
+            return retriever
+        if backend == "vector":
+            params = {k: v for k, v in LOCAL_VECTOR_CONFIG.items() if k != "embedder"}
+            embedder = embedder or GraphFactory._resolve_embedder(LOCAL_VECTOR_CONFIG.get("embedder"), params["dim"])
+            retriever = LocalVectorSearch(embedder=embedder, **params)
+            retriever.index_files(sources)
+            return retriever
+        
+        retriever = LightRAGSearch(**LIGHTRAG_CONFIG)
+        # 录制 / 回放时不使用检索缓存，原因同 LLM 响应缓存
+        if RETRIEVAL_CACHE_CONFIG.get("enabled") and get_cassette() is None:
+            retriever.set_cache(RetrievalCache(**{
+                k: v for k, v in RETRIEVAL_CACHE_CONFIG.items() if k != "enabled"
+            }))
+        if CIRCUIT_BREAKER_CONFIG.get("enabled"):
+            if get_circuit_breaker() is None:
+                configure_circuit_breaker(name="lightrag", **{
+                    k: v for k, v in CIRCUIT_BREAKER_CONFIG.items() if k != "enabled"
+                })
+            retriever.set_circuit_breaker(get_circuit_breaker())
+        return retriever
+    
+    @staticmethod
+    def _resolve_embedder(spec: Any, dim: int) -> Embedder:
+        """
+        解析 LOCAL_VECTOR_CONFIG["embedder"]
+        
+        Args:
+            spec: "模块:函数" 形式的导入路径、向量化函数本身，或 "hash"（哈希向量化，仅用于测试与演示）
+            dim: 向量维度，哈希向量化使用
+        
+        Raises:
+            ValueError: 未配置向量化函数
+        """
+        if callable(spec):
+            return spec
+        if spec == "hash":
+            print("  ⚠️ [Vector] 使用哈希向量化，检索只按字面重叠匹配，不具备语义检索能力")
+            return hash_embedding(dim)
+        if isinstance(spec, str) and ":" in spec:
+            module, _, attr = spec.partition(":")
+            return getattr(importlib.import_module(module), attr)
+        raise ValueError(
+            "向量检索需要向量化函数：请设置 LOCAL_VECTOR_CONFIG['embedder'] 为 \"模块:函数\"，"
+            "或调用 GraphFactory.create_graph(embedder=...)"
+        )
+    
+    @staticmethod
+    def _create_node_llms(api_key: str):
+        """
+        根据 NODE_PARAMS 创建各节点的 LLM 适配器
+        
+        同一模型只创建一个实例（共享缓存与连接池），再按节点绑定 temperature / max_tokens
+        
+        Returns:
+            (默认 LLM, {节点名: BoundLLM})
+        """
+        # 录制 / 回放时关闭响应缓存：命中缓存的请求不会被录制，回放时也不应由缓存应答
+        use_cache = LLM_CACHE_CONFIG.get("enabled") and get_cassette() is None
+        cache = GraphFactory._create_cache() if use_cache else None
+        models: Dict[Optional[str], QwenLLM] = {}
+        
+        def get_llm(model: Optional[str]) -> QwenLLM:
+            if model not in models:
+                llm = QwenLLM(api_key=api_key, model_name=model)
+                llm.set_cache(cache)
+                if not EXECUTION_CONFIG.get("single_flight", True):
+                    llm.set_single_flight(None)
+                models[model] = llm
+            return models[model]
+        
+        default_llm = get_llm(None)
+        node_llms = {}
+        for node, params in NODE_PARAMS.items():
+            node_llms[node] = get_llm(params.get("model")).bind(
+                temperature=params.get("temperature"),
+                max_tokens=params.get("max_tokens")
+            )
+        
+        print("🧠 节点模型: " + ", ".join(
+            f"{node}={bound.get_default_model()}" for node, bound in node_llms.items()
+        ))
+        return default_llm, node_llms
+    
+    @staticmethod
+    def _create_cache() -> LLMResponseCache:
+        """根据 LLM_CACHE_CONFIG 创建响应缓存"""
+        return LLMResponseCache(
+            path=LLM_CACHE_CONFIG["path"],
+            ttl_seconds=LLM_CACHE_CONFIG.get("ttl_seconds"),
+            max_entries=LLM_CACHE_CONFIG.get("max_entries", 5000),
+            max_bytes=LLM_CACHE_CONFIG.get("max_bytes", 200 * 1024 * 1024),
+            nodes=LLM_CACHE_CONFIG.get("nodes")
+        )
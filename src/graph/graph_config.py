@@ -64,6 +64,8 @@ EXECUTION_CONFIG = {
     "max_iterations_per_section": 3,
     "timeout_per_section": 300,  # 单个段落超时（秒）
     "timeout_total": 600,  # 总超时（秒）
+    "async_nodes": True,  # 使用异步节点 (ainvoke)，所有段落共享一个事件循环
+    "single_flight": True,  # 合并相同的进行中 LLM 请求（如多个段落同时发出相同的检索词生成）
 }
 
 # ==========================================
@@ -71,23 +73,278 @@ EXECUTION_CONFIG = {
 # ==========================================
 
 NODE_PARAMS = {
+    # model: 该节点使用的模型，None 表示使用 LLM 默认模型 (qwen-plus)
     "search": {
-        "max_results": 5,
-        "timeout": 30
+        "model": "qwen-turbo",  # 检索词生成是短 JSON，用轻量模型
+        "temperature": 0.3,
+        "max_tokens": 200,
+        "max_results": 5,  # 每次检索的返回数量（预取使用相同的数量）
+        "timeout": 30  # 每次检索的超时（秒）；检索路由下不超过路由的截止时间
     },
     "write": {
+        "model": "qwen-max",  # 长文写作用最强模型
         "temperature": 0.7,
-        "max_tokens": 2000
+        # 单段正文约 2000~3000 字（约 1500~2200 token）加 JSON 包装与引用标注，4000 留出余量又不致
+        # 失控长文；限流器按 max_tokens 全额预扣 TPM，不宜再调高（qwen-max 输出上限 8192）
+        "max_tokens": 4000
     },
     "reflect": {
+        "model": "qwen-turbo",
         "temperature": 0.5,
         "max_tokens": 500
     },
     "structure": {
+        "model": "qwen-plus",
         "temperature": 0.5,
-        "max_tokens": 1000
+        # 每个段落含标题、写作要求与搜索词（约 200~300 token），10 段以上的大纲在 2000 时会被截断
+        "max_tokens": 4000,
+        # 大纲中同时为每个段落生成首次搜索词，段落 worker 不再单独调用 LLM 生成
+        "inline_search_query": True
+    },
+    "repair": {
+        "model": "qwen-turbo",  # JSON 输出无法本地修复时的定向重问，用轻量模型
+        "temperature": 0.0,
+        "max_tokens": 4000  # 需容纳被截断的写作正文
     }
 }
+
+# ==========================================
+# LLM 响应缓存配置
+# ==========================================
+
+LLM_CACHE_CONFIG = {
+    "enabled": True,
+    "path": ".cache/llm_responses.sqlite",
+    "ttl_seconds": 7 * 24 * 3600,  # 条目有效期（秒）
+    "max_entries": 5000,
+    "max_bytes": 200 * 1024 * 1024,
+    # 只缓存结构生成、搜索词生成与反思；写作不缓存
+    "nodes": ["structure", "search", "reflect"],
+}
+
+# ==========================================
+# LLM 全局限流配置 (所有 LLM 实例共享)
+# ==========================================
+
+RATE_LIMIT_CONFIG = {
+    "enabled": True,
+    "requests_per_minute": 60,
+    "tokens_per_minute": 100000,
+    "max_concurrency": 8,  # AIMD 并发上限的最大值
+    "min_concurrency": 1,
+    "target_latency": 60.0,  # 超过该延迟（秒）时下调并发
+    "max_retries": 6,  # 429 最大重试次数
+    "transient_retries": 2,  # 连接失败、超时、5xx 的最大重试次数（启用限流器时 SDK 不再自行重试）
+    "base_backoff": 1.0,
+    "max_backoff": 60.0,
+}
+
+# ==========================================
+# LLM 请求对冲配置 (所有 LLM 实例共享)
+# ==========================================
+
+HEDGING_CONFIG = {
+    # 默认关闭：对冲会额外消耗请求与 token 配额，确有长尾延迟时再开启
+    "enabled": False,
+    "percentile": 0.95,  # 调用超过该分位数的近期延迟仍未返回时补发请求
+    "min_delay": 5.0,  # 最短等待时间（秒）
+    "window": 50,  # 每个 (模型, 节点) 保留的延迟样本数
+    "min_samples": 8,  # 样本不足时不对冲
+    "max_extra_ratio": 0.1,  # 对冲请求数不超过主请求数的 10%
+    "nodes": None,  # 启用对冲的节点，None 表示全部（流式写作不对冲）
+}
+
+# ==========================================
+# LLM HTTP 连接池配置 (按服务商共享)
+# ==========================================
+
+HTTP_POOL_CONFIG = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 60.0,  # 空闲长连接保活时间（秒）
+    "http2": False,  # 需要安装 httpx[http2]
+    "connect_timeout": 10.0,
+    "read_timeout": 120.0,
+    "warm_up_connections": 4,  # 每个服务商预热的连接数
+    "warm_up_on_run": True,  # 每次运行开始时在后台预热连接
+}
+
+# ==========================================
+# 检索后端配置
+# ==========================================
+
+RETRIEVAL_CONFIG = {
+    # "lightrag": 外部 LightRAG 服务 / "bm25": 本地 BM25 索引 / "vector": 本地向量索引
+    # (本地索引的源文件为 TARGET_FILES，无需服务)
+    "backend": "lightrag",
+}
+
+LOCAL_BM25_CONFIG = {
+    "index_dir": ".cache/bm25_index",  # 索引目录，源文件变化时自动重建
+    "chunk_chars": 500,  # 片段长度（字符）
+    "chunk_overlap": 100,
+    "ngram": 2,  # 中文字 n-gram 的最大 n
+    "k1": 1.5,
+    "b": 0.75,
+    "hot_cache_size": 256,  # 热点查询结果缓存条数
+}
+
+LOCAL_VECTOR_CONFIG = {
+    "index_dir": ".cache/vector_index",  # 索引目录，新增或修改的源文件增量追加
+    # 向量化函数的导入路径 "模块:函数"，函数签名为 texts -> (n, dim) 矩阵；
+    # 也可调用 GraphFactory.create_graph(embedder=...) 传入。"hash" 为哈希向量化，只按字面重叠匹配，仅用于测试与演示
+    "embedder": None,
+    "dim": 256,  # 向量维度（需与向量化函数输出一致）
+    "dtype": "float16",  # 向量存储类型: "float16" / "int8"
+    "ivf_threshold": 50000,  # 片段数达到该值后使用 IVF，否则暴力检索
+    "n_lists": None,  # IVF 簇数，None 时取 sqrt(片段数)
+    "n_probe": 8,  # 每次检索扫描的簇数
+    "chunk_chars": 500,
+    "chunk_overlap": 100,
+}
+
+# ==========================================
+# LightRAG 检索客户端配置
+# ==========================================
+
+LIGHTRAG_CONFIG = {
+    "pool_size": 32,  # 连接池大小，应不小于并发段落数
+    "connect_timeout": 5.0,  # 建连超时（秒）
+    "read_timeout": 60.0,  # 读取超时（秒）
+    "keepalive_expiry": 60.0,  # 异步连接池空闲连接保活时间（秒）
+    # 批量检索接口路径，None 表示服务端不支持，search_many 改为有界并发请求
+    "batch_endpoint": None,
+    "max_concurrency": 8,  # search_many 并发请求上限
+}
+
+# ==========================================
+# 检索结果缓存配置 (LightRAG 前置缓存)
+# ==========================================
+
+RETRIEVAL_CACHE_CONFIG = {
+    "enabled": True,
+    "path": ".cache/retrieval.sqlite",
+    "memory_entries": 512,  # 内存 LRU 层条目数
+    # 条目有效期（秒），也可按语料版本指定，如 {"2024Q4": 7 * 24 * 3600}
+    "ttl_seconds": 24 * 3600,
+    # 当前语料 / 索引版本：重建 LightRAG 索引后修改此值，旧版本结果不再命中
+    # (运行中可调用 RetrievalCache.on_index_rebuilt(新版本) 立即失效)
+    "corpus_version": "default",
+}
+
+# ==========================================
+# 网络搜索与多路检索配置
+# config.py 中 ENABLE_ONLINE_SEARCH = True 且配置了 TAVILY_API_KEY 时，
+# 本地检索与网络搜索并发执行，截止时间内返回的结果合并去重
+# ==========================================
+ONLINE_SEARCH_CONFIG = {
+    "search_depth": "basic",  # "basic" / "advanced"（更慢，结果更全）
+    "max_content_chars": 4000,  # 单条网页结果正文的最大长度
+    "max_concurrency": 4,
+}
+
+RETRIEVAL_ROUTER_CONFIG = {
+    "deadline": 8.0,  # 每次检索的截止时间（秒），到时未返回的一路丢弃
+    "max_workers": 8,  # 同步节点模式下的并发线程数
+}
+
+# ==========================================
+# 检索预取配置
+# 大纲生成后立即为每个段落并发发起检索（检索词：大纲附带的搜索词，或 主题 + 标题 + 写作要求开头），
+# 段落首次搜索的检索词与预取检索词相同或重叠时直接使用预取结果
+# ==========================================
+PREFETCH_CONFIG = {
+    "enabled": True,
+    "min_overlap": 0.6,  # 检索词的字 n-gram 至少有该比例出现在预取检索词中才视为命中
+    "wait_timeout": 30.0,  # 预取仍在进行时的最长等待时间（秒）
+}
+
+# ==========================================
+# 检索结果重排配置
+# 每次检索后按字 n-gram TF-IDF 相似度（与段落标题、写作要求）和后端分数加权重排，
+# 只保留前 top_k 条送入写作节点
+# ==========================================
+RERANK_CONFIG = {
+    "enabled": True,
+    "top_k": 8,  # 每个段落保留的参考资料条数
+    "weight": 0.7,  # TF-IDF 相似度权重，其余为后端分数（归一化后）
+    "ngram": 2,
+}
+
+# ==========================================
+# 写作上下文预算配置
+# 写作节点的参考资料按估算 token 数装配，超出预算时按相关度摘录或舍弃（参考资料编号不变），
+# 日志中会打印每个段落舍弃的比例，据此调整预算
+# ==========================================
+CONTEXT_BUDGET_CONFIG = {
+    "enabled": True,
+    "max_tokens": 6000,  # 每个段落参考资料正文的默认 token 预算
+    # 标题包含关键词的段落使用单独预算（表格类段落需要更多原始数据）
+    "section_budgets": {"财务": 9000},
+    "min_doc_tokens": 150,  # 每篇保留文档的最低摘录长度
+    "ngram": 2,
+}
+
+# ==========================================
+# 参考资料抽取式压缩配置
+# 写作前把每篇参考资料切句，按与段落写作要求的字 n-gram 重叠打分，只保留高分句子；
+# 表格行整行保留，含数字的句子加分（只影响提示词，引用编号不变）
+# ==========================================
+COMPRESSION_CONFIG = {
+    "enabled": True,
+    "keep_ratio": 0.4,  # 每篇保留的字数比例
+    "min_chars": 400,  # 每篇至少保留的字数，更短的文档不压缩
+    "ngram": 2,
+    "number_bonus": 0.2,  # 含数字句子的加分
+}
+
+# ==========================================
+# 增量修订配置
+# 反思后的重写只发送上一版草稿、修改意见和上一版之后新增的参考资料，
+# 模型返回修订片段（或大范围调整时的完整正文）；片段无法定位时自动改为整段重写
+# ==========================================
+REVISION_CONFIG = {
+    "enabled": True,
+}
+
+# ==========================================
+# LightRAG 熔断配置
+# 服务连续失败 failure_threshold 次后熔断，熔断期间检索立即返回空结果（不再等待超时），
+# 补充检索直接跳过；reset_timeout 秒后放行探测请求，成功即恢复
+# ==========================================
+CIRCUIT_BREAKER_CONFIG = {
+    "enabled": True,
+    "failure_threshold": 3,
+    "reset_timeout": 30.0,
+    "half_open_max_calls": 1,
+}
+
+# ==========================================
+# LLM 用量统计配置
+# ==========================================
+
+USAGE_CONFIG = {
+    # 每次运行结束后把逐次调用记录追加到该 JSONL 文件，None 表示不导出
+    # (也可通过 agent.last_usage.export_jsonl(path) 手动导出)
+    "export_path": None,
+}
+
+# ==========================================
+# 请求录制 / 回放配置 (LLM 与 LightRAG)
+# ==========================================
+
+CASSETTE_CONFIG = {
+    # "record": 真实运行并录制请求-响应对 / "replay": 离线回放 / None: 关闭
+    "mode": None,
+    "path": ".cache/cassettes/report.jsonl.gz",  # .gz 结尾时 gzip 压缩
+    # 回放时注入的延迟: None 不注入 / "recorded" 按录制延迟 / 固定秒数，
+    # 也可按类型指定，如 {"llm": "recorded", "lightrag": 0.05}
+    "latency": None,
+    "latency_scale": 1.0,  # 延迟缩放系数，0.1 表示按 10 倍速回放
+    "strict": True,  # 回放时找不到录制条目是否报错 (False 时发出真实请求)
+}
+
+
 def visualize_topology():
     """可视化图拓扑"""
     print("\n" + "="*60)
@@ -3,8 +3,23 @@ LLM调用模块
 支持多种大语言模型的统一接口
 """
 
-from .base import BaseLLM
+from .base import BaseLLM, BoundLLM
 from .deepseek import DeepSeekLLM
 from .openai_llm import OpenAILLM
 from .qwen_llm import QwenLLM
-__all__ = ["BaseLLM", "DeepSeekLLM", "OpenAILLM"]
+from .cache import LLMResponseCache
+from .rate_limiter import RateLimiter, configure_rate_limiter, get_rate_limiter
+from .client_registry import ClientRegistry, configure_client_registry, get_client_registry
+from .single_flight import SingleFlight, get_single_flight
+from .hedging import Hedger, configure_hedger, get_hedger
+from .usage import UsageRecord, UsageTracker, track_usage, get_usage_tracker
+from .cassette import (Cassette, CassetteMissError, lognormal_latency,
+                       configure_cassette, get_cassette, disable_cassette)
+__all__ = ["BaseLLM", "BoundLLM", "DeepSeekLLM", "OpenAILLM", "LLMResponseCache",
+           "RateLimiter", "configure_rate_limiter", "get_rate_limiter",
+           "ClientRegistry", "configure_client_registry", "get_client_registry",
+           "SingleFlight", "get_single_flight",
+           "Hedger", "configure_hedger", "get_hedger",
+           "UsageRecord", "UsageTracker", "track_usage", "get_usage_tracker",
+           "Cassette", "CassetteMissError", "lognormal_latency",
+           "configure_cassette", "get_cassette", "disable_cassette"]
@@ -3,8 +3,31 @@ LLM基类定义
 为所有LLM实现提供统一接口
 """
 
+import asyncio
+import hashlib
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Iterator, AsyncIterator
+
+from .cache import request_key
+from .single_flight import get_single_flight
+from .usage import begin_call, end_call, mark_first_token, recording, add_usage
+from .hedging import get_hedger
+from .cassette import get_cassette, llm_request_meta
+
+# 缓存写入前的回复校验: 返回 True 表示回复可以写入缓存
+CacheValidator = Callable[[str], bool]
+
+
+def _cacheable(content: Optional[str], cache_validate: Optional[CacheValidator] = None) -> bool:
+    """空回复永不缓存；给了校验函数时还需通过校验（校验函数抛出异常视为不通过）"""
+    if not content or not content.strip():
+        return False
+    if cache_validate is None:
+        return True
+    try:
+        return bool(cache_validate(content))
+    except Exception:
+        return False
 
 
 class BaseLLM(ABC):
@@ -20,6 +43,8 @@ class BaseLLM(ABC):
         """
         self.api_key = api_key
         self.model_name = model_name
+        self.cache = None
+        self.single_flight = get_single_flight()
     
     @abstractmethod
     def get_default_model(self) -> str:
@@ -46,6 +71,22 @@ class BaseLLM(ABC):
         """
         pass
     
+    async def ainvoke(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        """
+        异步调用LLM生成回复
+        
+        默认实现在线程池中执行同步 invoke，子类应基于异步客户端覆盖此方法
+        
+        Args:
+            system_prompt: 系统提示词
+            user_prompt: 用户输入
+            **kwargs: 其他参数
+            
+        Returns:
+            生成的回复文本
+        """
+        return await asyncio.to_thread(self.invoke, system_prompt, user_prompt, **kwargs)
+    
     def generate(self, prompt: str, temperature: float = 0.7, 
                  max_tokens: int = 4000, **kwargs) -> str:
         """
@@ -66,6 +107,25 @@ class BaseLLM(ABC):
                           temperature=temperature, 
                           max_tokens=max_tokens)
     
+    async def agenerate(self, prompt: str, temperature: float = 0.7,
+                        max_tokens: int = 4000, **kwargs) -> str:
+        """
+        异步生成文本
+        
+        Args:
+            prompt: 输入提示
+            temperature: 温度参数 (0-1)
+            max_tokens: 最大生成token数
+            **kwargs: 其他参数
+            
+        Returns:
+            生成的文本
+        """
+        system_prompt = kwargs.get("system_prompt", "You are a helpful assistant.")
+        return await self.ainvoke(system_prompt, prompt,
+                                  temperature=temperature,
+                                  max_tokens=max_tokens)
+    
     def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], 
                            temperature: float = 0.3, **kwargs) -> Dict[str, Any]:
         """
@@ -140,6 +200,372 @@ class BaseLLM(ABC):
         
         return response
     
+    def set_cache(self, cache) -> None:
+        """
+        设置响应缓存
+        
+        Args:
+            cache: LLMResponseCache 实例，None 表示关闭缓存
+        """
+        self.cache = cache
+    
+    def set_single_flight(self, single_flight) -> None:
+        """
+        设置请求合并器
+        
+        Args:
+            single_flight: SingleFlight 实例，None 表示关闭请求合并
+        """
+        self.single_flight = single_flight
+    
+    def _flight_key(self, key: str) -> str:
+        """
+        请求合并的键：请求键前加上服务地址与 API Key 指纹，
+        不同服务商 / 账号的相同请求不会合并到同一个结果上
+        """
+        base_url = getattr(self, "base_url", None) or ""
+        digest = hashlib.sha256((self.api_key or "").encode("utf-8")).hexdigest()[:16]
+        return f"{base_url}|{digest}|{key}"
+    
+    def bind(self, **defaults) -> "BoundLLM":
+        """
+        绑定默认调用参数，返回可直接注入节点的适配器
+        
+        使用方式:
+            writer_llm = llm.bind(temperature=0.7, max_tokens=4000)
+            writer_llm.invoke(messages, node="write")  # 调用方显式传入的参数优先
+        
+        Args:
+            **defaults: 默认参数，如 temperature、max_tokens
+            
+        Returns:
+            BoundLLM 适配器
+        """
+        return BoundLLM(self, **defaults)
+    
+    def _execute(self, params: Dict[str, Any], send: Callable[[Dict[str, Any]], str],
+                 node: Optional[str] = None, section: Optional[str] = None,
+                 cache_validate: Optional[CacheValidator] = None) -> str:
+        """
+        统一请求管线（同步）：缓存查询 → 合并相同的进行中请求 → 对冲 → 限流发送 → 写入缓存
+        
+        开启用量统计时（见 usage.track_usage），每次调用都会记录 token 与延迟；
+        配置了 cassette 时（见 cassette.configure_cassette），实际发送会被录制或由录制结果回放
+        
+        Args:
+            params: 请求参数
+            send: 实际发送请求并返回文本的函数，应通过 usage.report_usage 上报 response.usage
+            node: 调用方节点名，用于按节点启用缓存与用量统计
+            section: 调用方所属段落标题，用于用量统计
+            cache_validate: 回复校验函数，只有非空且通过校验的回复才写入缓存（如 JSON 能否解析），
+                            None 时只要求非空
+            
+        Returns:
+            生成的回复文本
+        """
+        send = self._with_cassette(send)
+        record = begin_call(params, node, section)
+        try:
+            content = self._execute_cached(params, send, node, record, cache_validate)
+        except BaseException as e:
+            end_call(record, e)
+            raise
+        end_call(record)
+        return content
+    
+    def _execute_cached(self, params: Dict[str, Any], send: Callable[[Dict[str, Any]], str],
+                        node: Optional[str], record, cache_validate: Optional[CacheValidator] = None) -> str:
+        key = request_key(params)
+        cache = self.cache if self.cache is not None and self.cache.enabled_for(node) else None
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                if record is not None:
+                    record.source = "cache"
+                return cached
+        
+        def produce() -> str:
+            if record is not None:
+                record.source = "api"
+            with recording(record):
+                content = self._send_hedged(params, send, node)
+            if cache is not None and _cacheable(content, cache_validate):
+                cache.set(key, content)
+            return content
+        
+        if self.single_flight is None:
+            return produce()
+        if record is not None:
+            record.source = "coalesced"
+        return self.single_flight.do(self._flight_key(key), produce)
+    
+    async def _aexecute(self, params: Dict[str, Any],
+                        send: Callable[[Dict[str, Any]], Awaitable[str]],
+                        node: Optional[str] = None, section: Optional[str] = None,
+                        cache_validate: Optional[CacheValidator] = None) -> str:
+        """
+        统一请求管线（异步），流程同 _execute；缓存读写（SQLite）在线程池中执行，不阻塞事件循环
+        """
+        send = self._awith_cassette(send)
+        record = begin_call(params, node, section)
+        try:
+            content = await self._aexecute_cached(params, send, node, record, cache_validate)
+        except BaseException as e:
+            end_call(record, e)
+            raise
+        end_call(record)
+        return content
+    
+    async def _aexecute_cached(self, params: Dict[str, Any],
+                               send: Callable[[Dict[str, Any]], Awaitable[str]],
+                               node: Optional[str], record,
+                               cache_validate: Optional[CacheValidator] = None) -> str:
+        key = request_key(params)
+        cache = self.cache if self.cache is not None and self.cache.enabled_for(node) else None
+        if cache is not None:
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                if record is not None:
+                    record.source = "cache"
+                return cached
+        
+        async def produce() -> str:
+            if record is not None:
+                record.source = "api"
+            with recording(record):
+                content = await self._asend_hedged(params, send, node)
+            if cache is not None and _cacheable(content, cache_validate):
+                await asyncio.to_thread(cache.set, key, content)
+            return content
+        
+        if self.single_flight is None:
+            return await produce()
+        if record is not None:
+            record.source = "coalesced"
+        return await self.single_flight.ado(self._flight_key(key), produce)
+    
+    # =========================================================
+    # 录制 / 回放：包装最内层的实际发送函数，限流照常生效，对冲关闭（见 _get_hedger）
+    # =========================================================
+    def _with_cassette(self, send: Callable[[Dict[str, Any]], str]) -> Callable[[Dict[str, Any]], str]:
+        cassette = get_cassette()
+        if cassette is None:
+            return send
+        return lambda params: cassette.call(
+            "llm", request_key(params), lambda: send(params), llm_request_meta(params)
+        )
+    
+    def _awith_cassette(self, send: Callable[[Dict[str, Any]], Awaitable[str]]
+                        ) -> Callable[[Dict[str, Any]], Awaitable[str]]:
+        cassette = get_cassette()
+        if cassette is None:
+            return send
+        return lambda params: cassette.acall(
+            "llm", request_key(params), lambda: send(params), llm_request_meta(params)
+        )
+    
+    def _stream_with_cassette(self, send_stream: Callable[[Dict[str, Any]], Iterator[Any]]
+                              ) -> Callable[[Dict[str, Any]], Iterator[Any]]:
+        cassette = get_cassette()
+        if cassette is None:
+            return send_stream
+        return lambda params: cassette.stream(
+            "llm", request_key(params), lambda: send_stream(params), llm_request_meta(params)
+        )
+    
+    def _astream_with_cassette(self, send_stream: Callable[[Dict[str, Any]], AsyncIterator[Any]]
+                               ) -> Callable[[Dict[str, Any]], AsyncIterator[Any]]:
+        cassette = get_cassette()
+        if cassette is None:
+            return send_stream
+        return lambda params: cassette.astream(
+            "llm", request_key(params), lambda: send_stream(params), llm_request_meta(params)
+        )
+    
+    def _send_hedged(self, params: Dict[str, Any], send: Callable[[Dict[str, Any]], str],
+                     node: Optional[str]) -> str:
+        """
+        发送请求，启用对冲时慢请求会补发一次
+        
+        对冲在限流器内部：主请求排队拿到名额后才开始计时，对冲延迟与延迟样本只包含实际发送耗时；
+        补发的请求需要立即拿到自己的名额，限流器冷却（429 退避）或名额不足时不补发；
+        主请求与补发请求各自持有名额直到请求真正结束（对冲获胜后落后的主请求仍占用并发名额）
+        """
+        hedger = self._get_hedger(node)
+        if hedger is None:
+            return self._send_limited(params, send)
+        key = (params.get("model"), node)
+        limiter = self._get_rate_limiter()
+        if limiter is None:
+            return hedger.call(key, lambda: send(params))
+        from .rate_limiter import estimate_request_tokens
+        tokens = estimate_request_tokens(params)
+        run = lambda: limiter.run_acquired(lambda: send(params), tokens)
+        return limiter.retry(lambda: hedger.call(
+            key, run, hedge_fn=run, admit=lambda: limiter.try_acquire(tokens),
+        ), tokens)
+    
+    async def _asend_hedged(self, params: Dict[str, Any],
+                            send: Callable[[Dict[str, Any]], Awaitable[str]],
+                            node: Optional[str]) -> str:
+        """异步发送请求，启用对冲时慢请求会补发一次并取消落后的请求，限流方式同 _send_hedged"""
+        hedger = self._get_hedger(node)
+        if hedger is None:
+            return await self._asend_limited(params, send)
+        key = (params.get("model"), node)
+        limiter = self._get_rate_limiter()
+        if limiter is None:
+            return await hedger.acall(key, lambda: send(params))
+        from .rate_limiter import estimate_request_tokens
+        tokens = estimate_request_tokens(params)
+        return await limiter.acall(lambda: hedger.acall(
+            key, lambda: send(params),
+            hedge_fn=lambda: limiter.arun_acquired(lambda: send(params), tokens),
+            admit=lambda: limiter.try_acquire(tokens),
+        ), tokens)
+    
+    def _get_hedger(self, node: Optional[str]):
+        """
+        获取对节点生效的对冲器，未配置或节点未启用时为 None
+        
+        配置了 cassette 时不对冲：补发的请求会重复录制同一请求键，回放时多消耗一条录制记录并重复上报用量
+        """
+        hedger = get_hedger()
+        if hedger is None or not hedger.enabled_for(node) or get_cassette() is not None:
+            return None
+        return hedger
+    
+    def _get_rate_limiter(self):
+        """获取进程级限流器（未配置时为 None）"""
+        from .rate_limiter import get_rate_limiter
+        return get_rate_limiter()
+    
+    def _send_limited(self, params: Dict[str, Any], send: Callable[[Dict[str, Any]], str]) -> str:
+        """经过全局限流器发送请求"""
+        limiter = self._get_rate_limiter()
+        if limiter is None:
+            return send(params)
+        from .rate_limiter import estimate_request_tokens
+        return limiter.call(lambda: send(params), estimate_request_tokens(params))
+    
+    async def _asend_limited(self, params: Dict[str, Any],
+                             send: Callable[[Dict[str, Any]], Awaitable[str]]) -> str:
+        """经过全局限流器发送异步请求"""
+        limiter = self._get_rate_limiter()
+        if limiter is None:
+            return await send(params)
+        from .rate_limiter import estimate_request_tokens
+        return await limiter.acall(lambda: send(params), estimate_request_tokens(params))
+    
+    def _stream_limited(self, params: Dict[str, Any],
+                        send_stream: Callable[[Dict[str, Any]], Iterator[str]]) -> Iterator[str]:
+        """经过全局限流器发送流式请求"""
+        limiter = self._get_rate_limiter()
+        if limiter is None:
+            return send_stream(params)
+        from .rate_limiter import estimate_request_tokens
+        return limiter.stream(lambda: send_stream(params), estimate_request_tokens(params))
+    
+    def _astream_limited(self, params: Dict[str, Any],
+                         send_stream: Callable[[Dict[str, Any]], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """经过全局限流器发送异步流式请求"""
+        limiter = self._get_rate_limiter()
+        if limiter is None:
+            return send_stream(params)
+        from .rate_limiter import estimate_request_tokens
+        return limiter.astream(lambda: send_stream(params), estimate_request_tokens(params))
+    
+    def _execute_stream(self, params: Dict[str, Any],
+                        send_stream: Callable[[Dict[str, Any]], Iterator[Any]],
+                        node: Optional[str] = None, section: Optional[str] = None) -> Iterator[str]:
+        """
+        流式请求管线（同步）：命中缓存时一次性产出完整文本，否则逐段产出并在结束后写入缓存
+        
+        Args:
+            params: 请求参数
+            send_stream: 实际发送流式请求的函数，逐段产出文本；
+                         产出的非字符串元素视为 response.usage，计入用量统计而不转发
+            node: 调用方节点名
+            section: 调用方所属段落标题，用于用量统计
+            
+        Yields:
+            文本增量
+        """
+        send_stream = self._stream_with_cassette(send_stream)
+        record = begin_call(params, node, section)
+        try:
+            cache = self.cache if self.cache is not None and self.cache.enabled_for(node) else None
+            key = request_key(params)
+            if cache is not None:
+                cached = cache.get(key)
+                if cached is not None:
+                    if record is not None:
+                        record.source = "cache"
+                    yield cached
+                    end_call(record)
+                    return
+            
+            chunks = []
+            for delta in self._stream_limited(params, send_stream):
+                if not isinstance(delta, str):
+                    add_usage(record, delta)
+                    continue
+                mark_first_token(record)
+                chunks.append(delta)
+                yield delta
+            
+            if cache is not None and _cacheable("".join(chunks)):
+                cache.set(key, "".join(chunks))
+        except GeneratorExit:
+            # 调用方提前结束迭代，不算失败
+            end_call(record)
+            raise
+        except BaseException as e:
+            end_call(record, e)
+            raise
+        end_call(record)
+    
+    async def _aexecute_stream(self, params: Dict[str, Any],
+                               send_stream: Callable[[Dict[str, Any]], AsyncIterator[Any]],
+                               node: Optional[str] = None,
+                               section: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        流式请求管线（异步），流程同 _execute_stream
+        """
+        send_stream = self._astream_with_cassette(send_stream)
+        record = begin_call(params, node, section)
+        try:
+            cache = self.cache if self.cache is not None and self.cache.enabled_for(node) else None
+            key = request_key(params)
+            if cache is not None:
+                cached = await asyncio.to_thread(cache.get, key)
+                if cached is not None:
+                    if record is not None:
+                        record.source = "cache"
+                    yield cached
+                    end_call(record)
+                    return
+            
+            chunks = []
+            async for delta in self._astream_limited(params, send_stream):
+                if not isinstance(delta, str):
+                    add_usage(record, delta)
+                    continue
+                mark_first_token(record)
+                chunks.append(delta)
+                yield delta
+            
+            if cache is not None and _cacheable("".join(chunks)):
+                await asyncio.to_thread(cache.set, key, "".join(chunks))
+        except GeneratorExit:
+            # 调用方提前结束迭代，不算失败
+            end_call(record)
+            raise
+        except BaseException as e:
+            end_call(record, e)
+            raise
+        end_call(record)
+    
     def __str__(self) -> str:
         """字符串表示"""
         info = self.get_model_info()
@@ -150,6 +576,32 @@ class BaseLLM(ABC):
         return f"<{self.__class__.__name__} model={self.model_name}>"
 
 
+class BoundLLM:
+    """
+    绑定了默认参数的 LLM 适配器
+    
+    invoke / ainvoke / stream / astream 调用时合并默认参数，其余属性透传给底层 LLM
+    """
+    
+    _BOUND_METHODS = ("invoke", "ainvoke", "stream", "astream")
+    
+    def __init__(self, llm: BaseLLM, **defaults):
+        self.llm = llm
+        self.defaults = {k: v for k, v in defaults.items() if v is not None}
+    
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.llm, name)
+        if name not in self._BOUND_METHODS:
+            return attr
+        
+        def bound(*args, **kwargs):
+            return attr(*args, **{**self.defaults, **kwargs})
+        return bound
+    
+    def __repr__(self) -> str:
+        return f"<BoundLLM {self.llm!r} defaults={self.defaults}>"
+
+
 class LLMError(Exception):
     """LLM相关错误的基类"""
     pass
@@ -0,0 +1,245 @@
+"""
+LLM 响应缓存
+基于 SQLite 的内容寻址缓存，支持多进程共享、TTL 与容量淘汰
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Any, List, Iterable
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """归一化消息：只保留 role/content，统一换行并去掉首尾空白"""
+    normalized = []
+    for msg in messages:
+        content = msg.get("content") or ""
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False, sort_keys=True)
+        content = content.replace("\r\n", "\n").strip()
+        normalized.append({"role": msg.get("role", "user"), "content": content})
+    return normalized
+
+
+def request_key(params: Dict[str, Any]) -> str:
+    """
+    计算请求的内容寻址键，缓存与请求合并共用
+
+    Args:
+        params: chat.completions.create 的请求参数
+
+    Returns:
+        sha256 十六进制字符串
+    """
+    payload = {
+        "model": params.get("model"),
+        "messages": normalize_messages(params.get("messages", [])),
+        "temperature": params.get("temperature"),
+        "max_tokens": params.get("max_tokens"),
+        "response_format": params.get("response_format"),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    LLM 响应缓存
+
+    缓存键为 模型 + 归一化消息 + temperature + max_tokens + response_format 的哈希，
+    数据存放在 SQLite (WAL 模式) 中，多个 worker 进程可共享同一个文件。
+
+    使用方式:
+        cache = LLMResponseCache(".cache/llm_responses.sqlite", nodes=["structure", "search"])
+        llm.set_cache(cache)
+    """
+
+    def __init__(self, path: str = ".cache/llm_responses.sqlite",
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 max_entries: int = 5000,
+                 max_bytes: int = 200 * 1024 * 1024,
+                 nodes: Optional[Iterable[str]] = None):
+        """
+        初始化缓存
+
+        Args:
+            path: SQLite 文件路径
+            ttl_seconds: 条目有效期（秒），None 表示永不过期
+            max_entries: 最大条目数，超出后按最近访问时间淘汰
+            max_bytes: 最大存储字节数，超出后按最近访问时间淘汰
+            nodes: 启用缓存的节点名列表，None 表示所有节点都启用
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nodes = set(nodes) if nodes is not None else None
+
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程独立的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # =========================================================
+    # 缓存键
+    # =========================================================
+    @staticmethod
+    def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """归一化消息：只保留 role/content，统一换行并去掉首尾空白"""
+        return normalize_messages(messages)
+
+    @staticmethod
+    def make_key(params: Dict[str, Any]) -> str:
+        """计算请求的缓存键，见 request_key"""
+        return request_key(params)
+
+    def enabled_for(self, node: Optional[str]) -> bool:
+        """检查某个节点是否启用缓存"""
+        if self.nodes is None:
+            return True
+        return node in self.nodes
+
+    # =========================================================
+    # 读写
+    # =========================================================
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存，过期条目视为未命中并删除
+
+        Returns:
+            缓存的响应文本，未命中返回 None
+        """
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.commit()
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        """写入缓存"""
+        if value is None:
+            return
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value.encode("utf-8")), now, now)
+        )
+        conn.commit()
+
+        with self._lock:
+            self._writes_since_evict += 1
+            should_evict = self._writes_since_evict >= 50
+            if should_evict:
+                self._writes_since_evict = 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        执行淘汰：先删除过期条目，再按最近访问时间删除超出容量的条目
+
+        Returns:
+            删除的条目数
+        """
+        conn = self._conn()
+        removed = 0
+
+        if self.ttl_seconds is not None:
+            cur = conn.execute(
+                "DELETE FROM responses WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,)
+            )
+            removed += cur.rowcount
+
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+        if count > self.max_entries or total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+            ).fetchall()
+            stale = []
+            for key, size in rows:
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                count -= 1
+                total -= size
+            conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+            removed += len(stale)
+
+        conn.commit()
+        return removed
+
+    def clear(self) -> None:
+        """清空缓存"""
+        conn = self._conn()
+        conn.execute("DELETE FROM responses")
+        conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            包含 hits、misses、hit_rate、entries、bytes 的字典
+        """
+        count, total = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+        }
@@ -0,0 +1,393 @@
+"""
+请求录制 / 回放 (cassette)
+录制一次真实运行中的 LLM 与 LightRAG 请求-响应对，之后离线、确定性地回放，
+可按录制延迟或指定分布注入延迟，用于回归测试与性能分析
+"""
+
+import os
+import gzip
+import json
+import time
+import random
+import asyncio
+import atexit
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Iterator, AsyncIterator, Union, TypeVar
+
+from .usage import capture_usage, report_usage
+
+T = TypeVar("T")
+
+# 延迟模型: None 不注入 / "recorded" 按录制延迟 / 固定秒数 / callable(entry) -> 秒数
+LatencyModel = Union[None, str, float, Callable[[Dict[str, Any]], float]]
+
+# 回放流式响应时每段的字符数
+STREAM_CHUNK_CHARS = 16
+
+
+class CassetteMissError(KeyError):
+    """回放模式下找不到对应的录制条目"""
+    pass
+
+
+def lognormal_latency(median: float, sigma: float = 0.5, seed: Optional[int] = None) -> Callable[[Dict[str, Any]], float]:
+    """
+    对数正态延迟分布（长尾，接近真实 API 延迟）
+
+    Args:
+        median: 延迟中位数（秒）
+        sigma: 对数标准差，越大尾部越长
+        seed: 随机种子，固定后每次回放的延迟序列相同
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def sample(entry: Dict[str, Any]) -> float:
+        with lock:
+            return median * rng.lognormvariate(0.0, sigma)
+
+    return sample
+
+
+class Cassette:
+    """
+    请求录制 / 回放
+
+    - record: 请求照常发出，每个请求-响应对追加写入 JSONL 文件（.gz 结尾时 gzip 压缩）
+    - replay: 不发出请求，按请求键返回录制的响应；同一键录制了多次时按顺序返回，用完后重复最后一次
+
+    条目只保存请求键、响应、延迟、usage 与少量便于排查的请求摘要，不保存完整 prompt。
+
+    使用方式:
+        configure_cassette("tests/cassettes/report.jsonl.gz", mode="record")
+        ...  # 真实运行一次
+        configure_cassette("tests/cassettes/report.jsonl.gz", mode="replay",
+                           latency=lognormal_latency(2.0, seed=0))
+        ...  # 离线回放
+    """
+
+    MODES = ("record", "replay")
+
+    def __init__(self, path: str, mode: str = "replay",
+                 latency: Union[LatencyModel, Dict[str, LatencyModel]] = None,
+                 latency_scale: float = 1.0,
+                 strict: bool = True,
+                 append: bool = False):
+        """
+        初始化 cassette
+
+        Args:
+            path: cassette 文件路径
+            mode: "record" 或 "replay"
+            latency: 回放时注入的延迟模型，也可按类型指定，如 {"llm": "recorded", "lightrag": 0.05}
+            latency_scale: 延迟缩放系数，如 0.1 表示按 10 倍速回放
+            strict: 回放时找不到条目是否报错；False 时改为发出真实请求
+            append: 录制时追加到已有文件，False 时覆盖
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"未知的 cassette 模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.strict = strict
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._file = None
+
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+        if mode == "replay":
+            self._load()
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = self._open("at" if append else "wt")
+            atexit.register(self.close)
+
+    # =========================================================
+    # 文件读写
+    # =========================================================
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode, encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def _load(self) -> None:
+        with self._open("rt") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                self._entries.setdefault(entry["key"], []).append(entry)
+        total = sum(len(entries) for entries in self._entries.values())
+        print(f"  📼 [Cassette] 已加载 {total} 条录制记录: {self.path}")
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+    def close(self) -> None:
+        """关闭录制文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # =========================================================
+    # 请求键与条目
+    # =========================================================
+    @staticmethod
+    def make_key(kind: str, *parts: Any) -> str:
+        """计算请求键：类型 + 请求内容的哈希"""
+        raw = json.dumps([kind, *parts], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _lookup(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """按顺序取出录制条目，找不到时按 strict 报错或返回 None"""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                if self.strict:
+                    raise CassetteMissError(f"cassette 中没有 {kind} 请求 {key[:12]}")
+                return None
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+            self.replayed += 1
+            return entries[min(index, len(entries) - 1)]
+
+    def _record(self, kind: str, key: str, response: Any, latency: float,
+                usages: List[Any], meta: Optional[Dict[str, Any]], ttft: Optional[float] = None) -> None:
+        entry = {
+            "kind": kind,
+            "key": key,
+            "meta": meta or {},
+            "response": response,
+            "latency": round(latency, 3),
+        }
+        if ttft is not None:
+            entry["ttft"] = round(ttft, 3)
+        if usages:
+            entry["usage"] = {
+                "prompt_tokens": sum(getattr(u, "prompt_tokens", 0) or 0 for u in usages),
+                "completion_tokens": sum(getattr(u, "completion_tokens", 0) or 0 for u in usages),
+            }
+        self._write(entry)
+
+    def delay_for(self, entry: Dict[str, Any]) -> float:
+        """计算回放某个条目时注入的延迟（秒）"""
+        model = self.latency
+        if isinstance(model, dict):
+            model = model.get(entry["kind"])
+        if model is None:
+            return 0.0
+        if model == "recorded":
+            delay = entry.get("latency", 0.0)
+        elif callable(model):
+            delay = model(entry)
+        else:
+            delay = float(model)
+        return max(0.0, delay * self.latency_scale)
+
+    @staticmethod
+    def _usage(entry: Dict[str, Any]) -> Optional[SimpleNamespace]:
+        usage = entry.get("usage")
+        return SimpleNamespace(**usage) if usage else None
+
+    # =========================================================
+    # 调用包装
+    # =========================================================
+    def call(self, kind: str, key: str, fn: Callable[[], T], meta: Optional[Dict[str, Any]] = None) -> T:
+        """
+        录制或回放一次同步请求
+
+        Args:
+            kind: 请求类型，如 "llm"、"lightrag"
+            key: 请求键
+            fn: 发出真实请求的函数，返回值需可 JSON 序列化
+            meta: 写入条目的请求摘要
+        """
+        if self.replaying:
+            entry = self._lookup(kind, key)
+            if entry is not None:
+                time.sleep(self.delay_for(entry))
+                report_usage(self._usage(entry))
+                return entry["response"]
+            return fn()
+
+        start = time.monotonic()
+        with capture_usage() as usages:
+            result = fn()
+        self._record(kind, key, result, time.monotonic() - start, usages, meta)
+        return result
+
+    async def acall(self, kind: str, key: str, fn: Callable[[], Awaitable[T]],
+                    meta: Optional[Dict[str, Any]] = None) -> T:
+        """录制或回放一次异步请求，参数同 call"""
+        if self.replaying:
+            entry = self._lookup(kind, key)
+            if entry is not None:
+                await asyncio.sleep(self.delay_for(entry))
+                report_usage(self._usage(entry))
+                return entry["response"]
+            return await fn()
+
+        start = time.monotonic()
+        with capture_usage() as usages:
+            result = await fn()
+        self._record(kind, key, result, time.monotonic() - start, usages, meta)
+        return result
+
+    def _split(self, entry: Dict[str, Any]):
+        """回放流式响应：首段等待 ttft，其余延迟均摊到后续各段"""
+        text = entry.get("response") or ""
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        total = self.delay_for(entry)
+        latency = entry.get("latency") or 0.0
+        ttft = entry.get("ttft")
+        first = total * (ttft / latency) if ttft is not None and latency > 0 else 0.0
+        rest = (total - first) / max(1, len(chunks) - 1)
+        return chunks, first, rest
+
+    def stream(self, kind: str, key: str, fn: Callable[[], Iterator[Any]],
+               meta: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """
+        录制或回放一次同步流式请求
+
+        fn 逐段产出文本，非字符串元素视为 usage；回放时同样在最后产出 usage
+        """
+        if self.replaying:
+            entry = self._lookup(kind, key)
+            if entry is None:
+                yield from fn()
+                return
+            chunks, first, rest = self._split(entry)
+            for i, chunk in enumerate(chunks):
+                time.sleep(first if i == 0 else rest)
+                yield chunk
+            usage = self._usage(entry)
+            if usage is not None:
+                yield usage
+            return
+
+        start = time.monotonic()
+        ttft = None
+        parts, usages = [], []
+        for item in fn():
+            if isinstance(item, str):
+                if ttft is None:
+                    ttft = time.monotonic() - start
+                parts.append(item)
+            else:
+                usages.append(item)
+            yield item
+        self._record(kind, key, "".join(parts), time.monotonic() - start, usages, meta, ttft)
+
+    async def astream(self, kind: str, key: str, fn: Callable[[], AsyncIterator[Any]],
+                      meta: Optional[Dict[str, Any]] = None) -> AsyncIterator[Any]:
+        """录制或回放一次异步流式请求，参数同 stream"""
+        if self.replaying:
+            entry = self._lookup(kind, key)
+            if entry is None:
+                async for item in fn():
+                    yield item
+                return
+            chunks, first, rest = self._split(entry)
+            for i, chunk in enumerate(chunks):
+                await asyncio.sleep(first if i == 0 else rest)
+                yield chunk
+            usage = self._usage(entry)
+            if usage is not None:
+                yield usage
+            return
+
+        start = time.monotonic()
+        ttft = None
+        parts, usages = [], []
+        async for item in fn():
+            if isinstance(item, str):
+                if ttft is None:
+                    ttft = time.monotonic() - start
+                parts.append(item)
+            else:
+                usages.append(item)
+            yield item
+        self._record(kind, key, "".join(parts), time.monotonic() - start, usages, meta, ttft)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取录制 / 回放统计
+
+        Returns:
+            mode、recorded（录制条数）、replayed（回放次数）、misses（未命中次数）
+        """
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "misses": self.misses,
+            }
+
+
+def llm_request_meta(params: Dict[str, Any]) -> Dict[str, Any]:
+    """LLM 请求摘要：模型与最后一条消息的开头，便于人工排查 cassette"""
+    messages = params.get("messages") or []
+    last = messages[-1].get("content") if messages else ""
+    if not isinstance(last, str):
+        last = json.dumps(last, ensure_ascii=False)
+    return {"model": params.get("model"), "prompt": last[:80]}
+
+
+# ==========================================
+# 进程级单例
+# ==========================================
+
+_cassette: Optional[Cassette] = None
+
+
+def configure_cassette(path: str, mode: str = "replay", **kwargs) -> Cassette:
+    """
+    配置进程级 cassette，参数同 Cassette；已有录制中的 cassette 会先关闭
+
+    Returns:
+        新的全局 cassette
+    """
+    global _cassette
+    if _cassette is not None:
+        _cassette.close()
+    _cassette = Cassette(path, mode=mode, **kwargs)
+    print(f"  📼 [Cassette] {mode} 模式: {path}")
+    return _cassette
+
+
+def get_cassette() -> Optional[Cassette]:
+    """获取进程级 cassette，未配置时返回 None"""
+    return _cassette
+
+
+def disable_cassette() -> None:
+    """关闭进程级 cassette"""
+    global _cassette
+    if _cassette is not None:
+        _cassette.close()
+    _cassette = None
@@ -0,0 +1,281 @@
+"""
+LLM 客户端注册表
+按 base_url / API Key 复用 OpenAI 兼容客户端，同一服务商共享一个连接池
+"""
+
+import asyncio
+import hashlib
+import threading
+import weakref
+from typing import Optional, Dict, Any, Tuple
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from .rate_limiter import get_rate_limiter
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# 未配置全局限流器时 SDK 内置重试的次数（与 openai SDK 默认值一致）
+SDK_MAX_RETRIES = 2
+
+
+def _sdk_max_retries() -> int:
+    """配置了全局限流器时由限流器负责重试（429 退避、瞬时错误重试），SDK 不再重试；否则保留 SDK 内置重试"""
+    return 0 if get_rate_limiter() is not None else SDK_MAX_RETRIES
+
+
+class ClientRegistry:
+    """
+    客户端注册表
+
+    - 每个 base_url 一个 httpx 连接池（长连接 keep-alive，可选 HTTP/2）
+    - 每个 (base_url, API Key) 一个 OpenAI 客户端，共享所属 base_url 的连接池
+    - 异步连接池绑定事件循环，按事件循环分别维护
+    - warm_up / awarm_up 预先建立连接，避免首个请求承担握手延迟
+    - 配置了全局限流器时客户端关闭 SDK 内置重试 (max_retries=0)：429 与瞬时错误交给限流器重试，
+      AIMD 才能感知限流；未配置时保留 SDK 内置重试
+    """
+
+    def __init__(self, max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0,
+                 http2: bool = False,
+                 connect_timeout: float = 10.0,
+                 read_timeout: float = 120.0,
+                 warm_up_connections: int = 2):
+        """
+        初始化注册表
+
+        Args:
+            max_connections: 每个服务商连接池的最大连接数
+            max_keepalive_connections: 最大空闲长连接数
+            keepalive_expiry: 空闲连接保活时间（秒）
+            http2: 是否启用 HTTP/2（需要安装 h2）
+            connect_timeout: 建连超时（秒）
+            read_timeout: 读取超时（秒）
+            warm_up_connections: 预热时每个服务商建立的连接数
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and self._http2_available()
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.warm_up_connections = warm_up_connections
+
+        self._lock = threading.Lock()
+        self._http_clients: Dict[str, httpx.Client] = {}
+        self._clients: Dict[Tuple[str, str, int], OpenAI] = {}
+        # 事件循环 -> {base_url: AsyncClient} / {(base_url, key): AsyncOpenAI}
+        self._async_http_clients = weakref.WeakKeyDictionary()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _http2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            print("⚠️ 未安装 h2，HTTP/2 已回退为 HTTP/1.1 (pip install httpx[http2])")
+            return False
+
+    @staticmethod
+    def _key(api_key: str, base_url: str) -> Tuple[str, str]:
+        digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return base_url, digest
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    # =========================================================
+    # 客户端获取
+    # =========================================================
+    def get_client(self, api_key: str, base_url: Optional[str] = None) -> OpenAI:
+        """
+        获取共享的同步客户端
+
+        Args:
+            api_key: API 密钥
+            base_url: 服务地址，None 表示 OpenAI 官方地址
+
+        Returns:
+            OpenAI 客户端
+        """
+        base_url = (base_url or OPENAI_BASE_URL).rstrip("/")
+        retries = _sdk_max_retries()
+        key = (*self._key(api_key, base_url), retries)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                http_client = self._http_clients.get(base_url)
+                if http_client is None:
+                    http_client = httpx.Client(
+                        limits=self._limits(), timeout=self._timeout(), http2=self.http2
+                    )
+                    self._http_clients[base_url] = http_client
+                client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                                max_retries=retries)
+                self._clients[key] = client
+            return client
+
+    def get_async_client(self, api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """
+        获取当前事件循环下共享的异步客户端
+
+        Args:
+            api_key: API 密钥
+            base_url: 服务地址，None 表示 OpenAI 官方地址
+
+        Returns:
+            AsyncOpenAI 客户端
+        """
+        base_url = (base_url or OPENAI_BASE_URL).rstrip("/")
+        retries = _sdk_max_retries()
+        key = (*self._key(api_key, base_url), retries)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                http_client = self._get_async_http_client(loop, base_url)
+                client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                                     max_retries=retries)
+                clients[key] = client
+            return client
+
+    def _get_async_http_client(self, loop, base_url: str) -> httpx.AsyncClient:
+        """获取事件循环下某个服务商的异步连接池（调用方需持有锁）"""
+        http_clients = self._async_http_clients.setdefault(loop, {})
+        http_client = http_clients.get(base_url)
+        if http_client is None:
+            http_client = httpx.AsyncClient(
+                limits=self._limits(), timeout=self._timeout(), http2=self.http2
+            )
+            http_clients[base_url] = http_client
+        return http_client
+
+    # =========================================================
+    # 预热
+    # =========================================================
+    def warm_up(self) -> int:
+        """
+        为所有已注册的服务商预先建立同步连接
+
+        Returns:
+            成功建立的连接数
+        """
+        with self._lock:
+            targets = list(self._http_clients.items())
+
+        def touch(http_client: httpx.Client, base_url: str) -> bool:
+            try:
+                http_client.head(base_url)
+                return True
+            except Exception as e:
+                print(f"  > [Warm-up] 预热失败 {base_url}: {e}")
+                return False
+
+        threads = []
+        results = []
+        for base_url, http_client in targets:
+            for _ in range(self.warm_up_connections):
+                t = threading.Thread(
+                    target=lambda c=http_client, u=base_url: results.append(touch(c, u)),
+                    daemon=True
+                )
+                t.start()
+                threads.append(t)
+        for t in threads:
+            t.join()
+        return sum(results)
+
+    async def awarm_up(self) -> int:
+        """
+        为当前事件循环预先建立到所有已注册服务商的异步连接
+
+        Returns:
+            成功建立的连接数
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            bases = {key[0] for key in self._clients}
+            bases |= {key[0] for key in self._async_clients.get(loop, {})}
+            http_clients = {base: self._get_async_http_client(loop, base) for base in bases}
+
+        async def touch(base_url: str, http_client: httpx.AsyncClient) -> bool:
+            try:
+                await http_client.head(base_url)
+                return True
+            except Exception as e:
+                print(f"  > [Warm-up] 预热失败 {base_url}: {e}")
+                return False
+
+        results = await asyncio.gather(*[
+            touch(base, http_client)
+            for base, http_client in http_clients.items()
+            for _ in range(self.warm_up_connections)
+        ])
+        return sum(results)
+
+    def close(self) -> None:
+        """关闭所有同步连接池"""
+        with self._lock:
+            for http_client in self._http_clients.values():
+                http_client.close()
+            self._http_clients.clear()
+            self._clients.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取注册表统计"""
+        with self._lock:
+            return {
+                "providers": sorted(self._http_clients),
+                "clients": len(self._clients),
+                "event_loops": len(self._async_clients),
+                "http2": self.http2,
+            }
+
+
+# ==========================================
+# 进程级单例
+# ==========================================
+
+_registry: Optional[ClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def configure_client_registry(**kwargs) -> ClientRegistry:
+    """
+    按给定参数重建进程级注册表，参数同 ClientRegistry
+
+    Returns:
+        新的全局注册表
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.close()
+        _registry = ClientRegistry(**kwargs)
+        return _registry
+
+
+def get_client_registry() -> ClientRegistry:
+    """获取进程级注册表，未配置时使用默认参数创建"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
+
+
+def has_client_registry() -> bool:
+    """进程级注册表是否已创建"""
+    return _registry is not None
@@ -0,0 +1,290 @@
+"""
+LLM 请求对冲 (hedged requests)
+调用超过近期延迟的某个分位数仍未返回时，补发一个相同请求，取先返回者并取消另一个
+"""
+
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import Optional, Dict, Any, Callable, Awaitable, TypeVar, Tuple, Iterable, Deque
+
+T = TypeVar("T")
+
+HedgeKey = Tuple[str, Optional[str]]  # (model, node)
+
+
+class Hedger:
+    """
+    请求对冲器
+
+    - 按 (模型, 节点) 维护最近 window 次调用的延迟，样本数达到 min_samples 后才启用对冲
+    - 对冲等待时间 = 近期延迟的 percentile 分位数，且不小于 min_delay
+    - 额外请求数不超过主请求数的 max_extra_ratio，限制额外开销
+    - 调用方可传入 admit 决定此刻能否补发（如限流器能否立即给出名额），返回 False 时不对冲
+    - 异步调用会取消落后的请求；同步调用无法中断阻塞中的 HTTP 请求，只丢弃其结果
+    - 同步调用的主请求与对冲请求各自在新线程中立即发出（不经线程池排队），对冲等待时间只包含服务端延迟
+    """
+
+    def __init__(self, percentile: float = 0.95,
+                 min_delay: float = 5.0,
+                 window: int = 50,
+                 min_samples: int = 8,
+                 max_extra_ratio: float = 0.1,
+                 nodes: Optional[Iterable[str]] = None):
+        """
+        初始化对冲器
+
+        Args:
+            percentile: 触发对冲的延迟分位数 (0-1)
+            min_delay: 最短等待时间（秒）
+            window: 每个 (模型, 节点) 保留的延迟样本数
+            min_samples: 启用对冲所需的最少样本数
+            max_extra_ratio: 对冲请求数占主请求数的上限
+            nodes: 启用对冲的节点名列表，None 表示所有节点都启用
+        """
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.max_extra_ratio = max_extra_ratio
+        self.nodes = set(nodes) if nodes is not None else None
+
+        self._lock = threading.Lock()
+        self._latencies: Dict[HedgeKey, Deque[float]] = {}
+
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+
+    def enabled_for(self, node: Optional[str]) -> bool:
+        """检查某个节点是否启用对冲"""
+        if self.nodes is None:
+            return True
+        return node in self.nodes
+
+    # =========================================================
+    # 延迟统计与预算
+    # =========================================================
+    def observe(self, key: HedgeKey, latency: float) -> None:
+        """记录一次调用延迟"""
+        with self._lock:
+            samples = self._latencies.get(key)
+            if samples is None:
+                samples = self._latencies[key] = deque(maxlen=self.window)
+            samples.append(latency)
+
+    def delay_for(self, key: HedgeKey) -> Optional[float]:
+        """
+        计算对冲等待时间
+
+        Returns:
+            等待秒数，样本不足时返回 None（不对冲）
+        """
+        with self._lock:
+            samples = self._latencies.get(key)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            return self._delay(samples)
+
+    def _delay(self, samples: Iterable[float]) -> float:
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return max(self.min_delay, ordered[index])
+
+    def _start_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def _try_fire(self, admit: Optional[Callable[[], bool]] = None) -> bool:
+        """在预算内登记一次对冲请求；admit 拒绝时不登记"""
+        with self._lock:
+            if self.fired + 1 > self.calls * self.max_extra_ratio:
+                return False
+        if admit is not None and not admit():
+            return False
+        with self._lock:
+            self.fired += 1
+        return True
+
+    def _record_win(self) -> None:
+        with self._lock:
+            self.won += 1
+
+    # =========================================================
+    # 调用包装
+    # =========================================================
+    async def acall(self, key: HedgeKey, fn: Callable[[], Awaitable[T]],
+                    hedge_fn: Optional[Callable[[], Awaitable[T]]] = None,
+                    admit: Optional[Callable[[], bool]] = None) -> T:
+        """
+        执行异步调用，超过对冲等待时间仍未返回时补发请求
+
+        Args:
+            key: (模型, 节点)
+            fn: 返回协程的函数，每次调用发起一次独立请求
+            hedge_fn: 补发时使用的函数，None 时同 fn
+            admit: 补发前调用，返回 False 时不补发（返回 True 后 hedge_fn 必定被调用）
+
+        Returns:
+            先成功返回的结果
+        """
+        self._start_call()
+        delay = self.delay_for(key)
+        start = time.monotonic()
+
+        if delay is None:
+            result = await fn()
+            self.observe(key, time.monotonic() - start)
+            return result
+
+        primary = asyncio.ensure_future(fn())
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._try_fire(admit):
+                result = await primary
+                self.observe(key, time.monotonic() - start)
+                return result
+
+            print(f"  > [Hedge] {key[1] or key[0]} 调用超过 {delay:.1f}s 未返回，补发对冲请求")
+            hedge = asyncio.ensure_future((hedge_fn or fn)())
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if task is hedge:
+                        self._record_win()
+                    # 主请求延迟至少是已等待的时间，用作样本避免低估分位数
+                    self.observe(key, time.monotonic() - start)
+                    return task.result()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def call(self, key: HedgeKey, fn: Callable[[], T], hedge_fn: Optional[Callable[[], T]] = None,
+             admit: Optional[Callable[[], bool]] = None) -> T:
+        """
+        执行同步调用，超过对冲等待时间仍未返回时在另一线程补发请求
+
+        落后的请求在后台线程中继续执行到结束，fn / hedge_fn 自行负责归还其占用的资源（如限流名额）
+
+        Args:
+            key: (模型, 节点)
+            fn: 发起一次独立请求的函数
+            hedge_fn: 补发时使用的函数，None 时同 fn
+            admit: 补发前调用，返回 False 时不补发（返回 True 后 hedge_fn 必定被调用）
+
+        Returns:
+            先成功返回的结果
+        """
+        self._start_call()
+        delay = self.delay_for(key)
+        start = time.monotonic()
+
+        if delay is None:
+            result = fn()
+            self.observe(key, time.monotonic() - start)
+            return result
+
+        primary = _spawn(fn)
+        done, _ = wait({primary}, timeout=delay)
+        if done or not self._try_fire(admit):
+            result = primary.result()
+            self.observe(key, time.monotonic() - start)
+            return result
+
+        print(f"  > [Hedge] {key[1] or key[0]} 调用超过 {delay:.1f}s 未返回，补发对冲请求")
+        hedge = _spawn(hedge_fn or fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                if future is hedge:
+                    self._record_win()
+                self.observe(key, time.monotonic() - start)
+                # 落后的请求无法中断，结果直接丢弃
+                return future.result()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取对冲统计
+
+        Returns:
+            calls: 经过对冲器的调用数
+            fired: 补发的对冲请求数
+            won: 对冲请求先于主请求返回的次数
+            fire_rate / win_rate: 对冲触发率 / 触发后获胜率
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "fired": self.fired,
+                "won": self.won,
+                "fire_rate": self.fired / self.calls if self.calls else 0.0,
+                "win_rate": self.won / self.fired if self.fired else 0.0,
+                "delays": {
+                    f"{model}/{node or '-'}": round(self._delay(samples), 2)
+                    for (model, node), samples in self._latencies.items()
+                    if len(samples) >= self.min_samples
+                },
+            }
+
+
+def _spawn(fn: Callable[[], T]) -> "Future[T]":
+    """在新线程中立即执行 fn（继承当前上下文），返回其 Future"""
+    future: Future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="llm-hedge", daemon=True).start()
+    return future
+
+
+# ==========================================
+# 进程级单例
+# ==========================================
+
+_hedger: Optional[Hedger] = None
+
+
+def configure_hedger(**kwargs) -> Hedger:
+    """
+    配置进程级对冲器，参数同 Hedger
+
+    Returns:
+        新的全局对冲器
+    """
+    global _hedger
+    _hedger = Hedger(**kwargs)
+    return _hedger
+
+
+def get_hedger() -> Optional[Hedger]:
+    """获取进程级对冲器，未配置时返回 None"""
+    return _hedger
+
+
+def disable_hedger() -> None:
+    """关闭进程级对冲器"""
+    global _hedger
+    _hedger = None
@@ -5,8 +5,10 @@ OpenAI LLM实现
 
 import os
 from typing import Optional, Dict, Any
-from openai import OpenAI
+from openai import AsyncOpenAI
 from .base import BaseLLM
+from .usage import report_usage
+from .client_registry import get_client_registry
 
 
 class OpenAILLM(BaseLLM):
@@ -27,14 +29,52 @@ class OpenAILLM(BaseLLM):
         
         super().__init__(api_key, model_name)
         
-        # 初始化OpenAI客户端
-        self.client = OpenAI(api_key=self.api_key)
+        # 初始化OpenAI客户端，连接池由注册表统一复用
+        self.base_url = None
+        self.client = get_client_registry().get_client(self.api_key)
         self.default_model = model_name or self.get_default_model()
     
     def get_default_model(self) -> str:
         """获取默认模型名称"""
         return "gpt-4o-mini"
     
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """当前事件循环下共享的异步客户端"""
+        return get_client_registry().get_async_client(self.api_key, self.base_url)
+    
+    def _build_params(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        """构建请求参数"""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        
+        return {
+            "model": self.default_model,
+            "messages": messages,
+            "temperature": kwargs.get("temperature", 0.7),
+            "max_tokens": kwargs.get("max_tokens", 4000)
+        }
+    
+    def _extract_content(self, response: Any) -> str:
+        """提取回复内容"""
+        if response.choices and response.choices[0].message:
+            return self.validate_response(response.choices[0].message.content)
+        return ""
+    
+    def _send(self, params: Dict[str, Any]) -> str:
+        """发送请求"""
+        response = self.client.chat.completions.create(**params)
+        report_usage(getattr(response, "usage", None))
+        return self._extract_content(response)
+    
+    async def _asend(self, params: Dict[str, Any]) -> str:
+        """异步发送请求"""
+        response = await self.async_client.chat.completions.create(**params)
+        report_usage(getattr(response, "usage", None))
+        return self._extract_content(response)
+    
     def invoke(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
         """
         调用OpenAI API生成回复
@@ -48,29 +88,30 @@ class OpenAILLM(BaseLLM):
             OpenAI生成的回复文本
         """
         try:
-            # 构建消息
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-            
-            # 设置默认参数
-            params = {
-                "model": self.default_model,
-                "messages": messages,
-                "temperature": kwargs.get("temperature", 0.7),
-                "max_tokens": kwargs.get("max_tokens", 4000)
-            }
-            
-            # 调用API
-            response = self.client.chat.completions.create(**params)
+            params = self._build_params(system_prompt, user_prompt, **kwargs)
+            return self._execute(params, self._send, node=kwargs.get("node"), section=kwargs.get("section"),
+                                 cache_validate=kwargs.get("cache_validate"))
+                
+        except Exception as e:
+            print(f"OpenAI API调用错误: {str(e)}")
+            raise e
+    
+    async def ainvoke(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        """
+        异步调用OpenAI API生成回复
+        
+        Args:
+            system_prompt: 系统提示词
+            user_prompt: 用户输入
+            **kwargs: 其他参数，如temperature、max_tokens等
             
-            # 提取回复内容
-            if response.choices and response.choices[0].message:
-                content = response.choices[0].message.content
-                return self.validate_response(content)
-            else:
-                return ""
+        Returns:
+            OpenAI生成的回复文本
+        """
+        try:
+            params = self._build_params(system_prompt, user_prompt, **kwargs)
+            return await self._aexecute(params, self._asend, node=kwargs.get("node"), section=kwargs.get("section"),
+                                        cache_validate=kwargs.get("cache_validate"))
                 
         except Exception as e:
             print(f"OpenAI API调用错误: {str(e)}")
@@ -4,9 +4,18 @@ Qwen LLM实现 - 兼容 LangChain 接口与工具调用
 
 import os
 import json
-from typing import Optional, Dict, Any, List, Union
-from openai import OpenAI
+from typing import Optional, Dict, Any, List, Union, Iterator, AsyncIterator
+from openai import AsyncOpenAI
 from .base import BaseLLM
+from .usage import report_usage
+from .client_registry import get_client_registry
+
+
+class SimpleAIMessage:
+    """伪造的 AIMessage 对象，以便调用者可以通过 .content 获取"""
+    def __init__(self, content): self.content = content
+    def __str__(self): return self.content
+
 
 class QwenLLM(BaseLLM):
     """Qwen LLM实现类 - 完整兼容版"""
@@ -31,11 +40,9 @@ class QwenLLM(BaseLLM):
         
         super().__init__(api_key, model_name)
 
-        # 初始化OpenAI客户端（Qwen兼容OpenAI接口）
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-        )
+        # 初始化OpenAI客户端（Qwen兼容OpenAI接口），连接池由注册表统一复用
+        self.base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+        self.client = get_client_registry().get_client(self.api_key, self.base_url)
         
         self.default_model = model_name or "qwen-plus"
         
@@ -54,6 +61,11 @@ class QwenLLM(BaseLLM):
         """获取默认模型名称"""
         return self.default_model
 
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """当前事件循环下共享的异步客户端"""
+        return get_client_registry().get_async_client(self.api_key, self.base_url)
+
     def get_model_info(self) -> Dict[str, Any]:
         """获取模型信息"""
         return {
@@ -70,11 +82,11 @@ class QwenLLM(BaseLLM):
     # =========================================================
     # 核心修复 2: 统一 invoke 接口 (兼容 LangChain)
     # =========================================================
-    def invoke(self, input_arg: Union[str, List[Any]], user_prompt: Optional[str] = None, **kwargs) -> Any:
+    def _build_request(self, input_arg: Union[str, List[Any]], user_prompt: Optional[str] = None, **kwargs) -> Dict[str, Any]:
         """
-        统一调用接口，智能兼容两种模式：
-        1. LangChain 风格: invoke(messages_list) -> 返回带 .content 的对象
-        2. 旧版风格: invoke(system_prompt, user_prompt) -> 返回字符串
+        根据调用模式构建请求参数
+        1. LangChain 风格: 传入消息列表
+        2. 旧版风格: 传入 System + User Prompt
         """
         # --- 模式 1: LangChain 风格 (传入消息列表) ---
         if isinstance(input_arg, list):
@@ -98,56 +110,137 @@ class QwenLLM(BaseLLM):
                 "messages": messages,
                 "temperature": kwargs.get("temperature", 0.7),
             }
+            if kwargs.get("max_tokens"):
+                params["max_tokens"] = kwargs["max_tokens"]
             
             # 支持 JSON Mode
             if kwargs.get("response_format", {}).get("type") == "json_object":
                 params["response_format"] = {"type": "json_object"}
-            
-            try:
-                response = self.client.chat.completions.create(**params)
-                content = response.choices[0].message.content
-                
-                # 返回一个伪造的 AIMessage 对象，以便调用者可以通过 .content 获取
-                class SimpleAIMessage:
-                    def __init__(self, content): self.content = content
-                    def __str__(self): return self.content
-                
-                return SimpleAIMessage(content)
-            except Exception as e:
-                print(f"Qwen Invoke Error: {e}")
-                raise e
+            return params
 
         # --- 模式 2: 旧版风格 (传入 System + User Prompt) ---
+        system_prompt = input_arg
+        # 如果 user_prompt 为空，说明可能只传了一个 str，当做 user prompt 处理
+        if user_prompt is None:
+            messages = [{"role": "user", "content": system_prompt}]
         else:
-            system_prompt = input_arg
-            # 如果 user_prompt 为空，说明可能只传了一个 str，当做 user prompt 处理
-            if user_prompt is None:
-                messages = [{"role": "user", "content": system_prompt}]
-            else:
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ]
-            
-            params = {
-                "model": self.default_model,
-                "messages": messages,
-                "temperature": kwargs.get("temperature", 0.6),
-                "max_tokens": kwargs.get("max_tokens", 8000),
-            }
-            
-            try:
-                response = self.client.chat.completions.create(**params)
-                if response.choices and response.choices[0].message:
-                    return response.choices[0].message.content
-                return ""
-            except Exception as e:
-                print(f"Qwen API Error: {str(e)}")
-                raise e
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+        
+        return {
+            "model": self.default_model,
+            "messages": messages,
+            "temperature": kwargs.get("temperature", 0.6),
+            "max_tokens": kwargs.get("max_tokens", 8000),
+        }
+
+    def invoke(self, input_arg: Union[str, List[Any]], user_prompt: Optional[str] = None, **kwargs) -> Any:
+        """
+        统一调用接口，智能兼容两种模式：
+        1. LangChain 风格: invoke(messages_list) -> 返回带 .content 的对象
+        2. 旧版风格: invoke(system_prompt, user_prompt) -> 返回字符串
+        """
+        params = self._build_request(input_arg, user_prompt, **kwargs)
+        try:
+            content = self._execute(params, self._send, node=kwargs.get("node"), section=kwargs.get("section"),
+                                  cache_validate=kwargs.get("cache_validate"))
+        except Exception as e:
+            print(f"Qwen API Error: {str(e)}")
+            raise e
+        return self._wrap_response(content, isinstance(input_arg, list))
+
+    async def ainvoke(self, input_arg: Union[str, List[Any]], user_prompt: Optional[str] = None, **kwargs) -> Any:
+        """
+        异步调用接口，参数与返回值同 invoke，基于 AsyncOpenAI 客户端
+        """
+        params = self._build_request(input_arg, user_prompt, **kwargs)
+        try:
+            content = await self._aexecute(params, self._asend, node=kwargs.get("node"), section=kwargs.get("section"),
+                                         cache_validate=kwargs.get("cache_validate"))
+        except Exception as e:
+            print(f"Qwen API Error: {str(e)}")
+            raise e
+        return self._wrap_response(content, isinstance(input_arg, list))
+
+    def stream(self, input_arg: Union[str, List[Any]], user_prompt: Optional[str] = None, **kwargs) -> Iterator[str]:
+        """
+        流式调用接口，参数同 invoke，逐个产出文本增量 (token)
+        """
+        params = self._build_request(input_arg, user_prompt, **kwargs)
+        try:
+            for delta in self._execute_stream(params, self._send_stream, node=kwargs.get("node"), section=kwargs.get("section")):
+                yield delta
+        except Exception as e:
+            print(f"Qwen Stream Error: {str(e)}")
+            raise e
+
+    async def astream(self, input_arg: Union[str, List[Any]], user_prompt: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        异步流式调用接口，参数同 invoke，逐个产出文本增量 (token)
+        """
+        params = self._build_request(input_arg, user_prompt, **kwargs)
+        try:
+            async for delta in self._aexecute_stream(params, self._asend_stream, node=kwargs.get("node"), section=kwargs.get("section")):
+                yield delta
+        except Exception as e:
+            print(f"Qwen Stream Error: {str(e)}")
+            raise e
+
+    def _send_stream(self, params: Dict[str, Any]) -> Iterator[Any]:
+        """发送流式请求并逐段产出文本，最后产出 usage"""
+        response = self.client.chat.completions.create(
+            **params, stream=True, stream_options={"include_usage": True}
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                yield chunk.usage
+
+    async def _asend_stream(self, params: Dict[str, Any]) -> AsyncIterator[Any]:
+        """异步发送流式请求并逐段产出文本，最后产出 usage"""
+        response = await self.async_client.chat.completions.create(
+            **params, stream=True, stream_options={"include_usage": True}
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                yield chunk.usage
+
+    def _send(self, params: Dict[str, Any]) -> str:
+        """发送请求并提取回复文本"""
+        response = self.client.chat.completions.create(**params)
+        report_usage(getattr(response, "usage", None))
+        return self._extract_content(response)
+
+    async def _asend(self, params: Dict[str, Any]) -> str:
+        """异步发送请求并提取回复文本"""
+        response = await self.async_client.chat.completions.create(**params)
+        report_usage(getattr(response, "usage", None))
+        return self._extract_content(response)
+
+    def _extract_content(self, response: Any) -> str:
+        """提取回复文本"""
+        if response.choices and response.choices[0].message:
+            return response.choices[0].message.content or ""
+        return ""
+
+    def _wrap_response(self, content: str, as_message: bool) -> Any:
+        """按调用模式包装返回值"""
+        if as_message:
+            return SimpleAIMessage(content)
+        return content
 
     def generate(self, prompt: str, temperature: float = 0.7, **kwargs) -> str:
         """生成文本（简单包装）"""
         return self.invoke(prompt, temperature=temperature, **kwargs)
+
+    async def agenerate(self, prompt: str, temperature: float = 0.7, **kwargs) -> str:
+        """异步生成文本（简单包装）"""
+        return await self.ainvoke(prompt, temperature=temperature, **kwargs)
     
     def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], 
                            temperature: float = 0.3, **kwargs) -> Dict[str, Any]:
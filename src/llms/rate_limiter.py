@@ -0,0 +1,515 @@
+"""
+LLM 全局限流器
+令牌桶 (RPM / TPM) + AIMD 并发自适应，遇到 429 时排队退避而不是直接失败；
+连接失败、超时与 5xx 等瞬时错误按指数退避重试（配置限流器后 SDK 不再自行重试）
+"""
+
+import time
+import random
+import asyncio
+import threading
+from typing import Optional, Dict, Any, Callable, Awaitable, TypeVar, Iterator, AsyncIterator
+
+from .base import RateLimitError
+from .usage import capture_usage, usage_tokens
+
+T = TypeVar("T")
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """判断异常是否为服务端限流 (HTTP 429)"""
+    if isinstance(error, RateLimitError):
+        return True
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return error.__class__.__name__ == "RateLimitError"
+
+
+# 瞬时错误的异常类名：openai SDK 的连接失败 / 超时 / 5xx，以及未经 SDK 包装的 httpx 传输错误
+_TRANSIENT_ERRORS = ("APIConnectionError", "APITimeoutError", "InternalServerError", "TransportError")
+
+
+def is_transient_error(error: Exception) -> bool:
+    """判断异常是否为可重试的瞬时错误（连接失败、超时、408 / 409、5xx）"""
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409) or status >= 500
+    return any(cls.__name__ in _TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+def estimate_request_tokens(params: Dict[str, Any], completion_reserve: int = 1000) -> int:
+    """
+    粗略估算一次请求消耗的 token 数（输入 + 预留输出）
+
+    输出按请求的 max_tokens 全额预留（写作可达 4000），请求结束后由 release 按实际用量退还多扣的部分
+
+    Args:
+        params: chat.completions.create 的请求参数
+        completion_reserve: 请求未指定 max_tokens 时预留的输出 token 数
+
+    Returns:
+        估算的 token 数
+    """
+    chars = 0
+    for msg in params.get("messages", []):
+        content = msg.get("content") or ""
+        chars += len(content) if isinstance(content, str) else len(str(content))
+    reserve = params.get("max_tokens") or completion_reserve
+    return int(chars / 1.5) + reserve
+
+
+class RateLimiter:
+    """
+    进程级限流器，所有 BaseLLM 实例共享
+
+    - 请求令牌桶: 每分钟 requests_per_minute 个请求
+    - token 令牌桶: 每分钟 tokens_per_minute 个 token
+    - 并发上限按 AIMD 调整: 成功且延迟低于目标时加性增加，遇到 429 时乘性减半，
+      延迟超过目标时小幅下调
+    - 遇到 429 时按指数退避重试，所有调用方在冷却期内排队等待
+    - 遇到瞬时错误时只有出错的调用按指数退避重试，最多 transient_retries 次
+    - 失败的尝试按实际用量（未上报时为 0）退还预扣的 token
+    """
+
+    def __init__(self, requests_per_minute: float = 60,
+                 tokens_per_minute: float = 100000,
+                 max_concurrency: int = 8,
+                 min_concurrency: int = 1,
+                 target_latency: float = 30.0,
+                 max_retries: int = 6,
+                 transient_retries: int = 2,
+                 base_backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        """
+        初始化限流器
+
+        Args:
+            requests_per_minute: 每分钟请求数预算
+            tokens_per_minute: 每分钟 token 预算
+            max_concurrency: 并发上限的最大值（也是初始值）
+            min_concurrency: 并发上限的最小值
+            target_latency: 目标延迟（秒），超过时下调并发
+            max_retries: 429 最大重试次数
+            transient_retries: 瞬时错误（连接失败、超时、5xx）最大重试次数
+            base_backoff: 初始退避时间（秒）
+            max_backoff: 最大退避时间（秒）
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.transient_retries = transient_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._request_tokens = float(requests_per_minute)
+        self._llm_tokens = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._concurrency_limit = float(max_concurrency)
+        self._in_flight = 0
+        self._cooldown_until = 0.0
+
+        self.total_requests = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+
+    # =========================================================
+    # 令牌桶
+    # =========================================================
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_tokens = min(
+            float(self.requests_per_minute),
+            self._request_tokens + elapsed * self.requests_per_minute / 60.0
+        )
+        self._llm_tokens = min(
+            float(self.tokens_per_minute),
+            self._llm_tokens + elapsed * self.tokens_per_minute / 60.0
+        )
+
+    def _try_acquire(self, tokens: int) -> float:
+        """
+        尝试获取一次调用的配额
+
+        Returns:
+            0 表示获取成功，否则为建议的等待秒数
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            if now < self._cooldown_until:
+                return self._cooldown_until - now
+            if self._in_flight >= max(int(self._concurrency_limit), self.min_concurrency):
+                return 0.05
+
+            waits = []
+            if self._request_tokens < 1:
+                waits.append((1 - self._request_tokens) * 60.0 / self.requests_per_minute)
+            if self._llm_tokens < tokens:
+                waits.append((tokens - self._llm_tokens) * 60.0 / self.tokens_per_minute)
+            if waits:
+                return max(waits)
+
+            self._request_tokens -= 1
+            self._llm_tokens -= tokens
+            self._in_flight += 1
+            self.total_requests += 1
+            return 0.0
+
+    def try_acquire(self, tokens: int) -> bool:
+        """不等待地获取配额：冷却期内、并发已满或配额不足时返回 False（供对冲请求使用）"""
+        return self._try_acquire(tokens) <= 0
+
+    @property
+    def backing_off(self) -> bool:
+        """是否处于 429 冷却期"""
+        with self._lock:
+            return time.monotonic() < self._cooldown_until
+
+    def acquire(self, tokens: int) -> None:
+        """阻塞等待直到获得配额"""
+        start = time.monotonic()
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                break
+            time.sleep(min(wait, 1.0))
+        self._add_wait(time.monotonic() - start)
+
+    async def aacquire(self, tokens: int) -> None:
+        """异步等待直到获得配额"""
+        start = time.monotonic()
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                break
+            await asyncio.sleep(min(wait, 1.0))
+        self._add_wait(time.monotonic() - start)
+
+    def _add_wait(self, waited: float):
+        with self._lock:
+            self.total_wait += waited
+
+    def release(self, latency: float, rate_limited: bool = False,
+                estimated_tokens: int = 0, actual_tokens: Optional[int] = None) -> None:
+        """
+        释放并发名额并根据结果调整并发上限
+
+        Args:
+            latency: 本次调用耗时（秒）
+            rate_limited: 是否遇到 429
+            estimated_tokens: 获取配额时预扣的 token 数
+            actual_tokens: 实际消耗的 token 数（来自 response.usage，已知时按与预扣的差额修正 TPM 桶）
+        """
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+            if actual_tokens is not None:
+                self._llm_tokens = min(
+                    float(self.tokens_per_minute),
+                    self._llm_tokens + estimated_tokens - actual_tokens
+                )
+
+            if rate_limited:
+                self.rate_limited += 1
+                self._concurrency_limit = max(float(self.min_concurrency), self._concurrency_limit / 2)
+            elif latency > self.target_latency:
+                self._concurrency_limit = max(float(self.min_concurrency), self._concurrency_limit * 0.9)
+            else:
+                self._concurrency_limit = min(
+                    float(self.max_concurrency),
+                    self._concurrency_limit + 1.0 / max(self._concurrency_limit, 1.0)
+                )
+
+    def _delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def _backoff(self, attempt: int) -> float:
+        """计算退避时间并让所有调用方进入冷却期"""
+        delay = self._delay(attempt)
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+        return delay
+
+    def _retry_delay(self, error: Exception, retries: Dict[str, int]) -> Optional[float]:
+        """
+        调用失败后决定是否重试
+
+        Args:
+            error: 本次尝试的异常
+            retries: 本次调用已重试的次数 {"rate_limited", "transient"}，原地累加
+
+        Returns:
+            重试前调用方自行等待的秒数（429 由冷却期统一排队，返回 0）；不可重试时返回 None
+        """
+        if is_rate_limit_error(error):
+            attempt = retries["rate_limited"]
+            if attempt >= self.max_retries:
+                raise RateLimitError(f"超过最大重试次数仍被限流: {error}") from error
+            retries["rate_limited"] += 1
+            delay = self._backoff(attempt)
+            print(f"  > [RateLimit] 触发限流，{delay:.1f}s 后重试 ({attempt + 1}/{self.max_retries})")
+            return 0.0
+        if is_transient_error(error) and retries["transient"] < self.transient_retries:
+            attempt = retries["transient"]
+            retries["transient"] += 1
+            delay = self._delay(attempt)
+            print(f"  > [RateLimit] 请求失败 ({error.__class__.__name__})，{delay:.1f}s 后重试 "
+                  f"({attempt + 1}/{self.transient_retries})")
+            return delay
+        return None
+
+    # =========================================================
+    # 调用包装
+    # =========================================================
+    def call(self, fn: Callable[[], T], tokens: int) -> T:
+        """
+        在限流下执行同步调用，遇到 429 排队重试，遇到瞬时错误退避重试
+
+        Args:
+            fn: 实际发起请求的函数
+            tokens: 估算的 token 数
+
+        Returns:
+            fn 的返回值
+        """
+        retries = {"rate_limited": 0, "transient": 0}
+        while True:
+            self.acquire(tokens)
+            start = time.monotonic()
+            try:
+                with capture_usage() as usages:
+                    result = fn()
+            except Exception as e:
+                self.release(time.monotonic() - start, rate_limited=is_rate_limit_error(e),
+                             estimated_tokens=tokens, actual_tokens=usage_tokens(usages) or 0)
+                delay = self._retry_delay(e, retries)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # 取消 / 提前关闭生成器时也要归还并发名额
+                self.release(time.monotonic() - start)
+                raise
+            self.release(time.monotonic() - start, estimated_tokens=tokens, actual_tokens=usage_tokens(usages))
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], tokens: int) -> T:
+        """
+        在限流下执行异步调用，遇到 429 排队重试，遇到瞬时错误退避重试
+
+        Args:
+            fn: 返回协程的函数
+            tokens: 估算的 token 数
+
+        Returns:
+            协程的返回值
+        """
+        retries = {"rate_limited": 0, "transient": 0}
+        while True:
+            await self.aacquire(tokens)
+            start = time.monotonic()
+            try:
+                with capture_usage() as usages:
+                    result = await fn()
+            except Exception as e:
+                self.release(time.monotonic() - start, rate_limited=is_rate_limit_error(e),
+                             estimated_tokens=tokens, actual_tokens=usage_tokens(usages) or 0)
+                delay = self._retry_delay(e, retries)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 取消 / 提前关闭生成器时也要归还并发名额
+                self.release(time.monotonic() - start)
+                raise
+            self.release(time.monotonic() - start, estimated_tokens=tokens, actual_tokens=usage_tokens(usages))
+            return result
+
+    def retry(self, attempt: Callable[[], T], tokens: int) -> T:
+        """
+        排队获得配额后执行 attempt，遇到 429 / 瞬时错误时按 call 的规则重试
+
+        attempt 负责在请求真正结束时归还本次获得的名额（通常经由 run_acquired），
+        供主请求可能晚于调用返回才结束的场景使用（如同步对冲：对冲请求获胜后主请求仍在后台执行）
+
+        Args:
+            attempt: 发起一次请求的函数
+            tokens: 估算的 token 数
+        """
+        retries = {"rate_limited": 0, "transient": 0}
+        while True:
+            self.acquire(tokens)
+            try:
+                return attempt()
+            except Exception as e:
+                delay = self._retry_delay(e, retries)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def run_acquired(self, fn: Callable[[], T], tokens: int) -> T:
+        """
+        执行一次已获得配额的同步调用（不重试），结束后归还名额并按实际用量修正 TPM（失败且未上报用量时全额退还）
+
+        Args:
+            fn: 实际发起请求的函数
+            tokens: 获取配额时预扣的 token 数
+        """
+        start = time.monotonic()
+        limited = False
+        failed = False
+        usages: list = []
+        try:
+            with capture_usage(exclusive=True) as usages:
+                return fn()
+        except Exception as e:
+            limited, failed = is_rate_limit_error(e), True
+            raise
+        finally:
+            actual = usage_tokens(usages)
+            self.release(time.monotonic() - start, rate_limited=limited,
+                         estimated_tokens=tokens, actual_tokens=0 if failed and actual is None else actual)
+
+    async def arun_acquired(self, fn: Callable[[], Awaitable[T]], tokens: int) -> T:
+        """执行一次已获得配额的异步调用（不重试），参数同 run_acquired"""
+        start = time.monotonic()
+        limited = False
+        failed = False
+        usages: list = []
+        try:
+            with capture_usage(exclusive=True) as usages:
+                return await fn()
+        except Exception as e:
+            limited, failed = is_rate_limit_error(e), True
+            raise
+        finally:
+            actual = usage_tokens(usages)
+            self.release(time.monotonic() - start, rate_limited=limited,
+                         estimated_tokens=tokens, actual_tokens=0 if failed and actual is None else actual)
+
+    def stream(self, fn: Callable[[], Iterator[T]], tokens: int) -> Iterator[T]:
+        """
+        在限流下执行同步流式调用；429 或瞬时错误发生在首个增量之前时重试
+
+        Args:
+            fn: 返回迭代器的函数
+            tokens: 估算的 token 数
+
+        Yields:
+            迭代器产出的元素
+        """
+        retries = {"rate_limited": 0, "transient": 0}
+        while True:
+            self.acquire(tokens)
+            start = time.monotonic()
+            started = False
+            usages = []
+            try:
+                for item in fn():
+                    started = True
+                    if not isinstance(item, str):
+                        usages.append(item)  # 流式调用最后产出的 response.usage
+                    yield item
+            except Exception as e:
+                self.release(time.monotonic() - start, rate_limited=is_rate_limit_error(e),
+                             estimated_tokens=tokens, actual_tokens=usage_tokens(usages) or 0)
+                delay = None if started else self._retry_delay(e, retries)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # 取消 / 提前关闭生成器时也要归还并发名额
+                self.release(time.monotonic() - start)
+                raise
+            self.release(time.monotonic() - start, estimated_tokens=tokens, actual_tokens=usage_tokens(usages))
+            return
+
+    async def astream(self, fn: Callable[[], AsyncIterator[T]], tokens: int) -> AsyncIterator[T]:
+        """
+        在限流下执行异步流式调用；429 或瞬时错误发生在首个增量之前时重试
+
+        Args:
+            fn: 返回异步迭代器的函数
+            tokens: 估算的 token 数
+
+        Yields:
+            异步迭代器产出的元素
+        """
+        retries = {"rate_limited": 0, "transient": 0}
+        while True:
+            await self.aacquire(tokens)
+            start = time.monotonic()
+            started = False
+            usages = []
+            try:
+                async for item in fn():
+                    started = True
+                    if not isinstance(item, str):
+                        usages.append(item)  # 流式调用最后产出的 response.usage
+                    yield item
+            except Exception as e:
+                self.release(time.monotonic() - start, rate_limited=is_rate_limit_error(e),
+                             estimated_tokens=tokens, actual_tokens=usage_tokens(usages) or 0)
+                delay = None if started else self._retry_delay(e, retries)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 取消 / 提前关闭生成器时也要归还并发名额
+                self.release(time.monotonic() - start)
+                raise
+            self.release(time.monotonic() - start, estimated_tokens=tokens, actual_tokens=usage_tokens(usages))
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        """获取限流统计"""
+        with self._lock:
+            return {
+                "total_requests": self.total_requests,
+                "rate_limited": self.rate_limited,
+                "total_wait": round(self.total_wait, 3),
+                "in_flight": self._in_flight,
+                "concurrency_limit": round(self._concurrency_limit, 2),
+            }
+
+
+# ==========================================
+# 进程级单例
+# ==========================================
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def configure_rate_limiter(**kwargs) -> RateLimiter:
+    """
+    配置进程级限流器，参数同 RateLimiter
+
+    Returns:
+        新的全局限流器
+    """
+    global _rate_limiter
+    _rate_limiter = RateLimiter(**kwargs)
+    return _rate_limiter
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """获取进程级限流器，未配置时返回 None"""
+    return _rate_limiter
+
+
+def disable_rate_limiter() -> None:
+    """关闭进程级限流器"""
+    global _rate_limiter
+    _rate_limiter = None
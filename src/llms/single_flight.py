@@ -0,0 +1,127 @@
+"""
+LLM 请求合并 (single-flight)
+相同请求正在进行时，后到的调用方等待同一个结果，而不是重复调用 API
+"""
+
+import asyncio
+import threading
+from typing import Dict, Any, Callable, Awaitable, TypeVar, Tuple
+
+T = TypeVar("T")
+
+
+class _Call:
+    """一次进行中的同步调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    请求合并器
+
+    - do: 同步调用，同一 key 只有首个调用方（leader）真正执行，其余线程阻塞等待
+    - ado: 异步调用，同一事件循环内同一 key 共享一个任务；单个调用方被取消不影响其他调用方
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[Tuple[int, str], asyncio.Task] = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """
+        执行同步调用，相同 key 的并发调用只执行一次
+
+        Args:
+            key: 请求键
+            fn: 实际执行的函数
+
+        Returns:
+            fn 的返回值（并发调用方共享）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行异步调用，相同 key 的并发调用共享一个任务
+
+        Args:
+            key: 请求键
+            fn: 返回协程的函数
+
+        Returns:
+            协程的返回值（并发调用方共享）
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is not None:
+                self.coalesced += 1
+            else:
+                task = loop.create_task(fn())
+                self._tasks[task_key] = task
+                self.leaders += 1
+                task.add_done_callback(lambda _: self._forget(task_key, task))
+
+        # shield: 某个调用方被取消时，共享任务继续为其他调用方服务
+        return await asyncio.shield(task)
+
+    def _forget(self, task_key: Tuple[int, str], task: asyncio.Task):
+        with self._lock:
+            if self._tasks.get(task_key) is task:
+                del self._tasks[task_key]
+        # 没有调用方等待时避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
+
+
+# 进程级共享实例
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """获取进程级请求合并器"""
+    return _single_flight
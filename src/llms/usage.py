@@ -0,0 +1,250 @@
+"""
+LLM 调用用量统计
+记录每次调用的 token、延迟与首 token 延迟，按段落 / 节点 / 模型汇总
+"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, fields
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+
+
+@dataclass
+class UsageRecord:
+    """单次 LLM 调用的用量记录"""
+    model: str
+    node: Optional[str] = None
+    section: Optional[str] = None
+    source: str = "api"             # api: 实际请求 / cache: 命中缓存 / coalesced: 合并到进行中的相同请求
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0            # 墙钟耗时（秒），包含限流排队
+    ttft: Optional[float] = None    # 首 token 延迟（秒），仅流式调用
+    error: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    _clock: float = field(default_factory=time.monotonic, repr=False, compare=False)
+    _tracker: Optional["UsageTracker"] = field(default=None, repr=False, compare=False)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+        data["total_tokens"] = self.total_tokens
+        return data
+
+
+class UsageTracker:
+    """
+    单次报告生成的用量汇总
+
+    使用方式:
+        tracker = UsageTracker()
+        with track_usage(tracker):
+            ...  # 期间所有 LLM 调用都会记录到 tracker
+        tracker.summary()
+        tracker.export_jsonl("usage.jsonl")
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records: List[UsageRecord] = []
+        self.started_at = time.time()
+
+    def add(self, record: UsageRecord) -> None:
+        """添加一条记录"""
+        with self._lock:
+            self.records.append(record)
+
+    @staticmethod
+    def _aggregate(records: List[UsageRecord]) -> Dict[str, Any]:
+        """汇总一组记录"""
+        return {
+            "calls": len(records),
+            "api_calls": sum(1 for r in records if r.source == "api"),
+            "cached_calls": sum(1 for r in records if r.source == "cache"),
+            "coalesced_calls": sum(1 for r in records if r.source == "coalesced"),
+            "errors": sum(1 for r in records if r.error),
+            "prompt_tokens": sum(r.prompt_tokens for r in records),
+            "completion_tokens": sum(r.completion_tokens for r in records),
+            "total_tokens": sum(r.total_tokens for r in records),
+            "latency": round(sum(r.latency for r in records), 3),
+        }
+
+    @staticmethod
+    def _group_records(records: List[UsageRecord], attr: str) -> Dict[str, List[UsageRecord]]:
+        """按记录的某个字段分组"""
+        groups: Dict[str, List[UsageRecord]] = {}
+        for r in records:
+            groups.setdefault(getattr(r, attr) or "-", []).append(r)
+        return groups
+
+    @classmethod
+    def _group(cls, records: List[UsageRecord], attr: str) -> Dict[str, Dict[str, Any]]:
+        """按记录的某个字段分组汇总"""
+        return {name: cls._aggregate(items) for name, items in cls._group_records(records, attr).items()}
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        获取用量汇总
+
+        Returns:
+            {
+                "total": 整份报告的汇总,
+                "wall_seconds": 从开始记录到现在的耗时,
+                "by_node": {节点: 汇总},
+                "by_model": {模型: 汇总},
+                "by_section": {段落标题: 汇总（含 by_node）}
+            }
+            汇总字段: calls、api_calls、cached_calls、coalesced_calls、errors、
+            prompt_tokens、completion_tokens、total_tokens、latency（调用耗时之和）
+        """
+        with self._lock:
+            records = list(self.records)
+
+        by_section = {}
+        for title, items in self._group_records(records, "section").items():
+            section_summary = self._aggregate(items)
+            section_summary["by_node"] = self._group(items, "node")
+            by_section[title] = section_summary
+
+        return {
+            "total": self._aggregate(records),
+            "wall_seconds": round(time.time() - self.started_at, 3),
+            "by_node": self._group(records, "node"),
+            "by_model": self._group(records, "model"),
+            "by_section": by_section,
+        }
+
+    def export_jsonl(self, path: str) -> int:
+        """
+        按 JSON Lines 格式导出所有调用记录（追加写入）
+
+        Args:
+            path: 输出文件路径
+
+        Returns:
+            写入的记录数
+        """
+        with self._lock:
+            records = list(self.records)
+        with open(path, "a", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r.to_dict(), ensure_ascii=False) + "\n")
+        return len(records)
+
+
+# ==========================================
+# 上下文
+# ==========================================
+
+# 当前运行的用量汇总（由 StructuredReportAgent 在每次运行时设置）
+_current_tracker: ContextVar[Optional[UsageTracker]] = ContextVar("llm_usage_tracker", default=None)
+# 当前正在发送的请求对应的记录（供适配器上报 response.usage）
+_current_record: ContextVar[Optional[UsageRecord]] = ContextVar("llm_usage_record", default=None)
+# capture_usage 期间收集上报的 usage（可嵌套，每一层都会收到）
+_usage_sinks: ContextVar[Tuple[List[Any], ...]] = ContextVar("llm_usage_sinks", default=())
+
+
+def get_usage_tracker() -> Optional[UsageTracker]:
+    """获取当前上下文的用量汇总，未开启统计时为 None"""
+    return _current_tracker.get()
+
+
+@contextmanager
+def track_usage(tracker: Optional[UsageTracker] = None) -> Iterator[UsageTracker]:
+    """
+    在当前上下文中开启用量统计
+
+    Args:
+        tracker: 用量汇总，None 时新建
+
+    Yields:
+        生效的 UsageTracker
+    """
+    tracker = tracker if tracker is not None else UsageTracker()
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+
+def begin_call(params: Dict[str, Any], node: Optional[str] = None,
+               section: Optional[str] = None) -> Optional[UsageRecord]:
+    """开始记录一次调用，未开启统计时返回 None"""
+    tracker = _current_tracker.get()
+    if tracker is None:
+        return None
+    return UsageRecord(model=params.get("model") or "-", node=node, section=section, _tracker=tracker)
+
+
+def end_call(record: Optional[UsageRecord], error: Optional[BaseException] = None) -> None:
+    """结束记录并写入当前用量汇总"""
+    if record is None:
+        return
+    record.latency = round(time.monotonic() - record._clock, 3)
+    if error is not None:
+        record.error = f"{error.__class__.__name__}: {error}"
+    record._tracker.add(record)
+
+
+def mark_first_token(record: Optional[UsageRecord]) -> None:
+    """记录首 token 延迟"""
+    if record is not None and record.ttft is None:
+        record.ttft = round(time.monotonic() - record._clock, 3)
+
+
+@contextmanager
+def recording(record: Optional[UsageRecord]) -> Iterator[None]:
+    """在发送请求期间把记录设为当前记录，供 report_usage 使用"""
+    token = _current_record.set(record)
+    try:
+        yield
+    finally:
+        _current_record.reset(token)
+
+
+def add_usage(record: Optional[UsageRecord], usage: Any) -> None:
+    """把 OpenAI 兼容接口返回的 usage 累加到记录"""
+    if record is None or usage is None:
+        return
+    record.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+    record.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+
+def usage_tokens(usages: List[Any]) -> Optional[int]:
+    """一组 usage 的 token 总数（输入 + 输出），没有上报 usage 时返回 None"""
+    if not usages:
+        return None
+    return sum((getattr(u, "prompt_tokens", 0) or 0) + (getattr(u, "completion_tokens", 0) or 0) for u in usages)
+
+
+def report_usage(usage: Any) -> None:
+    """由适配器在收到响应后调用，上报 response.usage"""
+    add_usage(_current_record.get(), usage)
+    if usage is not None:
+        for sink in _usage_sinks.get():
+            sink.append(usage)
+
+
+@contextmanager
+def capture_usage(exclusive: bool = False) -> Iterator[List[Any]]:
+    """
+    收集期间通过 report_usage 上报的 usage（供录制、限流器修正 TPM 等场景使用，不影响用量统计）；
+    嵌套使用时内外层都能收到，exclusive 为 True 时外层收不到（如对冲请求单独结算名额）
+
+    使用方式:
+        with capture_usage() as usages:
+            content = send(params)
+    """
+    sink: List[Any] = []
+    token = _usage_sinks.set((sink,) if exclusive else _usage_sinks.get() + (sink,))
+    try:
+        yield sink
+    finally:
+        _usage_sinks.reset(token)
@@ -1,10 +1,14 @@
-from .search_node import search_node
-from .writer_node import write_section_node
-from .reflector_node import reflector_node, should_continue
-from .structure_node import generate_structure_node
+from .search_node import search_node, asearch_node
+from .writer_node import write_section_node, awrite_section_node
+from .reflector_node import reflector_node, areflector_node, should_continue
+from .structure_node import generate_structure_node, agenerate_structure_node
 __all__ = [
     "generate_structure_node",
     "search_node",
     "write_section_node",
-    "reflector_node", "should_continue"
+    "reflector_node", "should_continue",
+    "agenerate_structure_node",
+    "asearch_node",
+    "awrite_section_node",
+    "areflector_node"
 ]
\ No newline at end of file
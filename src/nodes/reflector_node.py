@@ -1,11 +1,53 @@
 import json
 from langchain_core.messages import SystemMessage, HumanMessage
 from ..state.state import SectionState
-from ..prompts.prompts import SYSTEM_PROMPT_REFLECTION
+from ..prompts.prompts import SYSTEM_PROMPT_REFLECTION, output_schema_reflection
+from ..utils.structured_output import invoke_json, ainvoke_json
 
-def reflector_node(state: SectionState, llm):
+def reflector_node(state: SectionState, llm, repair_llm=None):
     """
     反思节点
+    
+    输出无法解析时先本地修复，再用 repair_llm 定向重问一次
+    """
+    messages = _build_reflection_messages(state)
+
+    try:
+        result_json = invoke_json(llm, messages, validate=_is_reflection, schema=output_schema_reflection,
+                                  node="reflect", section=state["section_def"]["title"],
+                                  repair_llm=repair_llm)
+        return _parse_reflection_response(result_json)
+
+    except Exception as e:
+        print(f"  > [Error] 反思解析失败: {e}")
+        return {
+            "critique": None,
+            "is_satisfactory": True
+        }
+
+async def areflector_node(state: SectionState, llm, repair_llm=None):
+    """
+    反思节点（异步版）
+    """
+    messages = _build_reflection_messages(state)
+
+    try:
+        result_json = await ainvoke_json(llm, messages, validate=_is_reflection,
+                                         schema=output_schema_reflection,
+                                         node="reflect", section=state["section_def"]["title"],
+                                         repair_llm=repair_llm)
+        return _parse_reflection_response(result_json)
+
+    except Exception as e:
+        print(f"  > [Error] 反思解析失败: {e}")
+        return {
+            "critique": None,
+            "is_satisfactory": True
+        }
+
+def _build_reflection_messages(state: SectionState):
+    """
+    构造反思消息
     """
     # --- 修改点：使用字典访问 ---
     section_def = state["section_def"]
@@ -22,40 +64,39 @@ def reflector_node(state: SectionState, llm):
     
     print(f"🧐 [Reflector] 正在审阅段落: 【{section_title}】")
 
-    try:
-        messages = [
-            SystemMessage(content=SYSTEM_PROMPT_REFLECTION),
-            HumanMessage(content=json.dumps(input_data, ensure_ascii=False))
-        ]
-        
-        response = llm.invoke(messages, response_format={"type": "json_object"})
-        result_json = json.loads(response.content)
-        
-        search_query = result_json.get("search_query", "")
-        reasoning = result_json.get("reasoning", "")
-        
-        if search_query and search_query.strip() != "":
-            print(f"  > ⚠️ 发现缺陷: {reasoning}")
-            print(f"  > 🔍 提出补搜: {search_query}")
-            return {
-                "critique": reasoning,
-                "feedback_search_query": search_query,
-                "is_satisfactory": False
-            }
-        else:
-            print(f"  > ✅ 质量达标")
-            return {
-                "critique": None,
-                "feedback_search_query": None,
-                "is_satisfactory": True
-            }
+    return [
+        SystemMessage(content=SYSTEM_PROMPT_REFLECTION),
+        HumanMessage(content=json.dumps(input_data, ensure_ascii=False))
+    ]
 
-    except Exception as e:
-        print(f"  > [Error] 反思解析失败: {e}")
+def _is_reflection(result_json) -> bool:
+    """反思结果必须是 JSON 对象"""
+    return isinstance(result_json, dict)
+
+def _parse_reflection_response(result_json):
+    """
+    解析反思结果
+    """
+    
+    search_query = result_json.get("search_query", "")
+    reasoning = result_json.get("reasoning", "")
+    
+    if search_query and search_query.strip() != "":
+        print(f"  > ⚠️ 发现缺陷: {reasoning}")
+        print(f"  > 🔍 提出补搜: {search_query}")
+        return {
+            "critique": reasoning,
+            "feedback_search_query": search_query,
+            "is_satisfactory": False
+        }
+    else:
+        print(f"  > ✅ 质量达标")
         return {
             "critique": None,
+            "feedback_search_query": None,
             "is_satisfactory": True
         }
+
 # should_continue 函数保持不变
 def should_continue(state: SectionState):
     is_satisfactory = state.get("is_satisfactory", False)
@@ -1,60 +1,156 @@
 import json
+import asyncio
 from langchain_core.messages import SystemMessage, HumanMessage
 from ..state.state import SectionState
 from ..tools.lightrag_search import LightRAGSearch
+from ..tools.reranker import rerank_results
+from ..tools.retrieval_router import _merge_key
+from ..tools.doc_store import DocumentStore, resolve_refs
 from ..prompts.prompts import SYSTEM_PROMPT_FIRST_SEARCH
 from ..utils import load_config
+from ..utils.structured_output import parse_json_output, json_cache_validator
 
 config = load_config()
 rag_tool = LightRAGSearch()
 
-def search_node(state: SectionState, llm):
+def search_node(state: SectionState, llm, retriever=None, rerank=None, prefetch=None, doc_store=None,
+                search_params=None):
     """
     搜索节点：支持【初次意图生成】和【反思补搜】两种模式
+    
+    retriever 为检索客户端（由图构建器注入），None 时使用模块级默认客户端；
+    rerank 为重排参数 (top_k / weight / ngram)，传入时合并后的结果按与段落要求的相关度重排并裁剪；
+    prefetch 为本次运行的 PrefetchStore，初次搜索直接使用本段落的预取结果 (state["prefetch_key"])；
+    doc_store 为本次运行的 DocumentStore，传入时 search_results 只保存引用句柄；
+    search_params 为检索参数 (max_results / timeout)，来自 NODE_PARAMS["search"]
     """
-    query_to_search = ""
-    search_reasoning = ""
+    query_to_search = _get_feedback_query(state)
+    if query_to_search and not _retriever_available(retriever):
+        return _skip_feedback_search()
+    is_feedback = bool(query_to_search)
     
-    # --- 修改点 1：使用字典方式访问 section_def ---
-    section_def = state["section_def"]
-    # 确保 section_def 是字典
-    if not isinstance(section_def, dict):
-        # 兼容性处理：如果是对象则转字典，或者直接报错
-        try:
-            section_def = section_def.__dict__
-        except:
-            pass
-
-    # A. 反思后的补搜
+    # B. 初次搜索：优先使用大纲附带的搜索词，没有时再调用 LLM 生成
+    if not query_to_search:
+        query_to_search = _get_outline_query(state)
+    if not query_to_search:
+        print("🔍 [Search] 正在生成初次搜索词...")
+        query_to_search, search_reasoning = _generate_initial_query(state, llm)
+        print(f"  > 生成查询: {query_to_search}")
+
+    # 补搜要找的是初次检索没覆盖的信息，不使用预取结果
+    results = (prefetch.get(query_to_search, state.get("prefetch_key"))
+               if prefetch is not None and not is_feedback else None)
+    if results is None:
+        results = _run_search(query_to_search, retriever, search_params)
+    return _merge_search_results(state, query_to_search, results, rerank, doc_store)
+
+async def asearch_node(state: SectionState, llm, retriever=None, rerank=None, prefetch=None,
+                       doc_store=None, search_params=None):
+    """
+    搜索节点（异步版）：LLM 调用走 ainvoke，检索优先走检索客户端的 asearch
+    """
+    query_to_search = _get_feedback_query(state)
+    if query_to_search and not _retriever_available(retriever):
+        return _skip_feedback_search()
+    is_feedback = bool(query_to_search)
+    
+    # B. 初次搜索：优先使用大纲附带的搜索词，没有时再调用 LLM 生成
+    if not query_to_search:
+        query_to_search = _get_outline_query(state)
+    if not query_to_search:
+        print("🔍 [Search] 正在生成初次搜索词...")
+        query_to_search, search_reasoning = await _agenerate_initial_query(state, llm)
+        print(f"  > 生成查询: {query_to_search}")
+
+    results = (await prefetch.aget(query_to_search, state.get("prefetch_key"))
+               if prefetch is not None and not is_feedback else None)
+    if results is None:
+        results = await _arun_search(query_to_search, retriever, search_params)
+    return _merge_search_results(state, query_to_search, results, rerank, doc_store)
+
+def _get_feedback_query(state: SectionState) -> str:
+    """
+    A. 反思后的补搜：返回反思节点给出的查询，没有则返回空字符串
+    """
     if state.get("feedback_search_query"):
         query_to_search = state["feedback_search_query"]
-        search_reasoning = f"响应反思修改: {state.get('critique')}"
         print(f"🔍 [Search] 执行补搜: {query_to_search}")
-        
-    # B. 初次搜索
-    else:
-        print(f"🔍 [Search] 正在生成初次搜索词...")
-        query_to_search, search_reasoning = _generate_initial_query(state, llm)
-        print(f"  > 生成查询: {query_to_search}")
+        return query_to_search
+    return ""
+
+def _retriever_available(retriever=None) -> bool:
+    """检索服务是否可用（熔断中返回 False；没有熔断器的检索客户端视为始终可用）"""
+    return getattr(retriever or rag_tool, "available", True)
+
+def _skip_feedback_search():
+    """
+    检索服务熔断时跳过补搜：已有结果保持不变，直接进入写作
+    """
+    print("  > ⚠️ 检索服务熔断中，跳过补搜，沿用已有资料")
+    return {"feedback_search_query": None}
+
+def _get_outline_query(state: SectionState) -> str:
+    """
+    大纲生成时附带的首次搜索词，没有则返回空字符串
+    """
+    query = (state.get("initial_search_query") or "").strip()
+    if not query:
+        return ""
+    query = _ensure_topic(state, query)
+    print(f"🔍 [Search] 使用大纲附带的搜索词: {query}")
+    return query
 
-    # 执行搜索
+def _ensure_topic(state: SectionState, query: str) -> str:
+    """确保搜索词包含报告主题"""
+    if state["query"] not in query:
+        query = f"{state['query']} {query}"
+    return query
+
+def _search_kwargs(search_params=None):
+    """检索参数：未配置时每次返回 5 条，超时使用检索客户端的默认值"""
+    search_params = search_params or {}
+    return {"max_results": search_params.get("max_results", 5), "timeout": search_params.get("timeout")}
+
+def _run_search(query_to_search: str, retriever=None, search_params=None):
+    """执行搜索"""
+    retriever = retriever or rag_tool
     try:
-        results = rag_tool.search(query_to_search, max_results=5)
+        return retriever.search(query_to_search, **_search_kwargs(search_params))
     except Exception as e:
         print(f"  > [Error] 搜索工具调用失败: {e}")
-        results = []
+        return []
 
+async def _arun_search(query_to_search: str, retriever=None, search_params=None):
+    """执行搜索（异步版），检索客户端没有 asearch 时在线程池中执行 search"""
+    retriever = retriever or rag_tool
+    if not hasattr(retriever, "asearch"):
+        return await asyncio.to_thread(_run_search, query_to_search, retriever, search_params)
+    try:
+        return await retriever.asearch(query_to_search, **_search_kwargs(search_params))
+    except Exception as e:
+        print(f"  > [Error] 搜索工具调用失败: {e}")
+        return []
+
+def _merge_search_results(state: SectionState, query_to_search: str, results, rerank=None, doc_store=None):
+    """
+    格式化搜索结果并与已有结果去重合并，传入 rerank 时再重排裁剪
+    
+    传入 doc_store 时正文存入文档存储，search_results 中只保留引用句柄 {"id", "score", "query"}
+    """
     # 格式化结果
     new_info = []
     if results:
         print(f"  > 获得 {len(results)} 条结果")
         for res in results:
             snippet = {
-                "title": res.get('title', '未知标题'), # <--- 加上这一行！
-                "content": f"【来源: {res.get('title', '未知')}】\n{res.get('content', '')}",
+                "title": res.get('title', '未知标题'),
+                "content": res.get('content', ''),
                 "url": res.get("url", ""),
+                "score": res.get("score", 0.0),
                 "query": query_to_search
             }
+            if doc_store is not None:
+                snippet["id"] = doc_store.put(snippet)
             new_info.append(snippet)
     else:
         print("  > ⚠️ 未搜索到有效信息")
@@ -62,25 +158,15 @@ def search_node(state: SectionState, llm):
     # ============================================================
     # 【源头去重 1】：合并到现有结果前先去重
     # ============================================================
-    current_results = state.get("search_results", [])
-    
-    # 去重逻辑：基于 URL 或 title 判断是否为同一文档
-    def get_doc_key(item):
-        """生成文档唯一键"""
-        url = item.get('url', '')
-        title = item.get('title', '')
-        # 优先使用 URL，如果 URL 为空或本地路径，使用 title
-        if url and len(url) > 5 and '本地' not in url:
-            return url
-        return title
+    current_results = resolve_refs(state.get("search_results", []), doc_store)
     
     # 记录已有的文档
-    existing_keys = {get_doc_key(item) for item in current_results}
+    existing_keys = {_dedupe_key(item) for item in current_results}
     
     # 只添加新的、未重复的搜索结果
     deduplicated_new_info = []
     for item in new_info:
-        key = get_doc_key(item)
+        key = _dedupe_key(item)
         if key not in existing_keys:
             deduplicated_new_info.append(item)
             existing_keys.add(key)
@@ -90,14 +176,38 @@ def search_node(state: SectionState, llm):
     updated_results = current_results + deduplicated_new_info
     print(f"  > 累计搜索结果: {len(updated_results)} 条（去重后）")
     
+    if rerank and updated_results:
+        updated_results = _rerank(state, updated_results, rerank)
+    
     return {
-        "search_results": updated_results,
+        "search_results": DocumentStore.compact(updated_results) if doc_store is not None else updated_results,
         "feedback_search_query": None
     }
 
-def _generate_initial_query(state: SectionState, llm):
+def _dedupe_key(item) -> str:
     """
-    辅助函数：调用 LLM 生成搜索词
+    文档去重键：有文档存储时用文档 id（与写作节点的 _ref_key 一致），
+    否则网页按 URL、本地资料按正文哈希（LightRAG 结果的 url 多为占位值 lightrag_source，不能用于去重）
+    """
+    return item.get("id") or _merge_key(item)
+
+def _rerank(state: SectionState, results, rerank):
+    """
+    按与段落标题、写作要求的相关度重排并只保留前 top_k 条
+    
+    写作节点按 search_results 的顺序给参考资料编号，format_output 也按同一列表输出 local_refs，
+    裁剪在这里完成可保证两处编号一致
+    """
+    section_def = state["section_def"]
+    query_text = f"{state['query']} {section_def['title']} {section_def['content']}"
+    ranked = rerank_results(results, query_text, **rerank)
+    if len(ranked) < len(results):
+        print(f"  > [重排] 保留相关度最高的 {len(ranked)}/{len(results)} 条")
+    return ranked
+
+def _build_query_messages(state: SectionState):
+    """
+    辅助函数：构造搜索词生成的消息
     """
     # --- 修改点 2：使用字典方式访问 ---
     section_def = state["section_def"]
@@ -109,24 +219,53 @@ def _generate_initial_query(state: SectionState, llm):
         "content": instruction
     }
     
-    messages = [
+    return [
         SystemMessage(content=SYSTEM_PROMPT_FIRST_SEARCH),
         HumanMessage(content=json.dumps(input_data, ensure_ascii=False))
     ]
+
+def _parse_query_response(state: SectionState, response):
+    """
+    辅助函数：解析 LLM 返回的搜索词
+    """
+    # 搜索词有兜底查询，只做本地修复，不再重问
+    result = parse_json_output(response.content, validate=_is_query_result)
     
+    query = result.get("search_query", state["query"])
+    reasoning = result.get("reasoning", "")
+    
+    return _ensure_topic(state, query), reasoning
+
+def _is_query_result(result) -> bool:
+    return isinstance(result, dict)
+
+def _fallback_query(state: SectionState, e: Exception):
+    print(f"  > [Error] 搜索意图生成失败: {e}")
+    fallback = f"{state['query']} {state['section_def']['title']}"
+    return fallback, "生成失败，使用兜底查询"
+
+def _generate_initial_query(state: SectionState, llm):
+    """
+    辅助函数：调用 LLM 生成搜索词
+    """
+    messages = _build_query_messages(state)
+    try:
+        response = llm.invoke(messages, response_format={"type": "json_object"},
+                              node="search", section=state["section_def"]["title"],
+                              cache_validate=json_cache_validator(_is_query_result))
+        return _parse_query_response(state, response)
+    except Exception as e:
+        return _fallback_query(state, e)
+
+async def _agenerate_initial_query(state: SectionState, llm):
+    """
+    辅助函数：异步调用 LLM 生成搜索词
+    """
+    messages = _build_query_messages(state)
     try:
-        response = llm.invoke(messages, response_format={"type": "json_object"})
-        result = json.loads(response.content)
-        
-        query = result.get("search_query", state["query"])
-        reasoning = result.get("reasoning", "")
-        
-        if state["query"] not in query:
-            query = f"{state['query']} {query}"
-            
-        return query, reasoning
-        
+        response = await llm.ainvoke(messages, response_format={"type": "json_object"},
+                                     node="search", section=state["section_def"]["title"],
+                                     cache_validate=json_cache_validator(_is_query_result))
+        return _parse_query_response(state, response)
     except Exception as e:
-        print(f"  > [Error] 搜索意图生成失败: {e}")
-        fallback = f"{state['query']} {section_title}"
-        return fallback, "生成失败，使用兜底查询"
\ No newline at end of file
+        return _fallback_query(state, e)
@@ -4,9 +4,14 @@ import json
 from langchain_core.messages import SystemMessage, HumanMessage
 from src.state import SectionState
 from src.utils import load_config
+from src.utils.structured_output import invoke_json, ainvoke_json
 
 # 1. 导入公共 Schema
-from src.prompts.prompts import output_schema_report_structure
+from src.prompts.prompts import (
+    output_schema_report_structure,
+    output_schema_report_structure_with_query,
+    STRUCTURE_SEARCH_QUERY_INSTRUCTION
+)
 
 # 2. 导入 个股 Prompt (Set A)
 from src.prompts.company_prompt import (
@@ -24,16 +29,51 @@ from src.prompts.industry_prompt import (
     CHAIN_ANALYSIS_INSTRUCTION
 )
 
-def generate_structure_node(state: SectionState, llm):
+def generate_structure_node(state: SectionState, llm, inline_search_query: bool = False, repair_llm=None):
     """
     第一步：生成报告结构 (支持 个股/行业 双模式切换)
+    
+    inline_search_query 为 True 时，大纲中同时为每个段落生成首次搜索词 (search_query)；
+    输出无法解析时先本地修复，再用 repair_llm 定向重问一次
+    """
+    messages = _build_structure_messages(state, inline_search_query)
+    
+    try:
+        content = invoke_json(llm, messages, validate=_has_sections,
+                              schema=_structure_schema(inline_search_query),
+                              node="structure", repair_llm=repair_llm)
+        return _parse_structure_response(content)
+        
+    except Exception as e:
+        print(f"❌ 结构解析失败: {e}")
+        return {"sections": []}
+
+async def agenerate_structure_node(state: SectionState, llm, inline_search_query: bool = False, repair_llm=None):
+    """
+    第一步（异步版）：生成报告结构
+    """
+    messages = _build_structure_messages(state, inline_search_query)
+    
+    try:
+        content = await ainvoke_json(llm, messages, validate=_has_sections,
+                                     schema=_structure_schema(inline_search_query),
+                                     node="structure", repair_llm=repair_llm)
+        return _parse_structure_response(content)
+        
+    except Exception as e:
+        print(f"❌ 结构解析失败: {e}")
+        return {"sections": []}
+
+def _build_structure_messages(state: SectionState, inline_search_query: bool = False):
+    """
+    构造大纲生成消息
     """
     config = load_config()
     query = state["query"]
     
     print(f"--- 生成报告结构 [{config.report_type}模式]: {query} ---")
 
-    json_schema_str = json.dumps(output_schema_report_structure, indent=2, ensure_ascii=False)
+    json_schema_str = json.dumps(_structure_schema(inline_search_query), indent=2, ensure_ascii=False)
 
     # ==========================
     # 逻辑分流
@@ -57,25 +97,36 @@ def generate_structure_node(state: SectionState, llm):
             json_schema=json_schema_str
         )
 
-    # 下面代码保持不变
-    messages = [
+    if inline_search_query:
+        formatted_system_prompt += STRUCTURE_SEARCH_QUERY_INSTRUCTION
+
+    return [
         SystemMessage(content=formatted_system_prompt),
         HumanMessage(content=f"请为目标生成报告结构：{query}")
     ]
+
+def _structure_schema(inline_search_query: bool):
+    """大纲输出的 JSON 模式"""
+    return output_schema_report_structure_with_query if inline_search_query else output_schema_report_structure
+
+def _parse_structure_response(content):
+    """
+    解析大纲结果
+    """
+    if isinstance(content, dict) and "items" in content:
+        sections = content["items"]
+    elif isinstance(content, list):
+        sections = content
+    else:
+        sections = content.get("sections", [])
     
-    try:
-        response = llm.invoke(messages, response_format={"type": "json_object"})
-        content = json.loads(response.content)
-        
-        if isinstance(content, dict) and "items" in content:
-            sections = content["items"]
-        elif isinstance(content, list):
-            sections = content
-        else:
-            sections = content.get("sections", [])
-            
-        return {"sections": sections}
+    # 截断修复后末尾可能残留不完整的段落
+    sections = [sec for sec in sections if isinstance(sec, dict) and sec.get("title") and sec.get("content")]
         
-    except Exception as e:
-        print(f"❌ 结构解析失败: {e}")
-        return {"sections": []}
\ No newline at end of file
+    return {"sections": sections}
+
+def _has_sections(content) -> bool:
+    """大纲解析结果中至少有一个完整段落"""
+    if not isinstance(content, (dict, list)):
+        return False
+    return bool(_parse_structure_response(content)["sections"])
\ No newline at end of file
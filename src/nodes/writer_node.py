@@ -1,17 +1,136 @@
 import json
+from typing import Any, Callable, Dict, Optional, Tuple
 from langchain_core.messages import SystemMessage, HumanMessage
-from src.prompts.prompts import SYSTEM_PROMPT_FIRST_SUMMARY
+from src.prompts.prompts import (SYSTEM_PROMPT_FIRST_SUMMARY, output_schema_first_summary,
+                                 SYSTEM_PROMPT_REVISION, output_schema_revision)
 from src.state import SectionState
+from src.utils.text_processing import PartialJSONStringReader
+from src.utils.structured_output import resolve_json, aresolve_json
+from src.tools.doc_store import DocumentStore, resolve_refs
+from src.tools.context_packer import pack_context, section_budget
+from src.tools.compressor import compress_references
 
-def write_section_node(state: SectionState, llm):
+# 段落增量回调: on_delta(section_title, delta)
+DeltaCallback = Callable[[str, str], None]
+
+def write_section_node(state: SectionState, llm, on_delta: Optional[DeltaCallback] = None, repair_llm=None,
+                       doc_store=None, context_budget: Optional[Dict[str, Any]] = None,
+                       revision: bool = False, compression: Optional[Dict[str, Any]] = None):
     """
     写作节点 (修复版)
+    
+    传入 on_delta 且 LLM 支持流式输出时，逐步推送草稿增量；
+    输出无法解析时先本地修复（含从截断输出中抢救正文），再用 repair_llm 定向重问一次；
+    search_results 为引用句柄时从 doc_store 取回正文；
+    context_budget 为参考资料的 token 预算 (max_tokens / section_budgets / min_doc_tokens / ngram)，超出时按相关度摘录；
+    revision 为 True 时，反思后的重写改为增量修订：只发送上一版草稿、修改意见和新增参考资料；
+    compression 为抽取式压缩参数 (keep_ratio / min_chars / ngram / number_bonus)，传入时参考资料先压缩再按预算装配
     """
-    section_def = state["section_def"]
-    section_title = section_def["title"]
-    instruction = section_def["content"]
+    title = state["section_def"]["title"]
+    refs = _numbered_references(state, doc_store)
+    
+    if revision and _can_revise(state):
+        try:
+            messages, refs = _build_revision_messages(state, refs, doc_store, context_budget, compression)
+            response = llm.invoke(messages, response_format={"type": "json_object"},
+                                  node="write", section=title)
+            content = resolve_json(repair_llm or llm, response.content, **_revision_output_spec(title))
+            return _finish_revision(state, content, refs, doc_store, on_delta)
+        except Exception as e:
+            print(f"  > [Revision] 增量修订失败，改为整段重写: {e}")
+            refs = _numbered_references(state, doc_store)
     
-    search_data = state.get("search_results", [])
+    messages = _build_writer_messages(state, refs, context_budget, compression)
+    
+    try:
+        if on_delta is not None and hasattr(llm, "stream"):
+            streamer = _DraftStreamer(title, on_delta)
+            for token in llm.stream(messages, response_format={"type": "json_object"},
+                                    node="write", section=title):
+                streamer.feed(token)
+            text = streamer.text
+        else:
+            response = llm.invoke(messages, response_format={"type": "json_object"},
+                                  node="write", section=title)
+            text = response.content
+        
+        content = resolve_json(repair_llm or llm, text, **_writer_output_spec(title))
+        return _parse_writer_response(state, content, refs, doc_store)
+        
+    except Exception as e:
+        print(f"  > [Error] 写作失败: {e}")
+        return {"current_content": "生成失败，请检查日志。"}
+
+async def awrite_section_node(state: SectionState, llm, on_delta: Optional[DeltaCallback] = None,
+                              repair_llm=None, doc_store=None, context_budget: Optional[Dict[str, Any]] = None,
+                              revision: bool = False, compression: Optional[Dict[str, Any]] = None):
+    """
+    写作节点（异步版）
+    
+    传入 on_delta 且 LLM 支持流式输出时，逐步推送草稿增量
+    """
+    title = state["section_def"]["title"]
+    refs = _numbered_references(state, doc_store)
+    
+    if revision and _can_revise(state):
+        try:
+            messages, refs = _build_revision_messages(state, refs, doc_store, context_budget, compression)
+            response = await llm.ainvoke(messages, response_format={"type": "json_object"},
+                                         node="write", section=title)
+            content = await aresolve_json(repair_llm or llm, response.content, **_revision_output_spec(title))
+            return _finish_revision(state, content, refs, doc_store, on_delta)
+        except Exception as e:
+            print(f"  > [Revision] 增量修订失败，改为整段重写: {e}")
+            refs = _numbered_references(state, doc_store)
+    
+    messages = _build_writer_messages(state, refs, context_budget, compression)
+    
+    try:
+        if on_delta is not None and hasattr(llm, "astream"):
+            streamer = _DraftStreamer(title, on_delta)
+            async for token in llm.astream(messages, response_format={"type": "json_object"},
+                                           node="write", section=title):
+                streamer.feed(token)
+            text = streamer.text
+        else:
+            response = await llm.ainvoke(messages, response_format={"type": "json_object"},
+                                         node="write", section=title)
+            text = response.content
+        
+        content = await aresolve_json(repair_llm or llm, text, **_writer_output_spec(title))
+        return _parse_writer_response(state, content, refs, doc_store)
+        
+    except Exception as e:
+        print(f"  > [Error] 写作失败: {e}")
+        return {"current_content": "生成失败，请检查日志。"}
+
+class _DraftStreamer:
+    """
+    累积流式 JSON 输出，把 paragraph_latest_state 的新增部分推送给回调
+    
+    每次开始新草稿时先推送一个空 delta，提示消费方清空该段落已显示的内容
+    """
+    
+    def __init__(self, title: str, on_delta: DeltaCallback):
+        self.title = title
+        self.on_delta = on_delta
+        self.reader = PartialJSONStringReader("paragraph_latest_state")
+        on_delta(title, "")
+    
+    @property
+    def text(self) -> str:
+        return self.reader.text
+    
+    def feed(self, token: str):
+        delta = self.reader.feed(token)
+        if delta:
+            self.on_delta(self.title, delta)
+
+def _numbered_references(state: SectionState, doc_store=None):
+    """
+    本次写作使用的参考资料列表，列表位置即引用编号（从 1 开始）
+    """
+    search_data = resolve_refs(state.get("search_results", []), doc_store)
     
     # ============================================================    # 【源头去重 2】：对 search_results 进行二次去重（防御性编程）
     # ============================================================
@@ -21,11 +140,7 @@ def write_section_node(state: SectionState, llm):
         deduplicated = []
         
         for item in results:
-            # 生成唯一键
-            url = item.get('url', '') if isinstance(item, dict) else ''
-            title = item.get('title', '') if isinstance(item, dict) else ''
-            
-            key = url if (url and len(url) > 5 and '本地' not in url) else title
+            key = _ref_key(item)
             
             if key not in seen_keys:
                 deduplicated.append(item)
@@ -33,35 +148,46 @@ def write_section_node(state: SectionState, llm):
         
         return deduplicated
     
+    # 兼容旧数据：字符串条目转为文档格式
+    search_data = [
+        {"title": "未知来源", "url": "", "content": item} if isinstance(item, str) else item
+        for item in search_data
+    ]
+    
     # 在写作前去重
-    search_data = deduplicate_search_results(search_data)
+    return deduplicate_search_results(search_data)
+
+def _ref_key(item) -> str:
+    """参考资料唯一键：文档 id，其次 URL（本地资料用 title）"""
+    if item.get("id"):
+        return item["id"]
+    url = item.get('url', '')
+    title = item.get('title', '')
+    return url if (url and len(url) > 5 and '本地' not in url) else title
+
+def _format_reference(i: int, item) -> str:
+    """构造带编号的引用块"""
+    return (
+        f"Reference [{i}]\n"
+        f"Source: {item.get('title', '未知来源')}\n"
+        f"URL: {item.get('url', '')}\n"
+        f"Content: {item.get('content', '')}\n"
+    )
+
+def _build_writer_messages(state: SectionState, search_data, context_budget: Optional[Dict[str, Any]] = None,
+                           compression: Optional[Dict[str, Any]] = None):
+    """
+    构造写作消息：编号参考资料并注入格式约束
+    """
+    section_def = state["section_def"]
+    section_title = section_def["title"]
+    instruction = section_def["content"]
     
     # ============================================================    # 修复点 1：标准化搜索结果格式，带上 [ID]
     # ============================================================
-    formatted_context_list = []
-    # 如果 search_data 是字符串列表（兼容旧数据），先转一下
-    if search_data and isinstance(search_data[0], str):
-         # 简单处理，假设是旧格式
-         pass 
-         
-    for i, item in enumerate(search_data, 1):
-        # 容错处理
-        if isinstance(item, str):
-            content = item
-            source = "未知来源"
-        else:
-            content = item.get('content', '')
-            source = item.get('title', '未知来源')
-            url = item.get('url', '')
-            
-        # 构造带编号的引用块
-        ref_block = (
-            f"Reference [{i}]\n"
-            f"Source: {source}\n"
-            f"URL: {url}\n"
-            f"Content: {content}\n"
-        )
-        formatted_context_list.append(ref_block)
+    # 抽取式压缩后按 token 预算装配参考资料：超出预算时按相关度摘录或舍弃，保留原编号
+    refs = _prepare_references(search_data, section_title, instruction, context_budget, compression)
+    formatted_context_list = [_format_reference(i, item) for i, item in refs]
         
     # 拼成一个大的上下文字符串
     context_str = "\n".join(formatted_context_list)
@@ -70,14 +196,7 @@ def write_section_node(state: SectionState, llm):
     # 修复点 2：针对“财务/表格”类任务的指令增强
     # ============================================================
     # 如果指令里明确要求了“表格”或者标题包含“财务”，强制注入格式要求
-    special_formatting_instruction = ""
-    if "表格" in instruction or "财务" in section_title:
-        special_formatting_instruction = (
-            "\n\n【强格式约束】\n"
-            "1. 本章节必须包含 Markdown 表格。\n"
-            "2. 严禁使用纯文本列表代替表格。\n"
-            "3. 如果数据缺失，表格单元格中填写“N/A”或“未披露”。"
-        )
+    special_formatting_instruction = _formatting_instruction(section_title, instruction)
 
     # 构造输入
     input_data = {
@@ -96,21 +215,179 @@ def write_section_node(state: SectionState, llm):
     else:
         print(f"✍️ [Writer] 正在撰写初稿: {section_title}")
     
-    messages = [
+    return [
         SystemMessage(content=SYSTEM_PROMPT_FIRST_SUMMARY),
         HumanMessage(content=json.dumps(input_data, ensure_ascii=False))
     ]
+
+def _formatting_instruction(section_title: str, instruction: str) -> str:
+    """表格类段落的强格式约束"""
+    if "表格" in instruction or "财务" in section_title:
+        return (
+            "\n\n【强格式约束】\n"
+            "1. 本章节必须包含 Markdown 表格。\n"
+            "2. 严禁使用纯文本列表代替表格。\n"
+            "3. 如果数据缺失，表格单元格中填写“N/A”或“未披露”。"
+        )
+    return ""
+
+def _prepare_references(search_data, section_title: str, instruction: str,
+                        context_budget: Optional[Dict[str, Any]] = None,
+                        compression: Optional[Dict[str, Any]] = None, start: int = 1):
+    """
+    装配写入提示词的参考资料：先抽取式压缩，再按 token 预算打包
     
-    try:
-        response = llm.invoke(messages, response_format={"type": "json_object"})
-        content = json.loads(response.content)
-        draft = content.get("paragraph_latest_state", "")
-        
-        return {
-            "current_content": draft,
-            "iteration_count": state["iteration_count"] + 1
-        }
-        
-    except Exception as e:
-        print(f"  > [Error] 写作失败: {e}")
-        return {"current_content": "生成失败，请检查日志。"}
\ No newline at end of file
+    只改动提示词中的正文，search_results 与引用编号不受影响
+    
+    Returns:
+        (编号, 文档) 列表，编号从 start 开始
+    """
+    if compression and search_data:
+        search_data, stats = compress_references(search_data, f"{section_title} {instruction}", **compression)
+        if stats["compressed_docs"]:
+            print(f"  > [压缩] {section_title}: 参考资料 {stats['original_chars']} → {stats['compressed_chars']} 字 "
+                  f"({stats['compressed_docs']} 篇，{stats['elapsed_ms']} ms)")
+    if context_budget and search_data:
+        return _pack_references(search_data, section_title, instruction, context_budget, start=start)
+    return list(enumerate(search_data, start))
+
+def _pack_references(search_data, section_title: str, instruction: str, context_budget: Dict[str, Any],
+                     start: int = 1):
+    """
+    按段落预算打包参考资料，返回 (原编号, 文档) 列表，并打印舍弃的比例供调整预算参考
+    """
+    budget = section_budget(section_title, context_budget.get("max_tokens", 6000),
+                            context_budget.get("section_budgets"))
+    packed = pack_context(search_data, budget, f"{section_title} {instruction}",
+                          min_doc_tokens=context_budget.get("min_doc_tokens", 150),
+                          ngram=context_budget.get("ngram", 2))
+    if packed.dropped_tokens > 0:
+        stats = packed.stats()
+        print(f"  > [上下文] {section_title}: 参考资料约 {stats['original_tokens']} tokens，"
+              f"预算 {budget}，保留 {stats['packed_tokens']} (舍弃 {stats['dropped_ratio']:.0%}；"
+              f"摘录 {len(stats['trimmed'])} 篇，舍弃 {len(stats['dropped'])} 篇)")
+    return [(i + start - 1, item) for i, item in packed.refs]
+
+def _writer_output_spec(title: str):
+    """写作输出的解析要求：必须有非空正文，截断时抢救 paragraph_latest_state"""
+    return {
+        "validate": lambda content: isinstance(content, dict) and bool(content.get("paragraph_latest_state")),
+        "salvage_field": "paragraph_latest_state",
+        "schema": output_schema_first_summary,
+        "node": "write",
+        "section": title,
+    }
+
+def _parse_writer_response(state: SectionState, content, refs, doc_store=None):
+    """
+    解析写作结果
+    
+    同时写回本版草稿使用的参考资料（列表位置即引用编号），format_output 与下一次增量修订都以它为准
+    """
+    draft = content.get("paragraph_latest_state", "")
+    
+    return _writer_result(state, draft, refs, doc_store)
+
+def _writer_result(state: SectionState, draft: str, refs, doc_store=None):
+    if doc_store is not None:
+        refs = DocumentStore.compact(refs)
+    return {
+        "current_content": draft,
+        "iteration_count": state["iteration_count"] + 1,
+        "search_results": refs,
+        "drafted_refs": refs
+    }
+
+# =================================================================
+# 增量修订
+# =================================================================
+
+def _can_revise(state: SectionState) -> bool:
+    """有修改意见且已有可用的上一版草稿时走增量修订"""
+    draft = state.get("current_content") or ""
+    return bool(state.get("critique")) and bool(draft) and draft != "生成失败，请检查日志。" \
+        and state.get("drafted_refs") is not None
+
+def _build_revision_messages(state: SectionState, refs, doc_store=None,
+                             context_budget: Optional[Dict[str, Any]] = None,
+                             compression: Optional[Dict[str, Any]] = None):
+    """
+    构造增量修订消息
+    
+    上一版草稿引用的参考资料保持原编号，新增的参考资料接在其后编号，只有新增的才发送正文
+    
+    Returns:
+        (消息列表, 修订后草稿使用的参考资料列表)
+    """
+    section_def = state["section_def"]
+    section_title = section_def["title"]
+    instruction = section_def["content"]
+    
+    drafted = resolve_refs(state.get("drafted_refs") or [], doc_store)
+    drafted_keys = {_ref_key(item) for item in drafted}
+    new_refs = [item for item in refs if _ref_key(item) not in drafted_keys]
+    
+    numbered = _prepare_references(new_refs, section_title, instruction, context_budget, compression,
+                                   start=len(drafted) + 1)
+    
+    input_data = {
+        "title": section_title,
+        "content": instruction + _formatting_instruction(section_title, instruction),
+        "critique": state["critique"],
+        "paragraph_latest_state": state["current_content"],
+        "new_search_results": [_format_reference(i, item) for i, item in numbered]
+    }
+    print(f"✍️ [Writer] 正在增量修订: {section_title} (迭代 {state['iteration_count']}，"
+          f"新增参考资料 {len(new_refs)} 条)")
+    
+    messages = [
+        SystemMessage(content=SYSTEM_PROMPT_REVISION),
+        HumanMessage(content=json.dumps(input_data, ensure_ascii=False))
+    ]
+    return messages, drafted + new_refs
+
+def _revision_output_spec(title: str):
+    """修订输出的解析要求：edits 非空或给出完整正文"""
+    return {
+        "validate": lambda content: isinstance(content, dict) and (
+            bool(content.get("paragraph_latest_state")) or bool(content.get("edits"))
+        ),
+        "salvage_field": "paragraph_latest_state",
+        "schema": output_schema_revision,
+        "node": "write",
+        "section": title,
+    }
+
+def _apply_edits(draft: str, edits) -> Tuple[str, int]:
+    """
+    把修订片段应用到草稿：original 原样出现在草稿中时替换第一处
+    
+    Returns:
+        (修订后的草稿, 成功应用的片段数)
+    """
+    applied = 0
+    for edit in edits or []:
+        if not isinstance(edit, dict):
+            continue
+        original = edit.get("original") or ""
+        revised = edit.get("revised")
+        if original and revised is not None and original in draft:
+            draft = draft.replace(original, revised, 1)
+            applied += 1
+    return draft, applied
+
+def _finish_revision(state: SectionState, content, refs, doc_store, on_delta: Optional[DeltaCallback]):
+    """应用修订结果；片段全部无法定位时抛出异常，由调用方改为整段重写"""
+    title = state["section_def"]["title"]
+    draft = content.get("paragraph_latest_state") or ""
+    edits = content.get("edits") or []
+    if not draft:
+        draft, applied = _apply_edits(state["current_content"], edits)
+        if not applied:
+            raise ValueError(f"{len(edits)} 个修订片段均无法在草稿中定位")
+        print(f"  > [Revision] 应用修订片段 {applied}/{len(edits)}")
+    
+    if on_delta is not None:
+        on_delta(title, "")
+        on_delta(title, draft)
+    return _writer_result(state, draft, refs, doc_store)
\ No newline at end of file
@@ -9,11 +9,16 @@ from .prompts import (
     SYSTEM_PROMPT_REFLECTION,
     SYSTEM_PROMPT_REFLECTION_SUMMARY,
     SYSTEM_PROMPT_REPORT_FORMATTING,
+    STRUCTURE_SEARCH_QUERY_INSTRUCTION,
+    SYSTEM_PROMPT_JSON_REPAIR,
+    SYSTEM_PROMPT_REVISION,
     output_schema_report_structure,
+    output_schema_report_structure_with_query,
     output_schema_first_search,
     output_schema_first_summary,
     output_schema_reflection,
     output_schema_reflection_summary,
+    output_schema_revision,
     input_schema_report_formatting,
     
 )
@@ -37,11 +42,16 @@ __all__ = [
     "SYSTEM_PROMPT_REFLECTION",
     "SYSTEM_PROMPT_REFLECTION_SUMMARY",
     "SYSTEM_PROMPT_REPORT_FORMATTING",
+    "STRUCTURE_SEARCH_QUERY_INSTRUCTION",
+    "SYSTEM_PROMPT_JSON_REPAIR",
+    "SYSTEM_PROMPT_REVISION",
     "output_schema_report_structure",
+    "output_schema_report_structure_with_query",
     "output_schema_first_search",
     "output_schema_first_summary", 
     "output_schema_reflection",
     "output_schema_reflection_summary",
+    "output_schema_revision",
     "input_schema_report_formatting",
     "SYSTEM_PROMPT_REPORT_STRUCTURE_INDUSTRY",
     "MARKET_SPACE_PROMPT_INSTRUCTION",
@@ -22,6 +22,19 @@ output_schema_report_structure = {
     }
 }
 
+# 报告结构输出Schema（附带每个段落的首次搜索词，省去段落 worker 单独生成搜索词的调用）
+output_schema_report_structure_with_query = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "content": {"type": "string"},
+            "search_query": {"type": "string"}
+        }
+    }
+}
+
 # 首次搜索输入Schema
 input_schema_first_search = {
     "type": "object",
@@ -104,6 +117,39 @@ output_schema_reflection_summary = {
     }
 }
 
+# 增量修订输入Schema
+input_schema_revision = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "content": {"type": "string"},
+        "critique": {"type": "string"},
+        "paragraph_latest_state": {"type": "string"},
+        "new_search_results": {
+            "type": "array",
+            "items": {"type": "string"}
+        }
+    }
+}
+
+# 增量修订输出Schema（edits 与 paragraph_latest_state 二选一）
+output_schema_revision = {
+    "type": "object",
+    "properties": {
+        "edits": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "original": {"type": "string"},
+                    "revised": {"type": "string"}
+                }
+            }
+        },
+        "paragraph_latest_state": {"type": "string"}
+    }
+}
+
 # 报告格式化输入Schema
 input_schema_report_formatting = {
     "type": "array",
@@ -142,6 +188,21 @@ SYSTEM_PROMPT_FIRST_SEARCH = f"""
 只返回JSON对象，不要有解释或额外文本。
 """
 
+# JSON 修复（本地修复失败后的定向重问，只发送出错的输出，不重发原始上下文）
+SYSTEM_PROMPT_JSON_REPAIR = """
+你是一个JSON修复工具。你将收到一段本应是JSON、但无法被解析的文本，以及期望的JSON模式和解析错误信息。
+请在不改写、不删减原有内容的前提下修正其格式（补全括号与引号、转义字符串中的换行和引号、去掉多余文字），
+使其成为符合期望模式的合法JSON。
+只返回修正后的JSON，不要有解释或额外文本。
+"""
+
+# 大纲生成时附带的搜索词要求（追加在结构生成 System Prompt 之后）
+STRUCTURE_SEARCH_QUERY_INSTRUCTION = """
+此外，请为每个段落额外给出 "search_query" 字段：根据该段落 'content' 中的详细指令，提炼出最关键的搜索意图，
+作为该段落的首次检索查询。搜索查询必须包含目标名称（个股需包含公司名称和股票代码，行业需包含行业名称），
+如果 'content' 中包含具体的财务指标或特定的逻辑要求，请确保搜索查询能够获取这些数据或信息。
+"""
+
 # 段落写作
 SYSTEM_PROMPT_FIRST_SUMMARY = f"""
 你是一位专业的投研分析师（Sell-side Analyst）。你正在撰写一份深度研究报告的特定章节。
@@ -232,6 +293,36 @@ SYSTEM_PROMPT_REFLECTION_SUMMARY = f"""
 只返回JSON对象，不要有解释或额外文本。
 """
 
+# 增量修订（反思后的重写只发送上一版草稿、修改意见和新增参考资料）
+SYSTEM_PROMPT_REVISION = f"""
+你是一位专业的投研分析师。你正在根据审阅意见修订报告章节的上一版草稿。
+你将获得标题、写作指令(content)、修改意见(critique)、上一版草稿(paragraph_latest_state)，
+以及上一版之后新增的参考资料(new_search_results，可能为空)：
+
+<INPUT JSON SCHEMA>
+{json.dumps(input_schema_revision, indent=2, ensure_ascii=False)}
+</INPUT JSON SCHEMA>
+
+**修订规范**：
+1. 只针对修改意见修订，草稿中没有问题的部分保持原样，不要重写。
+2. 草稿中已有的引用编号 [[idx]] 继续有效，不得改动；新增参考资料按其给出的编号引用，引用格式同草稿（多点引用用空格或逗号分隔，不得重复）。
+3. 严禁编造数据，参考资料中没有的数据填写“N/A”；务必仍然满足 'content' 中的原始写作指令（如表格格式）。
+
+**输出方式（二选一）**：
+- 改动集中在少数句子或表格行时，只输出 edits：每项的 original 必须是从草稿中原样复制的连续片段，revised 为替换后的内容
+  （在某处之后新增内容时，original 取该处原文，revised 为原文加新增内容）。
+- 需要大范围调整时，输出完整的修订后章节 paragraph_latest_state。
+
+请按照以下JSON模式定义格式化输出：
+
+<OUTPUT JSON SCHEMA>
+{json.dumps(output_schema_revision, indent=2, ensure_ascii=False)}
+</OUTPUT JSON SCHEMA>
+
+确保输出是一个符合上述输出JSON模式定义的JSON对象。
+只返回JSON对象，不要有解释或额外文本。
+"""
+
 # 最终拼接
 SYSTEM_PROMPT_REPORT_FORMATTING = f"""
 你是一位专业的券商研究员。你已经完成了深度研报的所有章节。
@@ -33,7 +33,7 @@ def reduce_list(left: Optional[list], right: Optional[list]) -> list:
 class SectionOutput(TypedDict):
     title: str
     content: str  # Markdown 文本
-    local_refs: List[Dict[str, Any]] # 该段落用到的原始搜索结果
+    local_refs: List[Dict[str, Any]] # 该段落用到的搜索结果（使用文档存储时为引用句柄 {"id", "score", "query"}）
 
 # [新增] 专门的 reducer，处理列表合并
 def reduce_list(left: Optional[list], right: Optional[list]) -> list:
@@ -54,7 +54,8 @@ class SectionState(TypedDict):
     section_def: SectionMetadata    # 当前正在处理的段落定义对象
 
     # --- 信息收集 (Context) ---
-    # 存储搜索到的原始数据，通常是列表，包含 content, url 等
+    # 存储搜索到的原始数据，通常是列表，包含 content, url 等；
+    # 运行时配置了文档存储 (DocumentStore) 时只存引用句柄 {"id", "score", "query"}，正文按 id 从存储中取回
     search_results: List[Dict[str, Any]] 
     
     # --- 内容生成 (Generation) ---
@@ -68,6 +69,9 @@ class SectionState(TypedDict):
     # 这里的类型变了，变成了 SectionOutput 的列表
     completed_sections: Optional[List[SectionOutput]] 
     feedback_search_query: Optional[str]
+    initial_search_query: Optional[str]   # 大纲生成时附带的首次搜索词，有则跳过搜索词生成
+    prefetch_key: Optional[str]           # 本段落的预取检索词，初次搜索只取用该检索词的预取结果
+    drafted_refs: Optional[List[Dict[str, Any]]]  # 当前草稿使用的参考资料（位置即引用编号），增量修订时保持编号不变
     # 【核心修复】：必须在这里定义这个字段，Worker 才能把它传给主 Agent！
     aggregate_references: Optional[List[Dict[str, Any]]]
 
@@ -4,5 +4,29 @@
 """
 
 
-from .lightrag_search import LightRAGSearch, light_rag_search
-__all__ = ["tavily_search", "SearchResult","light_rag_search"]
+from .lightrag_search import LightRAGSearch, light_rag_search, dedupe_across_queries
+from .retrieval_cache import RetrievalCache, normalize_query
+from .local_bm25 import LocalBM25Search
+from .local_vector import LocalVectorSearch, hash_embedding
+from .tavily_search import TavilySearch
+from .retrieval_router import RetrievalRouter, StubRetriever, merge_routes
+from .reranker import rerank_results, tfidf_similarity
+from .context_packer import pack_context, estimate_tokens, PackedContext
+from .compressor import compress_references
+from .doc_store import DocumentStore, resolve_refs
+from .prefetch import PrefetchStore, prefetch_query
+from .circuit_breaker import CircuitBreaker, configure_circuit_breaker, get_circuit_breaker
+__all__ = [
+    "LightRAGSearch", "light_rag_search", "dedupe_across_queries",
+    "RetrievalCache", "normalize_query",
+    "LocalBM25Search",
+    "LocalVectorSearch", "hash_embedding",
+    "TavilySearch",
+    "RetrievalRouter", "StubRetriever", "merge_routes",
+    "rerank_results", "tfidf_similarity",
+    "pack_context", "estimate_tokens", "PackedContext",
+    "compress_references",
+    "DocumentStore", "resolve_refs",
+    "PrefetchStore", "prefetch_query",
+    "CircuitBreaker", "configure_circuit_breaker", "get_circuit_breaker",
+]
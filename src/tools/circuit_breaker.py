@@ -0,0 +1,185 @@
+"""
+检索服务熔断器
+连续失败后熔断，熔断期间请求立即失败；冷却后放行少量探测请求，成功则恢复
+"""
+
+import time
+import threading
+from typing import Optional, Dict, Any
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 调用方因截止时间到达而取消请求时使用的取消消息（task.cancel(DEADLINE_EXCEEDED)），
+# 此类取消等同超时，计为失败而不是 record_cancelled
+DEADLINE_EXCEEDED = "deadline_exceeded"
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    - closed: 正常放行，连续失败 failure_threshold 次后进入 open
+    - open: 拒绝所有请求（毫秒级返回），reset_timeout 秒后进入 half_open
+    - half_open: 最多放行 half_open_max_calls 个探测请求；探测成功回到 closed，失败重新 open
+
+    使用方式:
+        if not breaker.allow():
+            return []  # 快速失败
+        try:
+            result = call()
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+    """
+
+    def __init__(self, name: str = "lightrag",
+                 failure_threshold: int = 3,
+                 reset_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        """
+        初始化熔断器
+
+        Args:
+            name: 名称，用于日志
+            failure_threshold: 触发熔断的连续失败次数
+            reset_timeout: 熔断后进入半开状态前的冷却时间（秒）
+            half_open_max_calls: 半开状态下同时放行的探测请求数
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+        self.rejected = 0
+        self.trips = 0
+
+    def _refresh(self) -> None:
+        """冷却结束后 open → half_open（调用方需持有锁）"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+            print(f"  🔌 [熔断] {self.name} 冷却结束，放行探测请求")
+
+    @property
+    def state(self) -> str:
+        """当前状态: closed / open / half_open"""
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    @property
+    def available(self) -> bool:
+        """服务是否可用（closed，或 half_open 且仍可放行探测请求）"""
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            return self._state == HALF_OPEN and self._probes < self.half_open_max_calls
+
+    def allow(self) -> bool:
+        """
+        请求前调用，返回 False 时应立即失败
+
+        half_open 状态下返回 True 表示本次请求是探测请求，之后必须调用 record_success / record_failure
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        """请求成功"""
+        with self._lock:
+            if self._state != CLOSED:
+                print(f"  🔌 [熔断] {self.name} 探测成功，恢复正常")
+            self._state = CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self) -> None:
+        """请求失败（连接错误、超时、5xx 等）"""
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+                print(f"  🔌 [熔断] {self.name} 连续失败 {self._failures} 次，熔断 {self.reset_timeout:.0f}s")
+
+    def record_cancelled(self) -> None:
+        """请求被调用方取消（不代表服务故障），归还探测名额；截止时间到达导致的取消应调用 record_failure"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def reset(self) -> None:
+        """手动恢复为 closed"""
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取熔断器状态
+
+        Returns:
+            state、consecutive_failures、trips（熔断次数）、rejected（快速失败的请求数）、retry_in（距离探测的秒数）
+        """
+        with self._lock:
+            self._refresh()
+            retry_in = 0.0
+            if self._state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                "name": self.name,
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "retry_in": round(retry_in, 1),
+            }
+
+
+# ==========================================
+# 进程级单例
+# ==========================================
+
+_breaker: Optional[CircuitBreaker] = None
+
+
+def configure_circuit_breaker(**kwargs) -> CircuitBreaker:
+    """
+    配置进程级检索熔断器，参数同 CircuitBreaker
+
+    Returns:
+        新的全局熔断器
+    """
+    global _breaker
+    _breaker = CircuitBreaker(**kwargs)
+    return _breaker
+
+
+def get_circuit_breaker() -> Optional[CircuitBreaker]:
+    """获取进程级检索熔断器，未配置时返回 None"""
+    return _breaker
+
+
+def disable_circuit_breaker() -> None:
+    """关闭进程级检索熔断器"""
+    global _breaker
+    _breaker = None
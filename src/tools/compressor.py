@@ -0,0 +1,131 @@
+"""
+参考资料抽取式压缩
+把检索片段切成句子，按与段落写作要求的字 n-gram 重叠（NumPy 向量化）打分，
+每篇只保留得分最高的句子；表格行整行保留，含数字的句子加分，句子内部不做截断
+"""
+
+import re
+import math
+import time
+import unicodedata
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+from .local_bm25 import tokenize
+from .context_packer import split_sentences
+
+_DIGIT_RE = re.compile(r"\d")
+
+
+def _is_table_row(sentence: str) -> bool:
+    """Markdown 表格行（含分隔行）"""
+    return sentence.strip().count("|") >= 2
+
+
+def score_sentences(sentences: List[str], query: str, ngram: int = 2,
+                    number_bonus: float = 0.2) -> np.ndarray:
+    """
+    计算句子与 query 的相关度
+
+    得分 = 命中的 query 词元的 IDF 权重之和 / log(2 + 句子字数) + 含数字时的加分；
+    IDF 在本批句子内统计，出现在越少句子中的 query 词元权重越高。
+    句子不逐字分词，直接在归一化后的句子中查找 query 词元（子串匹配），大批量句子也只需毫秒级
+
+    Returns:
+        形状为 (len(sentences),) 的得分数组
+    """
+    if not sentences:
+        return np.zeros(0, dtype=np.float32)
+    vocab = list(dict.fromkeys(tokenize(query, ngram)))
+    normalized = [unicodedata.normalize("NFKC", s).lower() for s in sentences]
+
+    hits = np.array([[token in s for token in vocab] for s in normalized], dtype=np.float32)
+    hits = hits.reshape(len(sentences), len(vocab))
+    lengths = np.fromiter((len(s) for s in normalized), dtype=np.float32, count=len(normalized))
+    df = hits.sum(axis=0)
+    idf = np.log((1.0 + len(sentences)) / (1.0 + df)) + 1.0
+    scores = (hits @ idf) / np.log(2.0 + lengths)
+
+    has_number = np.fromiter((_DIGIT_RE.search(s) is not None for s in sentences),
+                             dtype=bool, count=len(sentences))
+    return scores + number_bonus * has_number
+
+
+def compress_text(sentences: List[str], scores: np.ndarray, max_chars: int) -> str:
+    """
+    选出得分最高的句子（总字数不超过 max_chars，表格行始终保留），按原文顺序拼接，不连续处以 "……" 连接
+    """
+    keep = {i for i, s in enumerate(sentences) if _is_table_row(s)}
+    used = sum(len(sentences[i]) for i in keep)
+    for i in np.argsort(-scores, kind="stable"):
+        i = int(i)
+        if i in keep or not sentences[i].strip():
+            continue
+        if used + len(sentences[i]) > max_chars:
+            continue
+        keep.add(i)
+        used += len(sentences[i])
+
+    parts, last = [], None
+    for i in sorted(keep):
+        if last is not None and i != last + 1:
+            parts.append("……\n" if parts and parts[-1].endswith("\n") else "……")
+        parts.append(sentences[i])
+        last = i
+    return "".join(parts).strip()
+
+
+def compress_references(docs: List[Dict[str, Any]], query: str, keep_ratio: float = 0.4,
+                        min_chars: int = 400, ngram: int = 2,
+                        number_bonus: float = 0.2) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    压缩一个段落的参考资料
+
+    所有文档的句子一次打分（IDF 跨文档统计），每篇保留 max(min_chars, 原长 × keep_ratio) 字以内的高分句子；
+    不超过 min_chars 的文档不压缩
+
+    Args:
+        docs: 参考资料（使用 content 字段），顺序不变
+        query: 打分文本，通常为段落标题 + 写作要求
+        keep_ratio: 每篇保留的字数比例
+        min_chars: 每篇至少保留的字数，短于该值的文档原样保留
+        ngram: 中文字 n-gram 的最大 n
+        number_bonus: 含数字句子的加分
+
+    Returns:
+        (压缩后的文档副本列表, 统计 {original_chars, compressed_chars, compressed_docs, elapsed_ms})
+    """
+    start = time.perf_counter()
+    spans, sentences = [], []
+    for doc in docs:
+        content = doc.get("content", "")
+        if len(content) <= min_chars:
+            spans.append(None)
+            continue
+        parts = split_sentences(content)
+        spans.append((len(sentences), len(sentences) + len(parts)))
+        sentences.extend(parts)
+
+    scores = score_sentences(sentences, query, ngram, number_bonus) if sentences else None
+
+    compressed, original_chars, compressed_chars, count = [], 0, 0, 0
+    for doc, span in zip(docs, spans):
+        content = doc.get("content", "")
+        original_chars += len(content)
+        if span is not None:
+            budget = max(min_chars, int(math.ceil(len(content) * keep_ratio)))
+            text = compress_text(sentences[span[0]:span[1]], scores[span[0]:span[1]], budget)
+            if text and len(text) < len(content):
+                doc = {**doc, "content": text}
+                count += 1
+        compressed_chars += len(doc.get("content", ""))
+        compressed.append(doc)
+
+    stats = {
+        "original_chars": original_chars,
+        "compressed_chars": compressed_chars,
+        "compressed_docs": count,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    return compressed, stats
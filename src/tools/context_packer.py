@@ -0,0 +1,185 @@
+"""
+写作上下文打包
+按 token 预算装配写作节点的参考资料：离线估算 token 数（针对中文调校），
+超出预算时按相关度保留整篇、截取摘录或舍弃文档，并报告舍弃了多少内容
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+
+from .local_bm25 import tokenize
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_DIGIT_RE = re.compile(r"\d")
+_WORD_RE = re.compile(r"[A-Za-z]+")
+_OTHER_RE = re.compile(r"[^\sA-Za-z\d\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+# 句末标点、分号与换行处切句
+_SENTENCE_RE = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]*\n?|\n")
+
+# 每个汉字约 0.7 token（Qwen 词表中常见词多为 2 字一个 token）
+CJK_TOKENS_PER_CHAR = 0.7
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    离线估算 token 数（不依赖分词器，单次估算为正则计数）
+
+    汉字按 0.7 token / 字，数字逐位计 1 token（Qwen 对数字逐位切分），
+    英文单词约 4 个字母 1 token，其余标点符号各计 1 token，空白不计
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    digits = len(_DIGIT_RE.findall(text))
+    words = sum(max(1, (len(w) + 3) // 4) for w in _WORD_RE.findall(text))
+    other = len(_OTHER_RE.findall(text))
+    return int(cjk * CJK_TOKENS_PER_CHAR + digits + words + other + 0.5)
+
+
+def split_sentences(text: str) -> List[str]:
+    """按中英文句末标点、分号与换行切句，保留原标点；拼接结果等于原文"""
+    return [s for s in _SENTENCE_RE.findall(text or "") if s]
+
+
+def sentence_relevance(sentences: List[str], query: str, ngram: int = 2) -> List[float]:
+    """每个句子的字 n-gram 与 query 的重叠比例（按句子词元数归一化），取值 [0, 1]"""
+    query_tokens = set(tokenize(query, ngram))
+    scores = []
+    for sentence in sentences:
+        tokens = set(tokenize(sentence, ngram))
+        scores.append(len(tokens & query_tokens) / len(tokens) if tokens and query_tokens else 0.0)
+    return scores
+
+
+def excerpt(text: str, max_tokens: int, query: str, ngram: int = 2) -> str:
+    """
+    截取与 query 最相关的句子，总长不超过 max_tokens，按原文顺序拼接，不连续处以 "……" 连接
+
+    没有任何句子放得下时截取开头部分
+    """
+    sentences = split_sentences(text)
+    scores = sentence_relevance(sentences, query, ngram)
+    costs = [estimate_tokens(s) for s in sentences]
+
+    chosen, used = set(), 0
+    for i in sorted(range(len(sentences)), key=lambda i: -scores[i]):
+        if used + costs[i] <= max_tokens:
+            chosen.add(i)
+            used += costs[i]
+
+    if not chosen:
+        return _truncate_to_tokens(text, max_tokens)
+
+    parts, last = [], None
+    for i in sorted(chosen):
+        if last is not None and i != last + 1:
+            parts.append("……")
+        parts.append(sentences[i].strip())
+        last = i
+    return "".join(parts)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按估算 token 数截取开头部分（二分查找字符数）"""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + ("……" if low < len(text) else "")
+
+
+@dataclass
+class PackedContext:
+    """
+    打包结果
+
+    refs 为 (原编号, 文档) 列表，编号与 search_results 中的位置一致（从 1 开始），被舍弃的文档不在其中
+    """
+    refs: List[Tuple[int, Dict[str, Any]]]
+    budget: int
+    original_tokens: int
+    packed_tokens: int
+    trimmed: List[int] = field(default_factory=list)
+    dropped: List[int] = field(default_factory=list)
+
+    @property
+    def dropped_tokens(self) -> int:
+        return self.original_tokens - self.packed_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        """打包统计: budget、original_tokens、packed_tokens、dropped_tokens、dropped_ratio、trimmed、dropped"""
+        return {
+            "budget": self.budget,
+            "original_tokens": self.original_tokens,
+            "packed_tokens": self.packed_tokens,
+            "dropped_tokens": self.dropped_tokens,
+            "dropped_ratio": round(self.dropped_tokens / self.original_tokens, 3) if self.original_tokens else 0.0,
+            "trimmed": list(self.trimmed),
+            "dropped": list(self.dropped),
+        }
+
+
+def section_budget(title: str, max_tokens: int, section_budgets: Optional[Dict[str, int]] = None) -> int:
+    """段落的参考资料 token 预算：标题包含 section_budgets 中某个关键词时使用对应预算"""
+    for keyword, budget in (section_budgets or {}).items():
+        if keyword in title:
+            return budget
+    return max_tokens
+
+
+def pack_context(docs: List[Dict[str, Any]], budget: int, query: str,
+                 min_doc_tokens: int = 150, ngram: int = 2) -> PackedContext:
+    """
+    按 token 预算打包参考资料
+
+    未超预算时原样返回；超出时按相关度（rerank_score，其次 score，再次原顺序）从高到低：
+    先给每篇文档 min_doc_tokens 的摘录额度（放不下的文档舍弃），剩余预算再依次补足为全文
+
+    Args:
+        docs: 按编号顺序排列的参考资料（title、url、content）
+        budget: 参考资料正文的 token 预算
+        query: 用于挑选摘录句子的文本，通常为段落标题 + 写作要求
+        min_doc_tokens: 每篇保留文档的最低摘录长度
+        ngram: 计算句子相关度时中文字 n-gram 的最大 n
+
+    Returns:
+        PackedContext
+    """
+    costs = [estimate_tokens(doc.get("content", "")) for doc in docs]
+    original = sum(costs)
+    if original <= budget:
+        return PackedContext(list(enumerate(docs, 1)), budget, original, original)
+
+    order = sorted(range(len(docs)), key=lambda i: (
+        -float(docs[i].get("rerank_score", docs[i].get("score")) or 0.0), i
+    ))
+
+    allowance = [0] * len(docs)
+    remaining = budget
+    for i in order:
+        share = min(costs[i], min_doc_tokens)
+        if share > remaining:
+            continue
+        allowance[i] = share
+        remaining -= share
+    for i in order:
+        if allowance[i] and remaining > 0:
+            extra = min(costs[i] - allowance[i], remaining)
+            allowance[i] += extra
+            remaining -= extra
+
+    refs, trimmed, dropped, packed = [], [], [], 0
+    for i, doc in enumerate(docs):
+        if not allowance[i] and costs[i]:
+            dropped.append(i + 1)
+            continue
+        if allowance[i] < costs[i]:
+            doc = {**doc, "content": excerpt(doc.get("content", ""), allowance[i], query, ngram)}
+            trimmed.append(i + 1)
+        packed += estimate_tokens(doc.get("content", ""))
+        refs.append((i + 1, doc))
+    return PackedContext(refs, budget, original, packed, trimmed, dropped)
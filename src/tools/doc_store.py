@@ -0,0 +1,122 @@
+"""
+单次运行的文档存储
+检索到的文档正文按内容寻址只存一份，图状态中只流转引用句柄 {"id", "score", "query"}，
+写作与编译时再按 id 取回正文
+"""
+
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional
+
+# 文档本体字段，其余字段（score、query、rerank_score 等）属于引用句柄
+DOC_FIELDS = ("title", "url", "content")
+
+
+def _store_key(doc: Dict[str, Any]) -> str:
+    """
+    文档 id：标题、url、空白归一化后正文的哈希
+
+    标题与 url 也参与哈希：正文相同但来源不同的文档（如同一段公告出现在不同报告中）分别存储，引用时保留各自来源
+    """
+    parts = [" ".join(str(doc.get(field) or "").split()) for field in DOC_FIELDS]
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class DocumentStore:
+    """
+    单次运行的文档存储（内容寻址）
+
+    - put: 存入文档并返回 id（标题、url 与正文的哈希），相同文档只存一份
+    - resolve: 把引用句柄还原为完整文档（句柄字段一并保留），id 不存在时告警并以占位文档保持编号
+    - compact: 把完整文档压缩回引用句柄
+
+    使用方式:
+        store = DocumentStore()
+        config = {"configurable": {"doc_store": store}}
+    """
+
+    def __init__(self):
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.puts = 0
+        self.missing = 0
+
+    def put(self, doc: Dict[str, Any]) -> str:
+        """
+        存入文档
+
+        Args:
+            doc: 包含 title、url、content 的文档，其他字段不存入
+
+        Returns:
+            文档 id
+        """
+        doc_id = _store_key(doc)
+        with self._lock:
+            self.puts += 1
+            if doc_id not in self._docs:
+                self._docs[doc_id] = {field: doc.get(field, "") for field in DOC_FIELDS}
+        return doc_id
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """按 id 取文档，不存在时返回 None"""
+        with self._lock:
+            return self._docs.get(doc_id)
+
+    def resolve(self, refs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        还原引用句柄为完整文档
+
+        Args:
+            refs: 引用句柄列表；已是完整文档（含 content）的条目原样返回
+
+        Returns:
+            与 refs 等长的文档列表，每条为 文档字段 + 句柄字段；找不到的 id 以空正文占位，保证编号不错位
+        """
+        resolved = []
+        for ref in refs:
+            if "content" in ref or "id" not in ref:
+                resolved.append(ref)
+                continue
+            doc = self.get(ref["id"])
+            if doc is None:
+                with self._lock:
+                    self.missing += 1
+                print(f"  > ⚠️ [文档存储] 引用的文档 {ref['id']} 不存在（句柄来自其他运行？），以占位文档代替")
+                doc = {"title": "未知来源", "url": "", "content": ""}
+            resolved.append({**doc, **ref})
+        return resolved
+
+    @staticmethod
+    def compact(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """去掉带 id 条目的文档字段，只保留引用句柄"""
+        return [
+            {k: v for k, v in item.items() if k not in DOC_FIELDS} if "id" in item else item
+            for item in items
+        ]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._docs)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取存储统计
+
+        Returns:
+            documents（去重后文档数）、puts（存入次数）、missing（取回时不存在的 id 次数）、chars（正文总字数）
+        """
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "puts": self.puts,
+                "missing": self.missing,
+                "chars": sum(len(doc["content"]) for doc in self._docs.values()),
+            }
+
+
+def resolve_refs(refs: List[Dict[str, Any]], store: Optional[DocumentStore]) -> List[Dict[str, Any]]:
+    """还原引用句柄；没有文档存储时（状态中是完整文档）原样返回"""
+    if store is None:
+        return list(refs)
+    return store.resolve(refs)
@@ -1,8 +1,17 @@
 import os
+import asyncio
+import threading
+import weakref
 import requests
 import json
-from typing import List, Dict, Any, Optional
+import hashlib
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Any, Optional, Tuple
 from src.utils import load_config
+from src.llms.cassette import get_cassette
+from .circuit_breaker import DEADLINE_EXCEEDED
 # --- 辅助函数：如果未来同学又改回复杂格式，这个还能兜底 ---
 config= load_config()
 def clean_content_text(text: str) -> str:
@@ -14,28 +23,171 @@ def clean_content_text(text: str) -> str:
     return text.strip()
 
 class LightRAGSearch:
-    """LightRAG 搜索客户端封装 (适配 /query/retrieval/report 接口)"""
+    """
+    LightRAG 搜索客户端封装 (适配 /query/retrieval/report 接口)
+    
+    - search: 同步检索，复用 requests.Session 的连接池 (keep-alive)
+    - asearch: 异步检索，基于 httpx.AsyncClient，每个事件循环一个连接池
+    - search_many / asearch_many: 一次检索多个查询（支持批量接口时一次请求，否则有界并发），跨查询去重
+    - set_cache 设置检索结果缓存 (RetrievalCache) 后，相同（归一化后）的检索词直接返回缓存结果
+    - set_circuit_breaker 设置熔断器后，服务故障期间请求立即返回空结果（缓存命中仍正常返回）
+    """
     
     def __init__(self, 
                  base_url: Optional[str] = config.lightrag_url,
                  api_key: Optional[str] = None,
                  # [更新] 默认接口路径改为你测试成功的路径
-                 endpoint: str = "/query/retrieval/report"): 
-        
+                 endpoint: str = "/query/retrieval/report",
+                 pool_size: int = 20,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 60.0,
+                 keepalive_expiry: float = 60.0,
+                 batch_endpoint: Optional[str] = None,
+                 max_concurrency: int = 8): 
+        """
+        Args:
+            base_url: LightRAG 服务地址
+            api_key: 可选的 API Key
+            endpoint: 检索接口路径
+            pool_size: 连接池大小（最大并发连接数），应不小于并发段落数
+            connect_timeout: 建连超时（秒）
+            read_timeout: 读取超时（秒）
+            keepalive_expiry: 异步连接池空闲连接保活时间（秒）
+            batch_endpoint: 批量检索接口路径，None 表示服务端不支持批量，search_many 改为并发请求；
+                            请求体 {"queries": [...], "k": k}，响应为与 queries 等长的结果列表
+                            (或 {"results": [...]})，每项格式同单次检索
+            max_concurrency: search_many 并发请求的上限
+        """
         self.base_url = base_url.rstrip("/")
+        self.endpoint = endpoint
         self.api_url = f"{self.base_url}{endpoint}"
         self.api_key = api_key
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive_expiry = keepalive_expiry
+        self.batch_endpoint = batch_endpoint
+        self.max_concurrency = max_concurrency
+        
+        # 连接池按需创建
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._async_clients = weakref.WeakKeyDictionary()  # 事件循环 -> httpx.AsyncClient
+        self.cache = None
+        self.breaker = None
         
         print(f"  [LightRAG] 初始化完成")
-        print(f"  - 目标接口: {self.api_url}")
+        print(f"  - 目标接口: {self.api_url} (连接池 {pool_size})")
+
+    # =========================================================
+    # 连接池
+    # =========================================================
+    def _get_session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
 
-    def search(self, query: str, max_results: int = 5, timeout: int = 60) -> List[Dict[str, Any]]:
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.pool_size,
+                        max_keepalive_connections=self.pool_size,
+                        keepalive_expiry=self.keepalive_expiry
+                    ),
+                    timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+                )
+                self._async_clients[loop] = client
+            return client
+
+    def set_cache(self, cache) -> None:
         """
-        执行搜索
+        设置检索结果缓存
+        
         Args:
-            query: 搜索词
-            max_results: 返回数量 (对应参数 k)
+            cache: RetrievalCache 实例，None 表示关闭缓存
         """
+        self.cache = cache
+
+    def _cache_get(self, query: str, max_results: int):
+        """查询缓存，返回 (缓存键, 缓存结果)；未设置缓存时键为 None"""
+        if self.cache is None:
+            return None, None
+        key = self.cache.make_key(query, max_results, self.endpoint)
+        cached = self.cache.get(key)
+        if cached is not None:
+            print(f"  > [LightRAG] 命中检索缓存: {query[:15]}... ({len(cached)} 条)")
+        return key, cached
+
+    def _cache_set(self, key: Optional[str], results: List[Dict[str, Any]]) -> None:
+        if key is not None:
+            self.cache.set(key, results)
+
+    def set_circuit_breaker(self, breaker) -> None:
+        """
+        设置熔断器：服务连续失败后请求立即返回空结果，不再等待超时
+        
+        Args:
+            breaker: CircuitBreaker 实例，None 表示关闭熔断
+        """
+        self.breaker = breaker
+
+    @property
+    def available(self) -> bool:
+        """检索服务当前是否可用（未熔断）"""
+        return self.breaker is None or self.breaker.available
+
+    def _breaker_allow(self, what: str) -> bool:
+        if self.breaker is None or self.breaker.allow():
+            return True
+        print(f"  > [LightRAG] 服务熔断中，跳过请求: {what[:15]}...")
+        return False
+
+    def _record_outcome(self, reply: Optional[Dict[str, Any]]) -> None:
+        """把请求结果计入熔断器：连接失败、超时、5xx 与 429 视为失败"""
+        if self.breaker is None:
+            return
+        if reply is None or reply["status"] >= 500 or reply["status"] == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _record_cancelled(self, error: asyncio.CancelledError) -> None:
+        """请求被取消：截止时间到达（DEADLINE_EXCEEDED）计为超时失败，其余取消不计入"""
+        if self.breaker is None:
+            return
+        if DEADLINE_EXCEEDED in error.args:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_cancelled()
+
+    def close(self) -> None:
+        """关闭同步连接池"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环下的异步连接池"""
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    # =========================================================
+    # 检索
+    # =========================================================
+    def _build_request(self, query: str, max_results: int):
+        """构造请求体与请求头"""
         # [更新] 参数构造：根据 curl 命令，使用 'k' 而非 'top_k'
         payload = {
             "query": query,
@@ -49,28 +201,278 @@ class LightRAGSearch:
         # 鉴权处理：如果环境变量或初始化时提供了 Key，则添加
         if self.api_key and self.api_key != "no-key-needed":
              headers["Authorization"] = f"Bearer {self.api_key}"
+        return payload, headers
+
+    def search(self, query: str, max_results: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        执行搜索
+        Args:
+            query: 搜索词
+            max_results: 返回数量 (对应参数 k)
+            timeout: 读取超时（秒），None 时使用 read_timeout
+        """
+        cache_key, cached = self._cache_get(query, max_results)
+        if cached is not None:
+            return cached
+
+        if not self._breaker_allow(query):
+            return []
+
+        payload, headers = self._build_request(query, max_results)
+        timeout = (self.connect_timeout, timeout or self.read_timeout)
 
         try:
             print(f"  > [LightRAG] 正在请求: {query[:15]}... (k={max_results})")
             
-            response = requests.post(
-                self.api_url, 
-                json=payload, 
-                headers=headers, 
-                timeout=timeout
-            )
+            # 配置了 cassette 时录制或回放原始响应（请求键不含 base_url，换部署地址也能回放）
+            cassette = get_cassette()
+            if cassette is not None:
+                key = cassette.make_key("lightrag", self.endpoint, payload)
+                reply = cassette.call("lightrag", key, lambda: self._post(payload, headers, timeout),
+                                      meta={"query": query[:80], "k": max_results})
+            else:
+                reply = self._post(payload, headers, timeout)
             
-            if response.status_code != 200:
-                print(f"  > [LightRAG Error] 状态码 {response.status_code}: {response.text[:200]}")
-                return []
+        except Exception as e:
+            self._record_outcome(None)
+            print(f"  > [LightRAG Exception] 连接失败: {str(e)}")
+            return []
 
-            # 解析返回的 JSON 数据
-            return self._parse_response(response.json())
+        self._record_outcome(reply)
+        results = self._handle_reply(reply)
+        self._cache_set(cache_key, results)
+        return results
+
+    async def asearch(self, query: str, max_results: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        执行搜索（异步版），参数与返回值同 search
+        """
+        cache_key, cached = self._cache_get(query, max_results)
+        if cached is not None:
+            return cached
+
+        if not self._breaker_allow(query):
+            return []
+
+        payload, headers = self._build_request(query, max_results)
 
+        try:
+            print(f"  > [LightRAG] 正在请求: {query[:15]}... (k={max_results})")
+            
+            cassette = get_cassette()
+            if cassette is not None:
+                key = cassette.make_key("lightrag", self.endpoint, payload)
+                reply = await cassette.acall("lightrag", key, lambda: self._apost(payload, headers, timeout),
+                                             meta={"query": query[:80], "k": max_results})
+            else:
+                reply = await self._apost(payload, headers, timeout)
+            
+        except asyncio.CancelledError as e:
+            self._record_cancelled(e)
+            raise
         except Exception as e:
-            print(f"  > [LightRAG Exception] 连接失败: {str(e)}")
+            self._record_outcome(None)
+            print(f"  > [LightRAG Exception] 连接失败: {e.__class__.__name__}: {e}")
             return []
 
+        self._record_outcome(reply)
+        results = self._handle_reply(reply)
+        self._cache_set(cache_key, results)
+        return results
+
+    def _post(self, payload: Dict[str, Any], headers: Dict[str, str], timeout,
+              url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        发送检索请求
+        
+        Returns:
+            {"status": 状态码, "data": 响应 JSON (非 200 时为 None), "text": 非 200 时的响应文本}
+        """
+        response = self._get_session().post(
+            url or self.api_url, 
+            json=payload, 
+            headers=headers, 
+            timeout=timeout
+        )
+        if response.status_code != 200:
+            return {"status": response.status_code, "data": None, "text": response.text[:200]}
+        return {"status": 200, "data": response.json(), "text": ""}
+
+    async def _apost(self, payload: Dict[str, Any], headers: Dict[str, str],
+                     timeout: Optional[float], url: Optional[str] = None) -> Dict[str, Any]:
+        """发送异步检索请求，返回格式同 _post"""
+        kwargs = {}
+        if timeout:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=self.connect_timeout)
+        response = await self._get_async_client().post(
+            url or self.api_url, json=payload, headers=headers, **kwargs
+        )
+        if response.status_code != 200:
+            return {"status": response.status_code, "data": None, "text": response.text[:200]}
+        return {"status": 200, "data": response.json(), "text": ""}
+
+    def _handle_reply(self, reply: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """检查状态码并解析结果"""
+        if reply["status"] != 200:
+            print(f"  > [LightRAG Error] 状态码 {reply['status']}: {reply['text'][:200]}")
+            return []
+
+        # 解析返回的 JSON 数据
+        return self._parse_response(reply["data"])
+
+    # =========================================================
+    # 多查询检索
+    # =========================================================
+    def search_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                    dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        一次检索多个查询（如一份报告所有段落的首轮检索）
+        
+        配置了批量接口时只发一次请求（缓存命中的查询不再请求），否则以 max_concurrency 为上限并发检索
+        
+        Args:
+            queries: 检索词列表，重复的检索词只检索一次
+            max_results: 每个查询的返回数量
+            timeout: 读取超时（秒），None 时使用 read_timeout
+            dedupe: 是否跨查询去重（同一文档只保留在得分最高的查询下）
+        
+        Returns:
+            {检索词: 结果列表}，顺序同 queries
+        """
+        unique = _unique_queries(queries)
+        results = None
+        if unique and self.batch_endpoint:
+            results = self._search_batch(unique, max_results, timeout)
+        if results is None:
+            workers = max(1, min(self.max_concurrency, len(unique)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lightrag") as executor:
+                fetched = executor.map(lambda q: self.search(q, max_results, timeout), unique)
+                results = dict(zip(unique, fetched))
+        return _finish_many(unique, results, dedupe)
+
+    async def asearch_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                           dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        一次检索多个查询（异步版），参数与返回值同 search_many
+        """
+        unique = _unique_queries(queries)
+        results = None
+        if unique and self.batch_endpoint:
+            results = await self._asearch_batch(unique, max_results, timeout)
+        if results is None:
+            semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+            
+            async def one(query: str):
+                async with semaphore:
+                    return await self.asearch(query, max_results, timeout)
+            
+            fetched = await asyncio.gather(*[one(q) for q in unique])
+            results = dict(zip(unique, fetched))
+        return _finish_many(unique, results, dedupe)
+
+    def _search_batch(self, queries: List[str], max_results: int, timeout: Optional[float]):
+        """
+        通过批量接口检索，返回 {检索词: 结果}；接口不可用时返回 None，由调用方改为并发检索
+        """
+        results, misses, keys = self._batch_cache_get(queries, max_results)
+        if not misses:
+            return results
+        if not self._breaker_allow(f"批量 {len(misses)} 个查询"):
+            return None
+        
+        payload, headers = self._build_batch_request(misses, max_results)
+        timeout = (self.connect_timeout, timeout or self.read_timeout)
+        try:
+            print(f"  > [LightRAG] 批量请求 {len(misses)} 个查询 (k={max_results})")
+            cassette = get_cassette()
+            if cassette is not None:
+                key = cassette.make_key("lightrag", self.batch_endpoint, payload)
+                reply = cassette.call("lightrag", key, lambda: self._post(payload, headers, timeout, self._batch_url()),
+                                      meta={"queries": len(misses), "k": max_results})
+            else:
+                reply = self._post(payload, headers, timeout, self._batch_url())
+        except Exception as e:
+            self._record_outcome(None)
+            print(f"  > [LightRAG Exception] 批量请求失败，改为并发请求: {str(e)}")
+            return None
+        self._record_outcome(reply)
+        return self._handle_batch_reply(reply, misses, keys, results)
+
+    async def _asearch_batch(self, queries: List[str], max_results: int, timeout: Optional[float]):
+        """通过批量接口检索（异步版），返回值同 _search_batch"""
+        results, misses, keys = self._batch_cache_get(queries, max_results)
+        if not misses:
+            return results
+        if not self._breaker_allow(f"批量 {len(misses)} 个查询"):
+            return None
+        
+        payload, headers = self._build_batch_request(misses, max_results)
+        try:
+            print(f"  > [LightRAG] 批量请求 {len(misses)} 个查询 (k={max_results})")
+            cassette = get_cassette()
+            if cassette is not None:
+                key = cassette.make_key("lightrag", self.batch_endpoint, payload)
+                reply = await cassette.acall("lightrag", key,
+                                             lambda: self._apost(payload, headers, timeout, self._batch_url()),
+                                             meta={"queries": len(misses), "k": max_results})
+            else:
+                reply = await self._apost(payload, headers, timeout, self._batch_url())
+        except asyncio.CancelledError as e:
+            self._record_cancelled(e)
+            raise
+        except Exception as e:
+            self._record_outcome(None)
+            print(f"  > [LightRAG Exception] 批量请求失败，改为并发请求: {e.__class__.__name__}: {e}")
+            return None
+        self._record_outcome(reply)
+        return self._handle_batch_reply(reply, misses, keys, results)
+
+    def _batch_url(self) -> str:
+        return f"{self.base_url}{self.batch_endpoint}"
+
+    def _build_batch_request(self, queries: List[str], max_results: int):
+        payload, headers = self._build_request("", max_results)
+        payload.pop("query")
+        payload["queries"] = queries
+        return payload, headers
+
+    def _batch_cache_get(self, queries: List[str], max_results: int):
+        """批量检索前先查缓存，返回 (命中结果, 未命中的检索词, 未命中检索词的缓存键)"""
+        results, misses, keys = {}, [], {}
+        for query in queries:
+            key, cached = self._cache_get(query, max_results)
+            if cached is not None:
+                results[query] = cached
+            else:
+                misses.append(query)
+                keys[query] = key
+        return results, misses, keys
+
+    def _handle_batch_reply(self, reply: Dict[str, Any], misses: List[str],
+                            keys: Dict[str, Optional[str]], results: Dict[str, List[Dict[str, Any]]]):
+        """解析批量响应并写入缓存；响应不可用时返回 None"""
+        if reply["status"] in (404, 405):
+            # 服务端没有批量接口，之后直接并发请求
+            print(f"  > [LightRAG] 批量接口不可用 (状态码 {reply['status']})，改为并发请求")
+            self.batch_endpoint = None
+            return None
+        if reply["status"] != 200:
+            print(f"  > [LightRAG Error] 批量请求状态码 {reply['status']}: {reply['text'][:200]}，改为并发请求")
+            return None
+        
+        data = reply["data"]
+        if isinstance(data, dict):
+            data = data.get("results")
+        if not isinstance(data, list) or len(data) != len(misses):
+            print("  > [LightRAG Error] 批量响应格式不符，改为并发请求")
+            return None
+        
+        for query, item in zip(misses, data):
+            parsed = self._parse_response(item)
+            results[query] = parsed
+            self._cache_set(keys[query], parsed)
+        return results
+
     def _parse_response(self, data: Any) -> List[Dict[str, Any]]:
         """
         解析并标准化返回结果
@@ -118,7 +520,55 @@ class LightRAGSearch:
 
         print(f"  > [LightRAG] 成功解析 {len(results)} 条有效内容")
         return results
-def light_rag_search(query: str, max_results: int = 5, timeout: int = 60, 
+def _unique_queries(queries: List[str]) -> List[str]:
+    """去掉空检索词与重复检索词，保持顺序"""
+    return list(dict.fromkeys(q for q in queries if q and q.strip()))
+
+def _doc_key(item: Dict[str, Any]) -> str:
+    """文档去重键：空白归一化后的正文哈希（LightRAG 的 url 多为占位值，不能用于去重）"""
+    content = " ".join((item.get("content") or "").split())
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def dedupe_across_queries(results: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    跨查询去重：同一文档出现在多个查询的结果中时，只保留在得分最高的查询下（同分保留在靠前的查询下）
+    
+    Args:
+        results: {检索词: 结果列表}
+    
+    Returns:
+        去重后的 {检索词: 结果列表}
+    """
+    best: Dict[str, Tuple[float, int]] = {}
+    for index, items in enumerate(results.values()):
+        for item in items:
+            key = _doc_key(item)
+            score = item.get("score", 0.0)
+            if key not in best or score > best[key][0]:
+                best[key] = (score, index)
+    
+    deduped = {}
+    for index, (query, items) in enumerate(results.items()):
+        kept, seen = [], set()
+        for item in items:
+            key = _doc_key(item)
+            if best[key][1] == index and key not in seen:
+                kept.append(item)
+                seen.add(key)
+        deduped[query] = kept
+    
+    dropped = sum(len(items) for items in results.values()) - sum(len(items) for items in deduped.values())
+    if dropped:
+        print(f"  > [检索] 跨查询去重: 移除 {dropped} 条重复文档")
+    return deduped
+
+def _finish_many(queries: List[str], results: Dict[str, List[Dict[str, Any]]], dedupe: bool):
+    ordered = {q: results.get(q, []) for q in queries}
+    return dedupe_across_queries(ordered) if dedupe else ordered
+
+_default_client: Optional[LightRAGSearch] = None
+
+def light_rag_search(query: str, max_results: int = 5, timeout: Optional[float] = None, 
                      api_key: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     便捷的 LightRAG 搜索函数
@@ -130,7 +580,14 @@ def light_rag_search(query: str, max_results: int = 5, timeout: int = 60,
     Returns:
         标准化的搜索结果列表
     """
-    client = LightRAGSearch()
+    global _default_client
+    if api_key is not None:
+        client = LightRAGSearch(api_key=api_key)
+    else:
+        # 复用同一个客户端，连续调用共享连接池
+        if _default_client is None:
+            _default_client = LightRAGSearch()
+        client = _default_client
     return client.search(query=query, max_results=max_results, timeout=timeout)
 # ==========================================
 # 自测代码 (直接运行此文件可测试)
@@ -0,0 +1,396 @@
+"""
+本地 BM25 检索
+对 TARGET_FILES 中的本地文件 (PDF/TXT/MD) 建立倒排索引，无需 LightRAG 服务即可检索；
+索引以 .npy 文件持久化并按内存映射 (mmap) 加载，打分用 NumPy 向量化计算
+"""
+
+import os
+import glob
+import json
+import math
+import time
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+import numpy as np
+
+from .lightrag_search import dedupe_across_queries
+
+INDEX_FORMAT_VERSION = 1
+TEXT_SUFFIXES = (".txt", ".md")
+PDF_SUFFIXES = (".pdf",)
+
+
+# ==========================================
+# 分词
+# ==========================================
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF
+            or 0xF900 <= code <= 0xFAFF or 0x20000 <= code <= 0x2FFFF)
+
+
+def tokenize(text: str, ngram: int = 2) -> List[str]:
+    """
+    中文感知的分词：中文连续片段切成字 n-gram (1..ngram)，英文与数字按词切分
+
+    "宁德时代2024年营收" -> 宁 德 时 代 宁德 德时 时代 2024 年 营 收 年营 营收
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens: List[str] = []
+    run: List[str] = []
+    word: List[str] = []
+
+    def flush_run():
+        if run:
+            for n in range(1, ngram + 1):
+                tokens.extend("".join(run[i:i + n]) for i in range(len(run) - n + 1))
+            run.clear()
+
+    def flush_word():
+        if word:
+            tokens.append("".join(word))
+            word.clear()
+
+    for ch in text:
+        if _is_cjk(ch):
+            flush_word()
+            run.append(ch)
+        elif ch.isalnum() or (ch == "." and word and word[-1].isdigit()):
+            flush_run()
+            word.append(ch)
+        else:
+            flush_run()
+            flush_word()
+    flush_run()
+    flush_word()
+    return tokens
+
+
+# ==========================================
+# 文档读取与切片
+# ==========================================
+
+def expand_sources(sources: Iterable[str]) -> List[str]:
+    """展开文件 / 目录 / 通配符为支持的文件列表"""
+    files = []
+    for source in sources or []:
+        if os.path.isdir(source):
+            candidates = glob.glob(os.path.join(source, "**", "*"), recursive=True)
+        else:
+            candidates = glob.glob(source) or [source]
+        for path in sorted(candidates):
+            if os.path.isfile(path) and path.lower().endswith(TEXT_SUFFIXES + PDF_SUFFIXES):
+                files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def read_document(path: str) -> str:
+    """读取文本；PDF 需要安装 pypdf，未安装时跳过"""
+    if path.lower().endswith(PDF_SUFFIXES):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            print(f"⚠️ 未安装 pypdf，跳过 PDF 文件: {path} (pip install pypdf)")
+            return ""
+        reader = PdfReader(path)
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+    for encoding in ("utf-8", "gbk"):
+        try:
+            with open(path, "r", encoding=encoding) as f:
+                return f.read()
+        except UnicodeDecodeError:
+            continue
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def split_passages(text: str, chunk_chars: int = 500, overlap: int = 100) -> List[str]:
+    """按段落切片，段落累积到 chunk_chars 左右；超长段落按滑动窗口切分"""
+    passages: List[str] = []
+    buffer = ""
+    step = max(1, chunk_chars - overlap)
+    for paragraph in (p.strip() for p in text.splitlines()):
+        if not paragraph:
+            continue
+        if len(paragraph) > chunk_chars:
+            if buffer:
+                passages.append(buffer)
+                buffer = ""
+            for start in range(0, len(paragraph), step):
+                passages.append(paragraph[start:start + chunk_chars])
+                if start + chunk_chars >= len(paragraph):
+                    break
+            continue
+        if buffer and len(buffer) + len(paragraph) + 1 > chunk_chars:
+            passages.append(buffer)
+            buffer = ""
+        buffer = f"{buffer}\n{paragraph}" if buffer else paragraph
+    if buffer:
+        passages.append(buffer)
+    return passages
+
+
+# ==========================================
+# 检索客户端
+# ==========================================
+
+class LocalBM25Search:
+    """
+    本地 BM25 检索客户端，search / asearch / search_many 的参数与返回格式同 LightRAGSearch
+
+    索引目录结构:
+        meta.json       参数、文档数、平均长度与源文件指纹（源文件变化时自动重建）
+        vocab.json      词 -> 词 id
+        docs.jsonl      每个片段的 title / url / content
+        indptr.npy      CSR 倒排表行指针 (词 id -> postings 区间)
+        doc_ids.npy     postings 的文档 id
+        tfs.npy         postings 的词频
+        doc_len.npy     文档长度
+
+    使用方式:
+        rag_tool = LocalBM25Search(".cache/bm25_index", sources=config.target_files)
+        rag_tool.search("宁德时代 产能", max_results=5)
+    """
+
+    def __init__(self, index_dir: str = ".cache/bm25_index",
+                 sources: Optional[Iterable[str]] = None,
+                 chunk_chars: int = 500,
+                 chunk_overlap: int = 100,
+                 ngram: int = 2,
+                 k1: float = 1.5,
+                 b: float = 0.75,
+                 hot_cache_size: int = 256):
+        """
+        Args:
+            index_dir: 索引目录
+            sources: 源文件 / 目录 / 通配符列表，None 表示只加载已有索引
+            chunk_chars: 片段长度（字符）
+            chunk_overlap: 超长段落切分时的重叠长度
+            ngram: 中文字 n-gram 的最大 n
+            k1, b: BM25 参数
+            hot_cache_size: 热点查询结果的内存缓存条数
+        """
+        self.index_dir = index_dir
+        self.sources = list(sources) if sources is not None else None
+        self.chunk_chars = chunk_chars
+        self.chunk_overlap = chunk_overlap
+        self.ngram = ngram
+        self.k1 = k1
+        self.b = b
+        self.hot_cache_size = hot_cache_size
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._hot: "OrderedDict[Tuple[str, int], List[Dict[str, Any]]]" = OrderedDict()
+
+        print(f"  [BM25] 本地检索索引: {index_dir}")
+
+    # =========================================================
+    # 建索引
+    # =========================================================
+    def _fingerprint(self, files: List[str]) -> str:
+        parts = [[path, os.path.getsize(path), int(os.path.getmtime(path))] for path in files]
+        raw = json.dumps([INDEX_FORMAT_VERSION, self.chunk_chars, self.chunk_overlap, self.ngram, parts])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.index_dir, "meta.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def is_stale(self) -> bool:
+        """索引不存在，或源文件 / 切片参数与建索引时不同"""
+        meta = self._read_meta()
+        if meta is None:
+            return True
+        if self.sources is None:
+            return False
+        return meta.get("fingerprint") != self._fingerprint(expand_sources(self.sources))
+
+    def build(self) -> int:
+        """
+        从 sources 重建索引
+
+        Returns:
+            片段数
+        """
+        files = expand_sources(self.sources or [])
+        start = time.monotonic()
+
+        docs: List[Dict[str, str]] = []
+        for path in files:
+            name = os.path.basename(path)
+            for i, passage in enumerate(split_passages(read_document(path), self.chunk_chars, self.chunk_overlap)):
+                docs.append({"title": f"{name} #{i + 1}", "url": f"{path}#{i + 1}", "content": passage})
+
+        vocab: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        doc_len = np.zeros(len(docs), dtype=np.float32)
+        for doc_id, doc in enumerate(docs):
+            counts = Counter(tokenize(f"{doc['title']}\n{doc['content']}", self.ngram))
+            doc_len[doc_id] = sum(counts.values())
+            for token, tf in counts.items():
+                token_id = vocab.get(token)
+                if token_id is None:
+                    token_id = vocab[token] = len(postings)
+                    postings.append([])
+                postings[token_id].append((doc_id, tf))
+
+        indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(p) for p in postings])
+        doc_ids = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=int(indptr[-1]))
+        tfs = np.fromiter((tf for p in postings for _, tf in p), dtype=np.float32, count=int(indptr[-1]))
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        np.save(os.path.join(self.index_dir, "indptr.npy"), indptr)
+        np.save(os.path.join(self.index_dir, "doc_ids.npy"), doc_ids)
+        np.save(os.path.join(self.index_dir, "tfs.npy"), tfs)
+        np.save(os.path.join(self.index_dir, "doc_len.npy"), doc_len)
+        with open(os.path.join(self.index_dir, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False)
+        with open(os.path.join(self.index_dir, "docs.jsonl"), "w", encoding="utf-8") as f:
+            for doc in docs:
+                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+        # meta 最后写入，中途失败时索引视为不存在
+        with open(os.path.join(self.index_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "format": INDEX_FORMAT_VERSION,
+                "fingerprint": self._fingerprint(files),
+                "files": files,
+                "n_docs": len(docs),
+                "avgdl": float(doc_len.mean()) if len(docs) else 0.0,
+            }, f, ensure_ascii=False)
+
+        with self._lock:
+            self._loaded = False
+            self._hot.clear()
+        print(f"  [BM25] 已索引 {len(files)} 个文件、{len(docs)} 个片段、{len(vocab)} 个词，"
+              f"耗时 {time.monotonic() - start:.1f}s")
+        return len(docs)
+
+    def ensure_index(self) -> None:
+        """索引缺失或过期时重建"""
+        if self.sources is not None and self.is_stale():
+            self.build()
+
+    # =========================================================
+    # 加载
+    # =========================================================
+    def _load(self) -> None:
+        """按需加载索引：postings 以 mmap 方式打开，只有查询用到的区间才会读入内存"""
+        with self._lock:
+            if self._loaded:
+                return
+            meta = self._read_meta()
+            if meta is None:
+                raise FileNotFoundError(f"BM25 索引不存在: {self.index_dir}")
+
+            path = lambda name: os.path.join(self.index_dir, name)
+            self._indptr = np.load(path("indptr.npy"), mmap_mode="r")
+            self._doc_ids = np.load(path("doc_ids.npy"), mmap_mode="r")
+            self._tfs = np.load(path("tfs.npy"), mmap_mode="r")
+            doc_len = np.load(path("doc_len.npy"))
+            with open(path("vocab.json"), "r", encoding="utf-8") as f:
+                self._vocab: Dict[str, int] = json.load(f)
+            with open(path("docs.jsonl"), "r", encoding="utf-8") as f:
+                self._docs = [json.loads(line) for line in f if line.strip()]
+
+            self._n_docs = meta["n_docs"]
+            avgdl = meta["avgdl"] or 1.0
+            # BM25 长度归一化项 k1 * (1 - b + b * dl / avgdl)，按文档预先算好
+            self._norm = (self.k1 * (1 - self.b + self.b * doc_len / avgdl)).astype(np.float32)
+            self._loaded = True
+
+    # =========================================================
+    # 检索
+    # =========================================================
+    def _score(self, query: str) -> np.ndarray:
+        counts = Counter(tokenize(query, self.ngram))
+        scores = np.zeros(self._n_docs, dtype=np.float32)
+        ids, contribs = [], []
+        for token, qtf in counts.items():
+            token_id = self._vocab.get(token)
+            if token_id is None:
+                continue
+            start, end = int(self._indptr[token_id]), int(self._indptr[token_id + 1])
+            df = end - start
+            idf = math.log(1 + (self._n_docs - df + 0.5) / (df + 0.5))
+            docs = np.asarray(self._doc_ids[start:end])
+            tf = np.asarray(self._tfs[start:end])
+            ids.append(docs)
+            contribs.append(qtf * idf * tf * (self.k1 + 1) / (tf + self._norm[docs]))
+        if ids:
+            scores += np.bincount(np.concatenate(ids), weights=np.concatenate(contribs),
+                                  minlength=self._n_docs).astype(np.float32)
+        return scores
+
+    def search(self, query: str, max_results: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        执行检索
+
+        Args:
+            query: 检索词
+            max_results: 返回数量
+            timeout: 兼容 LightRAGSearch 的参数，本地检索不使用
+
+        Returns:
+            结果列表，每项包含 title / url / content / score
+        """
+        key = (query, max_results)
+        with self._lock:
+            if key in self._hot:
+                self._hot.move_to_end(key)
+                return self._hot[key]
+
+        try:
+            self._load()
+        except FileNotFoundError as e:
+            print(f"  > [BM25 Error] {e}")
+            return []
+        if self._n_docs == 0:
+            return []
+
+        scores = self._score(query)
+        k = min(max_results, self._n_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = [
+            {**self._docs[i], "score": float(scores[i])}
+            for i in top if scores[i] > 0 and len(self._docs[i]["content"]) >= 10
+        ]
+
+        with self._lock:
+            self._hot[key] = results
+            while len(self._hot) > self.hot_cache_size:
+                self._hot.popitem(last=False)
+        print(f"  > [BM25] {query[:15]}... 命中 {len(results)} 条")
+        return results
+
+    async def asearch(self, query: str, max_results: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """执行检索（异步版）；首次调用需要加载索引时在线程池中执行"""
+        if not self._loaded:
+            return await asyncio.to_thread(self.search, query, max_results, timeout)
+        return self.search(query, max_results, timeout)
+
+    def search_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                    dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """一次检索多个查询，参数与返回值同 LightRAGSearch.search_many"""
+        unique = list(dict.fromkeys(q for q in queries if q and q.strip()))
+        results = {q: self.search(q, max_results) for q in unique}
+        return dedupe_across_queries(results) if dedupe else results
+
+    async def asearch_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                           dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """一次检索多个查询（异步版）"""
+        if not self._loaded:
+            return await asyncio.to_thread(self.search_many, queries, max_results, timeout, dedupe)
+        return self.search_many(queries, max_results, timeout, dedupe)
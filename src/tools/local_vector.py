@@ -0,0 +1,415 @@
+"""
+本地向量检索
+片段向量以 float16 / int8 矩阵存放在文件中并按内存映射 (mmap) 读取；
+小语料暴力检索，大语料使用 IVF（聚类倒排）只扫描最近的若干个簇
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Iterable, Callable
+
+import numpy as np
+
+from .lightrag_search import dedupe_across_queries
+from .local_bm25 import tokenize, expand_sources, read_document, split_passages
+
+# 向量化函数: 文本列表 -> (n, dim) 矩阵
+Embedder = Callable[[List[str]], np.ndarray]
+
+# 暴力检索时每批读取的行数，限制峰值内存
+SCAN_BATCH_ROWS = 65536
+
+
+def hash_embedding(dim: int = 256, ngram: int = 2) -> Embedder:
+    """
+    确定性的哈希向量化（特征哈希 + 符号哈希），不依赖模型，用于测试与无向量服务的部署
+
+    Args:
+        dim: 向量维度
+        ngram: 中文字 n-gram 的最大 n
+    """
+    def embed(texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text, ngram):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                matrix[row, value % dim] += 1.0 if (value >> 63) & 1 else -1.0
+        return matrix
+
+    embed.__name__ = f"hash_embedding_{dim}"
+    return embed
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _kmeans(vectors: np.ndarray, n_lists: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """球面 k-means（向量已归一化，按内积分配），返回 (n_lists, dim) 质心"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+@dataclass(frozen=True)
+class _IndexView:
+    """
+    某一时刻已加载索引的只读视图
+
+    检索全程使用同一个视图，add / build_ivf 重建视图时不会改动进行中的检索所读取的数组
+    """
+    count: int
+    docs: List[Dict[str, Any]]
+    matrix: Optional[np.ndarray]
+    scales: Optional[np.ndarray]
+    centroids: Optional[np.ndarray]
+    ivf_lists: List[np.ndarray]
+    stale_rows: Optional[np.ndarray]
+
+    def rows(self, rows: np.ndarray) -> np.ndarray:
+        """读取若干行并反量化为 float32"""
+        vectors = np.asarray(self.matrix[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= np.asarray(self.scales[rows])[:, None]
+        return vectors
+
+
+class LocalVectorSearch:
+    """
+    本地向量检索客户端，search / asearch / search_many 的参数与返回格式同 LightRAGSearch
+
+    索引目录结构:
+        meta.json           维度、存储类型、条数、已索引的文件
+        docs.jsonl          每个片段的 title / url / content（追加写入）
+        vectors.bin         (n, dim) 向量矩阵，float16 或 int8（追加写入）
+        scales.bin          int8 存储时每行的反量化系数 (float32)
+        ivf_centroids.npy   IVF 质心
+        ivf_assign.bin      每个向量所属的簇 (int32，追加写入)
+
+    - 启动时不读取矩阵，首次检索才以 mmap 方式打开
+    - add / index_files 增量追加；追加的向量分配到已有的最近质心，条数超过训练时的 2 倍再重新聚类
+    - 条数不少于 ivf_threshold 时使用 IVF，否则暴力检索
+
+    使用方式:
+        rag_tool = LocalVectorSearch(".cache/vector_index", embedder=my_embed, dim=1024)
+        rag_tool.index_files(config.target_files)
+        rag_tool.search("宁德时代 产能", max_results=5)
+    """
+
+    def __init__(self, index_dir: str = ".cache/vector_index",
+                 embedder: Optional[Embedder] = None,
+                 dim: int = 256,
+                 dtype: str = "float16",
+                 ivf_threshold: int = 50000,
+                 n_lists: Optional[int] = None,
+                 n_probe: int = 8,
+                 chunk_chars: int = 500,
+                 chunk_overlap: int = 100,
+                 embed_batch_size: int = 64):
+        """
+        Args:
+            index_dir: 索引目录
+            embedder: 向量化函数，None 时使用 hash_embedding(dim)
+            dim: 向量维度（需与 embedder 输出一致）
+            dtype: 向量存储类型，"float16" 或 "int8"
+            ivf_threshold: 启用 IVF 的最少条数
+            n_lists: IVF 簇数，None 时取 sqrt(条数)
+            n_probe: 每次检索扫描的簇数
+            chunk_chars: index_files 切片长度（字符）
+            chunk_overlap: 超长段落切分时的重叠长度
+            embed_batch_size: 每次调用 embedder 的文本数
+        """
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"不支持的向量存储类型: {dtype}")
+        self.index_dir = index_dir
+        self.embedder = embedder or hash_embedding(dim)
+        self.dim = dim
+        self.dtype = dtype
+        self.ivf_threshold = ivf_threshold
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.chunk_chars = chunk_chars
+        self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+
+        self._lock = threading.RLock()
+        self._view: Optional[_IndexView] = None
+        os.makedirs(index_dir, exist_ok=True)
+        self._meta = self._read_meta()
+        if self._meta["dim"] != dim or self._meta["dtype"] != dtype:
+            raise ValueError(
+                f"向量索引参数不一致: 索引为 dim={self._meta['dim']}/{self._meta['dtype']}，"
+                f"当前为 dim={dim}/{dtype}，请更换 index_dir 或删除旧索引"
+            )
+
+        print(f"  [Vector] 本地向量索引: {index_dir} ({self._meta['count']} 条, {dtype})")
+
+    # =========================================================
+    # 文件与元数据
+    # =========================================================
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _read_meta(self) -> Dict[str, Any]:
+        if not os.path.exists(self._path("meta.json")):
+            return {"dim": self.dim, "dtype": self.dtype, "count": 0, "ivf_trained_on": 0, "files": {}}
+        with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self) -> None:
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._meta, f, ensure_ascii=False)
+        os.replace(tmp, self._path("meta.json"))
+
+    @property
+    def count(self) -> int:
+        return self._meta["count"]
+
+    # =========================================================
+    # 写入
+    # =========================================================
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        parts = [
+            np.asarray(self.embedder(texts[i:i + self.embed_batch_size]), dtype=np.float32)
+            for i in range(0, len(texts), self.embed_batch_size)
+        ]
+        matrix = np.concatenate(parts) if parts else np.zeros((0, self.dim), dtype=np.float32)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"embedder 输出维度 {matrix.shape[1]} 与索引维度 {self.dim} 不一致")
+        return _normalize(matrix)
+
+    def add(self, docs: List[Dict[str, Any]]) -> int:
+        """
+        追加片段
+
+        Args:
+            docs: 片段列表，每项包含 title / url / content
+
+        Returns:
+            追加的条数
+        """
+        docs = [d for d in docs if len(d.get("content") or "") >= 10]
+        if not docs:
+            return 0
+        vectors = self._embed([f"{d.get('title', '')}\n{d['content']}" for d in docs])
+
+        with self._lock:
+            if self.dtype == "int8":
+                scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+                stored = np.round(vectors / scales[:, None]).astype(np.int8)
+                with open(self._path("scales.bin"), "ab") as f:
+                    f.write(scales.astype(np.float32).tobytes())
+            else:
+                stored = vectors.astype(np.float16)
+            with open(self._path("vectors.bin"), "ab") as f:
+                f.write(stored.tobytes())
+            with open(self._path("docs.jsonl"), "a", encoding="utf-8") as f:
+                for d in docs:
+                    f.write(json.dumps({"title": str(d.get("title", "本地文档")),
+                                        "url": str(d.get("url", "local_vector")),
+                                        "content": d["content"]}, ensure_ascii=False) + "\n")
+
+            # 已有 IVF 时把新向量分配到最近的质心
+            if self._meta["ivf_trained_on"]:
+                centroids = np.load(self._path("ivf_centroids.npy"))
+                assign = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+                with open(self._path("ivf_assign.bin"), "ab") as f:
+                    f.write(assign.tobytes())
+
+            self._meta["count"] += len(docs)
+            self._write_meta()
+            self._view = None
+
+            count = self._meta["count"]
+            trained_on = self._meta["ivf_trained_on"]
+            if count >= self.ivf_threshold and (not trained_on or count > 2 * trained_on):
+                self.build_ivf()
+        return len(docs)
+
+    def index_files(self, sources: Iterable[str]) -> int:
+        """
+        增量索引本地文件：只处理新增或有变化的文件（有变化的文件重新追加，旧片段保留但不再返回）
+
+        Returns:
+            追加的片段数
+        """
+        added = 0
+        start = time.monotonic()
+        for path in expand_sources(sources):
+            stamp = [os.path.getsize(path), int(os.path.getmtime(path))]
+            if self._meta["files"].get(path, {}).get("stamp") == stamp:
+                continue
+            name = os.path.basename(path)
+            passages = split_passages(read_document(path), self.chunk_chars, self.chunk_overlap)
+            first = self.count
+            n = self.add([
+                {"title": f"{name} #{i + 1}", "url": f"{path}#{i + 1}", "content": p}
+                for i, p in enumerate(passages)
+            ])
+            with self._lock:
+                self._meta["files"][path] = {"stamp": stamp, "range": [first, first + n]}
+                self._write_meta()
+            added += n
+        if added:
+            print(f"  [Vector] 追加 {added} 个片段，耗时 {time.monotonic() - start:.1f}s")
+        return added
+
+    def build_ivf(self, n_iter: int = 10, sample_size: int = 100000) -> None:
+        """重新训练 IVF 质心并分配全部向量"""
+        with self._lock:
+            view = self._load()
+            count = view.count
+            n_lists = self.n_lists or max(1, int(np.sqrt(count)))
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(count, min(count, sample_size), replace=False))
+            centroids = _kmeans(view.rows(sample), n_lists, n_iter)
+
+            assign = np.empty(count, dtype=np.int32)
+            for start in range(0, count, SCAN_BATCH_ROWS):
+                rows = np.arange(start, min(count, start + SCAN_BATCH_ROWS))
+                assign[rows] = np.argmax(view.rows(rows) @ centroids.T, axis=1)
+
+            np.save(self._path("ivf_centroids.npy"), centroids.astype(np.float32))
+            with open(self._path("ivf_assign.bin"), "wb") as f:
+                f.write(assign.tobytes())
+            self._meta["ivf_trained_on"] = count
+            self._write_meta()
+            self._view = None
+            print(f"  [Vector] IVF 聚类完成: {count} 条 → {n_lists} 个簇")
+
+    # =========================================================
+    # 加载
+    # =========================================================
+    def _load(self) -> "_IndexView":
+        """
+        按需加载：向量矩阵以 mmap 打开，检索时只读取用到的行
+
+        Returns:
+            当前索引的只读视图；add / build_ivf 之后重新加载，已取得视图的检索不受影响
+        """
+        with self._lock:
+            if self._view is not None:
+                return self._view
+            count = self.count
+            docs: List[Dict[str, Any]] = []
+            matrix = scales = centroids = None
+            ivf_lists: List[np.ndarray] = []
+            if count:
+                with open(self._path("docs.jsonl"), "r", encoding="utf-8") as f:
+                    docs = [json.loads(line) for line in f if line.strip()][:count]
+                matrix = np.memmap(self._path("vectors.bin"), dtype=np.dtype(self.dtype),
+                                   mode="r", shape=(count, self.dim))
+                if self.dtype == "int8":
+                    scales = np.memmap(self._path("scales.bin"), dtype=np.float32,
+                                       mode="r", shape=(count,))
+            if self._meta["ivf_trained_on"] and count:
+                centroids = np.load(self._path("ivf_centroids.npy"))
+                assign = np.fromfile(self._path("ivf_assign.bin"), dtype=np.int32, count=count)
+                order = np.argsort(assign, kind="stable")
+                bounds = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+                ivf_lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(centroids))]
+            self._view = _IndexView(count, docs, matrix, scales, centroids, ivf_lists,
+                                    self._stale_row_mask(docs, count))
+            return self._view
+
+    def _stale_row_mask(self, docs: List[Dict[str, Any]], count: int) -> Optional[np.ndarray]:
+        """文件更新后重新追加的片段替代旧片段：属于已索引文件、但不在该文件当前区间内的行视为过期"""
+        files = self._meta["files"]
+        if not files:
+            return None
+        stale = np.zeros(count, dtype=bool)
+        for row, doc in enumerate(docs):
+            info = files.get(doc["url"].rsplit("#", 1)[0])
+            if info is not None:
+                first, end = info["range"]
+                stale[row] = not first <= row < end
+        return stale if stale.any() else None
+
+    # =========================================================
+    # 检索
+    # =========================================================
+    def _candidates(self, view: "_IndexView", query_vec: np.ndarray) -> Optional[np.ndarray]:
+        """IVF 候选行；未启用 IVF 时返回 None（暴力检索）"""
+        if view.centroids is None or view.count < self.ivf_threshold:
+            return None
+        probe = min(self.n_probe, len(view.centroids))
+        nearest = np.argpartition(-(view.centroids @ query_vec), probe - 1)[:probe]
+        return np.sort(np.concatenate([view.ivf_lists[c] for c in nearest]))
+
+    def _top_k(self, view: "_IndexView", query_vec: np.ndarray, k: int):
+        candidates = self._candidates(view, query_vec)
+        if candidates is not None:
+            batches = [candidates[i:i + SCAN_BATCH_ROWS] for i in range(0, len(candidates), SCAN_BATCH_ROWS)]
+        else:
+            batches = [np.arange(s, min(view.count, s + SCAN_BATCH_ROWS)) for s in range(0, view.count, SCAN_BATCH_ROWS)]
+
+        best_rows, best_scores = [], []
+        for rows in batches:
+            scores = view.rows(rows) @ query_vec
+            if view.stale_rows is not None:
+                scores[view.stale_rows[rows]] = -np.inf
+            keep = min(k, len(rows))
+            top = np.argpartition(-scores, keep - 1)[:keep]
+            best_rows.append(rows[top])
+            best_scores.append(scores[top])
+        rows = np.concatenate(best_rows)
+        scores = np.concatenate(best_scores)
+        order = np.argsort(-scores)[:k]
+        return rows[order], scores[order]
+
+    def search(self, query: str, max_results: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        执行检索
+
+        Args:
+            query: 检索词
+            max_results: 返回数量
+            timeout: 兼容 LightRAGSearch 的参数，本地检索不使用
+
+        Returns:
+            结果列表，每项包含 title / url / content / score
+        """
+        view = self._load()
+        if not view.count:
+            print("  > [Vector] 索引为空")
+            return []
+
+        query_vec = self._embed([query])[0]
+        rows, scores = self._top_k(view, query_vec, max_results)
+        results = [
+            {**view.docs[row], "score": float(score)}
+            for row, score in zip(rows, scores) if np.isfinite(score) and score > 0
+        ]
+        print(f"  > [Vector] {query[:15]}... 命中 {len(results)} 条")
+        return results
+
+    async def asearch(self, query: str, max_results: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """执行检索（异步版），向量化与扫描在线程池中执行"""
+        return await asyncio.to_thread(self.search, query, max_results, timeout)
+
+    def search_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                    dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """一次检索多个查询，参数与返回值同 LightRAGSearch.search_many"""
+        unique = list(dict.fromkeys(q for q in queries if q and q.strip()))
+        results = {q: self.search(q, max_results) for q in unique}
+        return dedupe_across_queries(results) if dedupe else results
+
+    async def asearch_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                           dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """一次检索多个查询（异步版）"""
+        return await asyncio.to_thread(self.search_many, queries, max_results, timeout, dedupe)
@@ -0,0 +1,231 @@
+"""
+检索预取
+大纲生成后立即为所有段落并发发起检索，结果暂存在本次运行的 PrefetchStore 中；
+段落的搜索节点按本段落的预取检索词（Send 时写入的 prefetch_key）直接取用（仍在请求中则等待），无需重新检索
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Any, Optional
+
+from .local_bm25 import tokenize
+from .retrieval_cache import normalize_query
+from .retrieval_router import RetrievalRouter
+
+
+def prefetch_query(topic: str, section: Dict[str, Any], instruction_chars: int = 30) -> str:
+    """
+    为段落构造预取检索词
+
+    大纲附带了搜索词时使用该搜索词（与搜索节点一致地补上报告主题），
+    否则用 主题 + 段落标题 + 写作要求的开头部分
+
+    Args:
+        topic: 报告主题
+        section: 段落定义 {"title", "content", "search_query"?}
+        instruction_chars: 取写作要求的前多少个字符
+    """
+    query = (section.get("search_query") or "").strip()
+    if query:
+        return query if topic in query else f"{topic} {query}"
+    instruction = " ".join((section.get("content") or "").split())[:instruction_chars]
+    return " ".join(part for part in (topic, section.get("title", ""), instruction) if part)
+
+
+def query_overlap(query: str, candidate: str, ngram: int = 2, topic: str = "") -> float:
+    """
+    两个检索词的词元重合度（字 n-gram 的 Jaccard 系数），取值 [0, 1]
+
+    检索词都以报告主题开头，计算前先去掉 topic，避免只有主题相同的检索词被判为重叠
+    """
+    if topic:
+        query, candidate = query.replace(topic, " "), candidate.replace(topic, " ")
+    tokens, other = set(tokenize(query, ngram)), set(tokenize(candidate, ngram))
+    if not tokens or not other:
+        return 0.0
+    return len(tokens & other) / len(tokens | other)
+
+
+class PrefetchStore:
+    """
+    单次运行的检索预取存储
+
+    - start / astart: 用检索客户端的 search_many / asearch_many 一次发起全部预取检索（后台执行，不阻塞）
+    - get / aget: 传入 key（段落自己的预取检索词）时只取该检索词的结果；未传 key 时按检索词匹配：
+      归一化后相同，或去掉报告主题后与某个预取检索词的重合度不低于 min_overlap 即命中；
+      预取仍在进行时最多等待 wait_timeout 秒
+    - 未命中、预取失败、结果为空，或检索路由有一路未返回（失败或超过截止时间）时返回 None，调用方照常检索
+
+    使用方式:
+        store = PrefetchStore()
+        config = {"configurable": {"prefetch": store}}
+        ...
+        store.close()
+    """
+
+    def __init__(self, max_results: int = 5, min_overlap: float = 0.6,
+                 wait_timeout: float = 30.0, ngram: int = 2):
+        """
+        Args:
+            max_results: 每个预取检索词的返回数量（应与搜索节点一致）
+            min_overlap: 判定为重叠检索词的最低词元覆盖率
+            wait_timeout: 预取仍在进行时的最长等待时间（秒）
+            ngram: 计算重叠时中文字 n-gram 的最大 n
+        """
+        self.max_results = max_results
+        self.min_overlap = min_overlap
+        self.wait_timeout = wait_timeout
+        self.ngram = ngram
+
+        self.queries: List[str] = []
+        self.topic = ""
+        self.missing_routes: List[str] = []
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Future] = None
+        self._future: Optional[Future] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # =========================================================
+    # 发起预取
+    # =========================================================
+    def start(self, retriever, queries: List[str], topic: str = "") -> None:
+        """在后台线程中发起预取（同步节点使用），topic 为报告主题（按检索词匹配时去掉）"""
+        self.queries = list(dict.fromkeys(q for q in queries if q))
+        self.topic = topic
+        if not self.queries:
+            return
+        print(f"  🚚 [预取] 为 {len(self.queries)} 个段落发起检索")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._future = self._executor.submit(self._fetch, retriever, self.queries)
+
+    def astart(self, retriever, queries: List[str], topic: str = "") -> None:
+        """在当前事件循环中发起预取（异步节点使用），立即返回"""
+        self.queries = list(dict.fromkeys(q for q in queries if q))
+        self.topic = topic
+        if not self.queries:
+            return
+        print(f"  🚚 [预取] 为 {len(self.queries)} 个段落发起检索")
+        self._task = asyncio.ensure_future(self._afetch(retriever, self.queries))
+
+    def _fetch(self, retriever, queries: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        if isinstance(retriever, RetrievalRouter):
+            fetched, self.missing_routes = retriever.search_many(queries, self.max_results, dedupe=False,
+                                                                 with_missing=True)
+            return fetched
+        if hasattr(retriever, "search_many"):
+            # 各段落各自使用预取结果，不做跨查询去重
+            return retriever.search_many(queries, self.max_results, dedupe=False)
+        return {q: retriever.search(q, max_results=self.max_results) for q in queries}
+
+    async def _afetch(self, retriever, queries: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        if isinstance(retriever, RetrievalRouter):
+            fetched, self.missing_routes = await retriever.asearch_many(queries, self.max_results, dedupe=False,
+                                                                        with_missing=True)
+            return fetched
+        if hasattr(retriever, "asearch_many"):
+            return await retriever.asearch_many(queries, self.max_results, dedupe=False)
+        return await asyncio.to_thread(self._fetch, retriever, queries)
+
+    # =========================================================
+    # 取用
+    # =========================================================
+    def match(self, query: str, key: Optional[str] = None) -> Optional[str]:
+        """
+        返回 query 对应的预取检索词，没有则返回 None
+
+        传入 key 时只查找 key 本身；否则返回与 query 相同或重合度最高（不低于 min_overlap）的预取检索词
+        """
+        if key is not None:
+            return key if key in self.queries else None
+        normalized = normalize_query(query)
+        best, best_overlap = None, self.min_overlap
+        for candidate in self.queries:
+            if normalize_query(candidate) == normalized:
+                return candidate
+            overlap = query_overlap(query, candidate, self.ngram, self.topic)
+            if overlap >= best_overlap:
+                best, best_overlap = candidate, overlap
+        return best
+
+    def get(self, query: str, key: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        取预取结果（同步版）
+
+        Args:
+            query: 本次检索词
+            key: 段落自己的预取检索词（Send 时写入的 prefetch_key），传入时不会取用其他段落的预取结果
+
+        Returns:
+            结果列表的副本，未命中时返回 None
+        """
+        candidate = self.match(query, key)
+        if candidate is None or self._future is None:
+            return self._record(query, None, None)
+        try:
+            fetched = self._future.result(timeout=self.wait_timeout)
+        except Exception as e:
+            print(f"  > [预取] 等待预取结果失败: {e.__class__.__name__}: {e}")
+            fetched = None
+        return self._record(query, candidate, fetched)
+
+    async def aget(self, query: str, key: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """取预取结果（异步版），参数与返回值同 get"""
+        candidate = self.match(query, key)
+        pending = self._task if self._task is not None else (
+            asyncio.wrap_future(self._future) if self._future is not None else None
+        )
+        if candidate is None or pending is None:
+            return self._record(query, None, None)
+        try:
+            # shield: 等待超时只放弃本次取用，不取消其他段落共享的预取
+            fetched = await asyncio.wait_for(asyncio.shield(pending), self.wait_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"  > [预取] 等待预取结果失败: {e.__class__.__name__}: {e}")
+            fetched = None
+        return self._record(query, candidate, fetched)
+
+    def _record(self, query: str, candidate: Optional[str],
+                fetched: Optional[Dict[str, List[Dict[str, Any]]]]) -> Optional[List[Dict[str, Any]]]:
+        results = (fetched or {}).get(candidate) if candidate is not None else None
+        if results and self.missing_routes:
+            # 检索路由有一路未返回时预取结果不完整（如只有网络搜索结果），改为实时检索
+            print(f"  > [预取] {', '.join(self.missing_routes)} 未返回预取结果，改为实时检索")
+            results = None
+        with self._lock:
+            if results:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not results:
+            return None
+        if candidate != query:
+            print(f"  > [预取] 命中预取检索词: {candidate[:20]}...")
+        else:
+            print("  > [预取] 命中预取结果")
+        return [dict(item) for item in results]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取预取统计
+
+        Returns:
+            queries（预取检索词数）、hits、misses
+        """
+        with self._lock:
+            return {"queries": len(self.queries), "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        """结束本次运行：取消尚未完成的预取"""
+        if self._task is not None:
+            if not self._task.done():
+                self._task.cancel()
+            elif not self._task.cancelled():
+                self._task.exception()  # 取走异常，避免未取用的预取在退出时告警
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,94 @@
+"""
+检索结果本地重排
+用字 n-gram TF-IDF 计算检索结果与段落要求的相关度（NumPy 向量化，无需网络），
+与检索后端给出的分数加权后只保留得分最高的若干条，减少写作提示词长度
+"""
+
+from typing import List, Dict, Any
+
+import numpy as np
+
+from .local_bm25 import tokenize
+
+
+def tfidf_similarity(query: str, docs: List[str], ngram: int = 2) -> np.ndarray:
+    """
+    计算每个文档与查询的 TF-IDF 余弦相似度
+
+    词频取 1 + log(tf)，IDF 取平滑形式 log((1 + n) / (1 + df)) + 1，IDF 只在候选文档内统计
+
+    Returns:
+        形状为 (len(docs),) 的相似度数组，取值 [0, 1]
+    """
+    if not docs:
+        return np.zeros(0, dtype=np.float32)
+
+    vocab: Dict[str, int] = {}
+    rows, cols = [], []
+    for i, doc in enumerate(docs):
+        for token in tokenize(doc, ngram):
+            rows.append(i)
+            cols.append(vocab.setdefault(token, len(vocab)))
+    query_ids = [vocab[t] for t in tokenize(query, ngram) if t in vocab]
+    if not query_ids:
+        return np.zeros(len(docs), dtype=np.float32)
+
+    tf = np.zeros((len(docs), len(vocab)), dtype=np.float32)
+    np.add.at(tf, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), 1.0)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1.0 + len(docs)) / (1.0 + df)) + 1.0
+
+    nonzero = tf > 0
+    tf[nonzero] = 1.0 + np.log(tf[nonzero])
+    doc_vecs = tf * idf
+    doc_vecs /= np.maximum(np.linalg.norm(doc_vecs, axis=1, keepdims=True), 1e-12)
+
+    query_vec = np.bincount(np.asarray(query_ids, dtype=np.int64), minlength=len(vocab)).astype(np.float32)
+    nonzero = query_vec > 0
+    query_vec[nonzero] = 1.0 + np.log(query_vec[nonzero])
+    query_vec *= idf
+    query_vec /= max(float(np.linalg.norm(query_vec)), 1e-12)
+
+    return doc_vecs @ query_vec
+
+
+def rerank_results(results: List[Dict[str, Any]], query: str,
+                   top_k: int = 8, weight: float = 0.7, ngram: int = 2) -> List[Dict[str, Any]]:
+    """
+    重排检索结果并保留前 top_k 条
+
+    综合得分 = weight × TF-IDF 相似度 + (1 - weight) × 后端分数（候选集内 min-max 归一化，
+    不同检索后端的分数尺度不同）
+
+    Args:
+        results: 检索结果列表（使用 title、content、score 字段）
+        query: 用于打分的文本，通常为段落标题 + 写作要求
+        top_k: 保留条数，None 或不大于 0 表示不裁剪
+        weight: TF-IDF 相似度的权重
+        ngram: 中文字 n-gram 的最大 n
+
+    Returns:
+        按综合得分从高到低排列的结果副本，附带 rerank_score 字段
+    """
+    if not results:
+        return []
+
+    docs = [f"{item.get('title', '')}\n{item.get('content', '')}" for item in results]
+    similarity = tfidf_similarity(query, docs, ngram)
+
+    backend = np.asarray([float(item.get("score") or 0.0) for item in results], dtype=np.float32)
+    spread = float(backend.max() - backend.min())
+    backend = (backend - backend.min()) / spread if spread > 0 else np.zeros_like(backend)
+
+    combined = weight * similarity + (1.0 - weight) * backend
+    # 同分时保持原有顺序
+    order = np.argsort(-combined, kind="stable")
+    if top_k and top_k > 0:
+        order = order[:top_k]
+
+    ranked = []
+    for i in order:
+        item = dict(results[i])
+        item["rerank_score"] = round(float(combined[i]), 4)
+        ranked.append(item)
+    return ranked
@@ -0,0 +1,242 @@
+"""
+检索结果缓存
+以归一化后的检索词 + k + 接口为键，内存 LRU 在前、SQLite 在后，按语料版本失效
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Union
+
+
+def normalize_query(query: str) -> str:
+    """
+    归一化检索词：全角转半角 (NFKC)、小写、标点替换为空格、合并空白
+
+    "宁德时代  产能，扩张！" 与 "宁德时代 产能 扩张" 归一化后相同
+    """
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    chars = [
+        " " if unicodedata.category(ch)[0] in ("P", "S", "Z", "C") else ch
+        for ch in text
+    ]
+    return " ".join("".join(chars).split())
+
+
+class RetrievalCache:
+    """
+    检索结果缓存
+
+    - 内存层: 进程内 LRU，最多 memory_entries 条
+    - 磁盘层: SQLite (WAL 模式)，多个进程与多次报告共享
+    - 每个条目记录写入时的语料版本，只有与当前版本一致且未超过该版本 TTL 的条目才会命中；
+      索引重建后调用 on_index_rebuilt(新版本) 即可让旧结果全部失效
+    - 空结果不缓存（检索失败时也返回空列表）
+
+    使用方式:
+        cache = RetrievalCache(".cache/retrieval.sqlite", corpus_version="2024Q4")
+        rag_tool.set_cache(cache)
+        ...
+        cache.on_index_rebuilt("2025Q1")
+    """
+
+    def __init__(self, path: str = ".cache/retrieval.sqlite",
+                 memory_entries: int = 512,
+                 ttl_seconds: Union[float, Dict[str, float], None] = 24 * 3600,
+                 corpus_version: str = "default"):
+        """
+        初始化缓存
+
+        Args:
+            path: SQLite 文件路径
+            memory_entries: 内存层最大条目数
+            ttl_seconds: 条目有效期（秒），可按语料版本指定，如 {"2024Q4": 7 * 24 * 3600}；
+                         None 表示永不过期（只随语料版本失效）
+            corpus_version: 当前语料 / 索引版本
+        """
+        self.path = path
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.corpus_version = corpus_version
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # key -> (结果, 写入时间, 语料版本)
+        self._memory: "OrderedDict[str, Tuple[List[Dict[str, Any]], float, str]]" = OrderedDict()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " version TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_version ON results(version)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程独立的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # =========================================================
+    # 缓存键与有效期
+    # =========================================================
+    @staticmethod
+    def make_key(query: str, k: int, endpoint: str) -> str:
+        """计算缓存键：归一化检索词 + k + 接口"""
+        raw = json.dumps([normalize_query(query), k, endpoint], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, version: str) -> Optional[float]:
+        """某个语料版本的条目有效期"""
+        if isinstance(self.ttl_seconds, dict):
+            return self.ttl_seconds.get(version)
+        return self.ttl_seconds
+
+    def _is_fresh(self, created_at: float, version: str, now: float) -> bool:
+        if version != self.corpus_version:
+            return False
+        ttl = self.ttl_for(version)
+        return ttl is None or now - created_at <= ttl
+
+    # =========================================================
+    # 读写
+    # =========================================================
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取缓存，先查内存层，未命中再查磁盘层并回填内存层
+
+        Returns:
+            缓存的检索结果，未命中返回 None
+        """
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if self._is_fresh(item[1], item[2], now):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return item[0]
+                del self._memory[key]
+
+        row = self._conn().execute(
+            "SELECT value, created_at, version FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or not self._is_fresh(row[1], row[2], now):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        results = json.loads(row[0])
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, (results, row[1], row[2]))
+        return results
+
+    def set(self, key: str, results: List[Dict[str, Any]]) -> None:
+        """写入缓存（空结果不写入）"""
+        if not results:
+            return
+        now = time.time()
+        version = self.corpus_version
+        with self._lock:
+            self._remember(key, (results, now, version))
+
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, version, value, created_at) VALUES (?, ?, ?, ?)",
+            (key, version, json.dumps(results, ensure_ascii=False), now)
+        )
+        conn.commit()
+
+    def _remember(self, key: str, item: Tuple[List[Dict[str, Any]], float, str]) -> None:
+        """写入内存层并按 LRU 淘汰（调用方需持有锁）"""
+        self._memory[key] = item
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    # =========================================================
+    # 失效
+    # =========================================================
+    def invalidate(self, corpus_version: Optional[str] = None) -> int:
+        """
+        删除缓存条目
+
+        Args:
+            corpus_version: 只删除该语料版本的条目，None 表示全部删除
+
+        Returns:
+            磁盘层删除的条目数
+        """
+        with self._lock:
+            if corpus_version is None:
+                self._memory.clear()
+            else:
+                for key in [k for k, item in self._memory.items() if item[2] == corpus_version]:
+                    del self._memory[key]
+
+        conn = self._conn()
+        if corpus_version is None:
+            cur = conn.execute("DELETE FROM results")
+        else:
+            cur = conn.execute("DELETE FROM results WHERE version = ?", (corpus_version,))
+        conn.commit()
+        return cur.rowcount
+
+    def on_index_rebuilt(self, corpus_version: str) -> int:
+        """
+        索引重建钩子：切换到新的语料版本并删除其他版本的条目
+
+        Returns:
+            磁盘层删除的条目数
+        """
+        print(f"  🗂️ [检索缓存] 语料版本 {self.corpus_version} → {corpus_version}，清除旧结果")
+        with self._lock:
+            self.corpus_version = corpus_version
+            self._memory.clear()
+
+        conn = self._conn()
+        cur = conn.execute("DELETE FROM results WHERE version != ?", (corpus_version,))
+        conn.commit()
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            包含 memory_hits、disk_hits、misses、hit_rate、memory_entries、disk_entries 的字典
+        """
+        count = self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "corpus_version": self.corpus_version,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": count,
+            }
@@ -0,0 +1,307 @@
+"""
+多路检索路由
+同时向多个检索客户端（如 LightRAG 与网络搜索）发起请求，在截止时间内合并已返回的结果，
+总耗时为最慢一路与截止时间中的较小值，而不是各路之和
+"""
+
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from typing import List, Dict, Any, Optional, Callable, Union
+
+from .lightrag_search import _unique_queries, _finish_many, _doc_key
+from .circuit_breaker import DEADLINE_EXCEEDED
+
+# 预设结果: 所有查询返回同一列表 / {查询: 结果} / fn(query, k) -> 结果
+StubResults = Union[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]],
+                    Callable[[str, int], List[Dict[str, Any]]], None]
+
+
+def _merge_key(item: Dict[str, Any]) -> str:
+    """合并去重键：网页按 URL，本地资料（url 多为占位值）按正文哈希"""
+    url = item.get("url") or ""
+    if url.startswith(("http://", "https://")):
+        return url
+    return _doc_key(item)
+
+
+def merge_routes(routes: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    合并多路检索结果
+
+    各路分数尺度不同，不直接比较，按名次轮流取（第 1 路第 1 条、第 2 路第 1 条、第 1 路第 2 条……）；
+    同一文档只保留先取到的一条，每条结果附带 source 字段标明来源
+
+    Args:
+        routes: {检索路名称: 结果列表}，字典顺序即优先级
+
+    Returns:
+        合并后的结果列表
+    """
+    merged, seen = [], set()
+    depth = max((len(items) for items in routes.values()), default=0)
+    for rank in range(depth):
+        for name, items in routes.items():
+            if rank >= len(items):
+                continue
+            key = _merge_key(items[rank])
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append({**items[rank], "source": name})
+    return merged
+
+
+class RetrievalRouter:
+    """
+    多路检索路由
+
+    - 接口与 LightRAGSearch 一致 (search / asearch / search_many / asearch_many)，可直接注入搜索节点
+    - 各路并发请求，截止时间到达时只合并已返回的结果，未返回的一路丢弃（异步请求会被取消）
+    - 任一路可用（未熔断）时 available 为 True
+
+    使用方式:
+        router = RetrievalRouter({"lightrag": LightRAGSearch(), "tavily": TavilySearch(key)}, deadline=8.0)
+        results = await router.asearch("宁德时代 产能")
+    """
+
+    def __init__(self, providers: Dict[str, Any], deadline: float = 8.0, max_workers: int = 8):
+        """
+        Args:
+            providers: {检索路名称: 检索客户端}，字典顺序即合并时的优先级
+            deadline: 每次调用的截止时间（秒）
+            max_workers: 同步调用使用的线程数
+        """
+        if not providers:
+            raise ValueError("RetrievalRouter 至少需要一路检索")
+        self.providers = dict(providers)
+        self.deadline = deadline
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._late: Dict[str, int] = {name: 0 for name in self.providers}
+
+        print(f"  [检索路由] {' + '.join(self.providers)} (截止时间 {deadline:.1f}s)")
+
+    @property
+    def available(self) -> bool:
+        """任一路检索可用即可用"""
+        return any(getattr(p, "available", True) for p in self.providers.values())
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="router")
+            return self._executor
+
+    def _deadline(self, timeout: Optional[float]) -> float:
+        return self.deadline if timeout is None else min(self.deadline, timeout)
+
+    def _record_late(self, names: List[str], deadline: float) -> None:
+        with self._lock:
+            for name in names:
+                self._late[name] += 1
+        print(f"  > [检索路由] {', '.join(names)} 未在 {deadline:.1f}s 内返回，已丢弃")
+
+    # =========================================================
+    # 单查询
+    # =========================================================
+    def search(self, query: str, max_results: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        并发检索各路并合并结果
+
+        Args:
+            query: 检索词
+            max_results: 每一路的返回数量（合并后最多为 路数 × max_results 条，由下游重排裁剪）
+            timeout: 本次调用的截止时间（秒），不超过 deadline，None 时使用 deadline；同时作为各路的超时参数
+
+        Returns:
+            合并后的结果列表
+        """
+        deadline = self._deadline(timeout)
+        routes = self._gather(lambda p: p.search(query, max_results, deadline), deadline)
+        return merge_routes(routes)
+
+    async def asearch(self, query: str, max_results: int = 5,
+                      timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """并发检索各路并合并结果（异步版），参数与返回值同 search"""
+        deadline = self._deadline(timeout)
+
+        async def call(provider):
+            if hasattr(provider, "asearch"):
+                return await provider.asearch(query, max_results, deadline)
+            return await asyncio.to_thread(provider.search, query, max_results, deadline)
+
+        routes = await self._agather(call, deadline)
+        return merge_routes(routes)
+
+    # =========================================================
+    # 多查询
+    # =========================================================
+    def search_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                    dedupe: bool = True, with_missing: bool = False):
+        """
+        一次检索多个查询：各路分别调用 search_many，截止时间内返回的各路按查询合并
+
+        参数与返回值同 LightRAGSearch.search_many；with_missing 为 True 时返回 (结果, 缺失的检索路名称列表)，
+        缺失指该路检索失败或未在截止时间内返回
+        """
+        unique = _unique_queries(queries)
+        deadline = self._deadline(timeout)
+        routes = self._gather(lambda p: _call_many(p, unique, max_results, deadline), deadline)
+        return self._finish_routes(unique, routes, dedupe, with_missing)
+
+    async def asearch_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                           dedupe: bool = True, with_missing: bool = False):
+        """一次检索多个查询（异步版），参数与返回值同 search_many"""
+        unique = _unique_queries(queries)
+        deadline = self._deadline(timeout)
+
+        async def call(provider):
+            if hasattr(provider, "asearch_many"):
+                return await provider.asearch_many(unique, max_results, deadline, dedupe=False)
+            return await asyncio.to_thread(_call_many, provider, unique, max_results, deadline)
+
+        routes = await self._agather(call, deadline)
+        return self._finish_routes(unique, routes, dedupe, with_missing)
+
+    def _finish_routes(self, queries: List[str], routes: Dict[str, Any], dedupe: bool, with_missing: bool):
+        results = _finish_many(queries, _merge_many(queries, routes), dedupe)
+        if not with_missing:
+            return results
+        return results, [name for name in self.providers if name not in routes]
+
+    # =========================================================
+    # 并发与截止时间
+    # =========================================================
+    def _gather(self, fn: Callable[[Any], Any], deadline: float) -> Dict[str, Any]:
+        """在线程池中并发调用各路，返回截止时间内完成的 {名称: 结果}（超时的线程在后台自然结束）"""
+        executor = self._get_executor()
+        futures = {name: executor.submit(fn, provider) for name, provider in self.providers.items()}
+        wait_futures(futures.values(), timeout=deadline)
+
+        routes, late = {}, []
+        for name, future in futures.items():
+            if not future.done():
+                late.append(name)
+            elif future.exception() is not None:
+                print(f"  > [检索路由] {name} 检索失败: {future.exception()}")
+            else:
+                routes[name] = future.result()
+        if late:
+            self._record_late(late, deadline)
+        return routes
+
+    async def _agather(self, fn: Callable[[Any], Any], deadline: float) -> Dict[str, Any]:
+        """并发调用各路，返回截止时间内完成的 {名称: 结果}，未完成的请求以 DEADLINE_EXCEEDED 取消（熔断器计为超时）"""
+        tasks = {name: asyncio.ensure_future(fn(provider)) for name, provider in self.providers.items()}
+        try:
+            _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        for task in pending:
+            task.cancel(DEADLINE_EXCEEDED)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        routes, late = {}, []
+        for name, task in tasks.items():
+            if task in pending:
+                late.append(name)
+            elif task.exception() is not None:
+                print(f"  > [检索路由] {name} 检索失败: {task.exception()}")
+            else:
+                routes[name] = task.result()
+        if late:
+            self._record_late(late, deadline)
+        return routes
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取路由统计
+
+        Returns:
+            providers（各路名称）、deadline、late（各路超过截止时间被丢弃的次数）
+        """
+        with self._lock:
+            return {"providers": list(self.providers), "deadline": self.deadline, "late": dict(self._late)}
+
+    def close(self) -> None:
+        """关闭线程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def _call_many(provider: Any, queries: List[str], k: int, timeout: float) -> Dict[str, List[Dict[str, Any]]]:
+    if hasattr(provider, "search_many"):
+        return provider.search_many(queries, k, timeout, dedupe=False)
+    return {q: provider.search(q, k, timeout) for q in queries}
+
+
+def _merge_many(queries: List[str], routes: Dict[str, Dict[str, List[Dict[str, Any]]]]):
+    return {q: merge_routes({name: many.get(q, []) for name, many in routes.items()}) for q in queries}
+
+
+class StubRetriever:
+    """
+    本地桩检索客户端：返回预设结果，可模拟延迟与故障，用于测试或离线演示检索路由
+
+    使用方式:
+        slow = StubRetriever([{"title": "t", "url": "", "content": "...", "score": 1.0}], latency=5.0)
+        router = RetrievalRouter({"lightrag": LightRAGSearch(), "stub": slow}, deadline=1.0)
+    """
+
+    def __init__(self, results: StubResults = None, latency: float = 0.0, fail: bool = False):
+        """
+        Args:
+            results: 预设结果，可以是列表（所有查询相同）、{查询: 结果} 或 fn(query, k)
+            latency: 每次检索的模拟延迟（秒）
+            fail: 为 True 时每次检索抛出 ConnectionError
+        """
+        self.results = results
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    def _results(self, query: str, k: int) -> List[Dict[str, Any]]:
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("StubRetriever: 模拟检索失败")
+        if callable(self.results):
+            items = self.results(query, k)
+        elif isinstance(self.results, dict):
+            items = self.results.get(query, [])
+        else:
+            items = self.results or []
+        return [dict(item) for item in items[:k]]
+
+    def search(self, query: str, max_results: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._results(query, max_results)
+
+    async def asearch(self, query: str, max_results: int = 5,
+                      timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._results(query, max_results)
+
+    def search_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                    dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        unique = _unique_queries(queries)
+        if self.latency:
+            time.sleep(self.latency)
+        return _finish_many(unique, {q: self._results(q, max_results) for q in unique}, dedupe)
+
+    async def asearch_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                           dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        unique = _unique_queries(queries)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return _finish_many(unique, {q: self._results(q, max_results) for q in unique}, dedupe)
@@ -0,0 +1,140 @@
+"""
+Tavily 网络搜索客户端
+接口与 LightRAGSearch 一致 (search / asearch / search_many / asearch_many)，可直接作为检索路由的一路
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from src.llms.cassette import get_cassette
+from .lightrag_search import _unique_queries, _finish_many
+
+try:
+    from tavily import TavilyClient
+except ImportError:  # 未安装 tavily-python 时只能在构造时报错
+    TavilyClient = None
+
+try:
+    from tavily import AsyncTavilyClient
+except ImportError:  # 旧版本 tavily-python 没有异步客户端，异步检索改在线程池中执行
+    AsyncTavilyClient = None
+
+
+class TavilySearch:
+    """
+    Tavily 网络搜索客户端
+
+    - 返回格式同 LightRAGSearch: [{"title", "url", "content", "score"}]
+    - 配置了 cassette 时录制 / 回放原始响应
+    - 请求失败时打印错误并返回空列表，不影响其他检索路
+    """
+
+    def __init__(self, api_key: str,
+                 search_depth: str = "basic",
+                 max_content_chars: int = 4000,
+                 max_concurrency: int = 4):
+        """
+        Args:
+            api_key: Tavily API Key
+            search_depth: "basic" 或 "advanced"（更慢，结果更全）
+            max_content_chars: 单条结果正文的最大长度
+            max_concurrency: search_many 并发请求的上限
+        """
+        if TavilyClient is None:
+            raise ImportError("使用网络搜索需要安装 tavily-python: pip install tavily-python")
+        self.api_key = api_key
+        self.search_depth = search_depth
+        self.max_content_chars = max_content_chars
+        self.max_concurrency = max_concurrency
+        self._client = TavilyClient(api_key=api_key)
+        self._async_client = AsyncTavilyClient(api_key=api_key) if AsyncTavilyClient is not None else None
+
+    def _params(self, query: str, k: int) -> Dict[str, Any]:
+        return {"query": query, "search_depth": self.search_depth, "max_results": k}
+
+    def search(self, query: str, max_results: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        执行网络搜索
+
+        Args:
+            query: 搜索词
+            max_results: 返回数量
+            timeout: 保留参数（与其他检索客户端一致），超时由检索路由的截止时间控制
+
+        Returns:
+            标准化的搜索结果列表
+        """
+        params = self._params(query, max_results)
+        try:
+            print(f"  > [Tavily] 正在搜索: {query[:15]}... (k={max_results})")
+            cassette = get_cassette()
+            if cassette is not None:
+                key = cassette.make_key("tavily", params)
+                response = cassette.call("tavily", key, lambda: self._client.search(**params),
+                                         meta={"query": query[:80], "k": max_results})
+            else:
+                response = self._client.search(**params)
+            return self._parse_response(response)
+        except Exception as e:
+            print(f"  > [Tavily Exception] 搜索失败: {e.__class__.__name__}: {e}")
+            return []
+
+    async def asearch(self, query: str, max_results: int = 5,
+                      timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """执行网络搜索（异步版），参数与返回值同 search"""
+        if self._async_client is None:
+            return await asyncio.to_thread(self.search, query, max_results, timeout)
+
+        params = self._params(query, max_results)
+        try:
+            print(f"  > [Tavily] 正在搜索: {query[:15]}... (k={max_results})")
+            cassette = get_cassette()
+            if cassette is not None:
+                key = cassette.make_key("tavily", params)
+                response = await cassette.acall("tavily", key, lambda: self._async_client.search(**params),
+                                                meta={"query": query[:80], "k": max_results})
+            else:
+                response = await self._async_client.search(**params)
+            return self._parse_response(response)
+        except Exception as e:
+            print(f"  > [Tavily Exception] 搜索失败: {e.__class__.__name__}: {e}")
+            return []
+
+    def search_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                    dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """一次搜索多个查询（有界并发），参数与返回值同 LightRAGSearch.search_many"""
+        unique = _unique_queries(queries)
+        workers = max(1, min(self.max_concurrency, len(unique)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tavily") as executor:
+            fetched = executor.map(lambda q: self.search(q, max_results, timeout), unique)
+            results = dict(zip(unique, fetched))
+        return _finish_many(unique, results, dedupe)
+
+    async def asearch_many(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None,
+                           dedupe: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """一次搜索多个查询（异步版），参数与返回值同 search_many"""
+        unique = _unique_queries(queries)
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+
+        async def one(query: str):
+            async with semaphore:
+                return await self.asearch(query, max_results, timeout)
+
+        fetched = await asyncio.gather(*(one(q) for q in unique))
+        return _finish_many(unique, dict(zip(unique, fetched)), dedupe)
+
+    def _parse_response(self, response: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """把 Tavily 响应转换为标准格式"""
+        results = []
+        for item in (response or {}).get("results", []):
+            content = (item.get("content") or "").strip()
+            if not content:
+                continue
+            results.append({
+                "title": item.get("title") or "网络资料",
+                "url": item.get("url", ""),
+                "content": content[:self.max_content_chars],
+                "score": float(item.get("score") or 0.0),
+            })
+        return results
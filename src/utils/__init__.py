@@ -8,6 +8,9 @@ from .text_processing import (
     clean_markdown_tags, 
     remove_reasoning_from_output,
     extract_clean_response,
+    extract_partial_json_string,
+    PartialJSONStringReader,
+    repair_json,
     update_state_with_search_results,
     format_search_results_for_prompt
 )
@@ -19,6 +22,9 @@ __all__ = [
     "clean_markdown_tags",
     "remove_reasoning_from_output", 
     "extract_clean_response",
+    "extract_partial_json_string",
+    "PartialJSONStringReader",
+    "repair_json",
     "update_state_with_search_results",
     "format_search_results_for_prompt",
     "Config",
@@ -0,0 +1,190 @@
+"""
+结构化输出层
+统一解析 LLM 的 JSON 输出：先本地修复，失败后再发起一次定向重问
+"""
+
+import json
+from json.decoder import JSONDecodeError
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+from .text_processing import repair_json, extract_partial_json_string
+from ..prompts.prompts import SYSTEM_PROMPT_JSON_REPAIR
+
+# 校验函数: 返回 True 表示解析结果可用
+Validator = Callable[[Any], bool]
+
+# 重问时附带的原始输出长度上限（字符），避免重问本身过长
+MAX_REASK_CHARS = 12000
+
+
+class StructuredOutputError(ValueError):
+    """本地修复与重问均未得到可用的 JSON"""
+    pass
+
+
+def parse_json_output(text: str, validate: Optional[Validator] = None,
+                      salvage_field: Optional[str] = None) -> Any:
+    """
+    本地解析 LLM 输出的 JSON（不发起任何请求）
+
+    Args:
+        text: LLM 原始输出
+        validate: 校验函数，解析结果未通过校验视为失败
+        salvage_field: 修复失败时从截断文本中抢救的字符串字段，如 paragraph_latest_state
+
+    Returns:
+        解析结果
+
+    Raises:
+        StructuredOutputError: 无法得到可用结果
+    """
+    try:
+        data = repair_json(text)
+    except JSONDecodeError as e:
+        error = f"JSON解析失败: {e}"
+    else:
+        if validate is None or validate(data):
+            return data
+        error = "JSON结构不符合要求"
+
+    if salvage_field:
+        value = extract_partial_json_string(text, salvage_field)
+        if value.strip():
+            print(f"  > [JSON] 从截断输出中抢救字段 {salvage_field} ({len(value)} 字)")
+            salvaged = {salvage_field: value}
+            if validate is None or validate(salvaged):
+                return salvaged
+
+    raise StructuredOutputError(error)
+
+
+def json_cache_validator(validate: Optional[Validator] = None) -> Callable[[str], bool]:
+    """
+    构造 LLM 缓存的写入校验函数：原始回复无需抢救截断字段即可解析并通过 validate 时才写入缓存，
+    避免空回复、截断或结构不符的回复被缓存后在之后的运行中反复回放
+    """
+    def check(text: str) -> bool:
+        try:
+            parse_json_output(text, validate)
+        except StructuredOutputError:
+            return False
+        return True
+    return check
+
+
+def _build_reask_messages(text: str, error: str, schema: Optional[Dict[str, Any]]):
+    """构造定向重问消息：只包含出错的输出、错误信息与期望模式"""
+    payload = {
+        "error": error,
+        "expected_schema": schema or {},
+        "broken_output": text[:MAX_REASK_CHARS],
+    }
+    return [
+        SystemMessage(content=SYSTEM_PROMPT_JSON_REPAIR),
+        HumanMessage(content=json.dumps(payload, ensure_ascii=False))
+    ]
+
+
+def _content(response: Any) -> str:
+    return getattr(response, "content", response) or ""
+
+
+def resolve_json(llm, text: str, validate: Optional[Validator] = None,
+                 salvage_field: Optional[str] = None,
+                 schema: Optional[Dict[str, Any]] = None,
+                 node: Optional[str] = None, section: Optional[str] = None) -> Any:
+    """
+    解析 LLM 输出：本地修复失败时发起一次定向重问
+
+    Args:
+        llm: 用于重问的 LLM
+        text: LLM 原始输出
+        validate: 校验函数
+        salvage_field: 截断时抢救的字符串字段
+        schema: 期望的 JSON 模式，重问时提供给模型
+        node: 调用方节点名，重问记为 "{node}_repair"
+        section: 调用方所属段落标题
+
+    Returns:
+        解析结果
+
+    Raises:
+        StructuredOutputError: 本地修复与重问均失败
+    """
+    try:
+        return parse_json_output(text, validate, salvage_field)
+    except StructuredOutputError as e:
+        error = str(e)
+
+    print(f"  > [JSON] 本地修复失败 ({error})，发起定向重问")
+    response = llm.invoke(
+        _build_reask_messages(text, error, schema),
+        response_format={"type": "json_object"},
+        node=f"{node}_repair" if node else "repair", section=section,
+        cache_validate=json_cache_validator(validate)
+    )
+    return parse_json_output(_content(response), validate, salvage_field)
+
+
+async def aresolve_json(llm, text: str, validate: Optional[Validator] = None,
+                        salvage_field: Optional[str] = None,
+                        schema: Optional[Dict[str, Any]] = None,
+                        node: Optional[str] = None, section: Optional[str] = None) -> Any:
+    """
+    解析 LLM 输出（异步版），参数同 resolve_json
+    """
+    try:
+        return parse_json_output(text, validate, salvage_field)
+    except StructuredOutputError as e:
+        error = str(e)
+
+    print(f"  > [JSON] 本地修复失败 ({error})，发起定向重问")
+    response = await llm.ainvoke(
+        _build_reask_messages(text, error, schema),
+        response_format={"type": "json_object"},
+        node=f"{node}_repair" if node else "repair", section=section,
+        cache_validate=json_cache_validator(validate)
+    )
+    return parse_json_output(_content(response), validate, salvage_field)
+
+
+def invoke_json(llm, messages, validate: Optional[Validator] = None,
+                salvage_field: Optional[str] = None,
+                schema: Optional[Dict[str, Any]] = None,
+                node: Optional[str] = None, section: Optional[str] = None,
+                repair_llm=None) -> Any:
+    """
+    以 JSON 模式调用 LLM 并解析结果，解析失败时按 resolve_json 修复
+
+    Args:
+        llm: 生成用的 LLM
+        messages: 消息列表
+        repair_llm: 重问用的 LLM（通常是更便宜的模型），None 时使用 llm
+        其余参数同 resolve_json
+
+    Returns:
+        解析结果
+
+    Raises:
+        StructuredOutputError: 本地修复与重问均失败
+    """
+    response = llm.invoke(messages, response_format={"type": "json_object"},
+                          node=node, section=section, cache_validate=json_cache_validator(validate))
+    return resolve_json(repair_llm or llm, _content(response), validate, salvage_field,
+                        schema, node, section)
+
+
+async def ainvoke_json(llm, messages, validate: Optional[Validator] = None,
+                       salvage_field: Optional[str] = None,
+                       schema: Optional[Dict[str, Any]] = None,
+                       node: Optional[str] = None, section: Optional[str] = None,
+                       repair_llm=None) -> Any:
+    """
+    以 JSON 模式调用 LLM 并解析结果（异步版），参数同 invoke_json
+    """
+    response = await llm.ainvoke(messages, response_format={"type": "json_object"},
+                                 node=node, section=section, cache_validate=json_cache_validator(validate))
+    return await aresolve_json(repair_llm or llm, _content(response), validate, salvage_field,
+                               schema, node, section)
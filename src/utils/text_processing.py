@@ -111,6 +111,287 @@ def extract_clean_response(text: str) -> Dict[str, Any]:
     return {"error": "JSON解析失败", "raw_text": cleaned_text}
 
 
+# 尚未到达完整的 \uXXXX 转义（含空串）
+_UNICODE_ESCAPE_PREFIX = re.compile(r"(\\(u[0-9a-fA-F]{0,3})?)?")
+
+
+class PartialJSONStringReader:
+    """
+    增量读取流式JSON中某个字符串字段的内容
+    
+    每次 feed 一段新文本，返回该字段新增的已解码内容；
+    只扫描新到达的字符，适合逐 token 调用
+    """
+    
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+    
+    def __init__(self, field: str):
+        self.field = field
+        self.text = ""
+        self.value = ""
+        self._pos = -1       # 字段值的下一个待解码位置，-1 表示尚未定位到字段
+        self._done = False
+    
+    def feed(self, chunk: str) -> str:
+        """
+        追加文本并返回新增的字段内容
+        
+        Args:
+            chunk: 新到达的文本片段
+            
+        Returns:
+            本次新增的已解码内容
+        """
+        self.text += chunk
+        if self._done:
+            return ""
+        
+        if self._pos < 0:
+            match = re.search(r'"%s"\s*:\s*"' % re.escape(self.field), self.text)
+            if not match:
+                return ""
+            self._pos = match.end()
+        
+        text = self.text
+        chars = []
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if ch == '"':
+                self._done = True
+                break
+            if ch != '\\':
+                chars.append(ch)
+                i += 1
+                continue
+            # 转义序列不完整时等待后续内容
+            if i + 1 >= len(text):
+                break
+            esc = text[i + 1]
+            if esc == 'u':
+                hex_digits = text[i + 2:i + 6]
+                if len(hex_digits) < 4:
+                    break
+                try:
+                    code = int(hex_digits, 16)
+                except ValueError:
+                    i += 6
+                    continue
+                if 0xD800 <= code <= 0xDBFF:
+                    # 高位代理需与紧随的 \uDCxx 合成一个字符（如 emoji），低位尚未到达时等待
+                    low = text[i + 6:i + 12]
+                    if len(low) < 6 and _UNICODE_ESCAPE_PREFIX.fullmatch(low):
+                        break
+                    low_code = _parse_low_surrogate(low)
+                    if low_code is not None:
+                        chars.append(chr(0x10000 + ((code - 0xD800) << 10) + (low_code - 0xDC00)))
+                        i += 12
+                        continue
+                    code = 0xFFFD
+                elif 0xDC00 <= code <= 0xDFFF:
+                    code = 0xFFFD  # 孤立的低位代理无法编码为 UTF-8，以替换字符代替
+                chars.append(chr(code))
+                i += 6
+            else:
+                chars.append(self._ESCAPES.get(esc, esc))
+                i += 2
+        
+        self._pos = i
+        delta = "".join(chars)
+        self.value += delta
+        return delta
+
+
+def _parse_low_surrogate(escape: str):
+    """解析 \\uDCxx 形式的低位代理转义，不是低位代理时返回 None"""
+    if len(escape) != 6 or not escape.startswith("\\u"):
+        return None
+    try:
+        code = int(escape[2:], 16)
+    except ValueError:
+        return None
+    return code if 0xDC00 <= code <= 0xDFFF else None
+
+
+def extract_partial_json_string(text: str, field: str) -> str:
+    """
+    从（可能尚未生成完整的）JSON文本中提取某个字符串字段当前已生成的部分
+    
+    Args:
+        text: 流式累积的JSON文本
+        field: 字段名，例如 paragraph_latest_state
+        
+    Returns:
+        已解码的字段内容，字段尚未出现时返回空字符串
+    """
+    reader = PartialJSONStringReader(field)
+    reader.feed(text)
+    return reader.value
+
+
+def _scan_json(text: str):
+    """
+    扫描JSON文本，返回 (未闭合的括号栈, 结束时是否处于字符串内, 字符串内是否有悬空的反斜杠)
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append(ch)
+        elif ch in '}]' and stack:
+            stack.pop()
+    return stack, in_string, escaped
+
+
+def escape_control_chars_in_strings(text: str) -> str:
+    """
+    转义JSON字符串值内未转义的换行、回车与制表符（LLM 输出长文本时的常见错误）
+    
+    Args:
+        text: JSON文本
+        
+    Returns:
+        修复后的文本
+    """
+    out = []
+    in_string = False
+    escaped = False
+    replacements = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            elif ch in replacements:
+                out.append(replacements[ch])
+                continue
+        elif ch == '"':
+            in_string = True
+        out.append(ch)
+    return "".join(out)
+
+
+def remove_trailing_commas(text: str) -> str:
+    """
+    去掉对象/数组末尾多余的逗号（如 [1, 2,] / {"a": 1,}），字符串值内的逗号不受影响
+    
+    Args:
+        text: JSON文本
+        
+    Returns:
+        修复后的文本
+    """
+    out = []
+    in_string = False
+    escaped = False
+    comma = None  # 字符串外最近一个逗号在 out 中的位置（其后只有空白）
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            comma = None
+        elif ch == ',':
+            comma = len(out)
+        elif ch in '}]':
+            if comma is not None:
+                del out[comma]
+            comma = None
+        elif not ch.isspace():
+            comma = None
+        out.append(ch)
+    return "".join(out)
+
+
+def close_truncated_json(text: str) -> str:
+    """
+    补全被截断的JSON：闭合未结束的字符串与括号，去掉末尾悬空的逗号
+    
+    Args:
+        text: 可能被截断的JSON文本
+        
+    Returns:
+        补全后的文本（原本完整时原样返回）
+    """
+    stack, in_string, escaped = _scan_json(text)
+    if not stack and not in_string:
+        return text
+    
+    if in_string:
+        if escaped:
+            text = text[:-1]
+        text += '"'
+    text = text.rstrip()
+    text = re.sub(r',\s*$', '', text)
+    if text.endswith(':'):
+        text += ' null'
+    closers = ''.join('}' if ch == '{' else ']' for ch in reversed(stack))
+    return text + closers
+
+
+def repair_json(text: str) -> Any:
+    """
+    本地修复并解析LLM输出的JSON，依次尝试：
+    1. 直接解析
+    2. 去掉 ``` 代码块标记与JSON前后的说明文字
+    3. 转义字符串内的换行等控制字符、去掉对象/数组末尾多余的逗号
+    4. 补全被截断的字符串与括号（截断在键名处时回退到上一个完整字段）
+    
+    Args:
+        text: LLM 原始输出
+        
+    Returns:
+        解析结果
+        
+    Raises:
+        JSONDecodeError: 所有修复方式均失败
+    """
+    try:
+        return json.loads(text)
+    except JSONDecodeError as e:
+        first_error = e
+    
+    cleaned = clean_json_tags(text)
+    starts = [i for i in (cleaned.find('{'), cleaned.find('[')) if i >= 0]
+    if not starts:
+        raise first_error
+    cleaned = escape_control_chars_in_strings(cleaned[min(starts):])
+    cleaned = remove_trailing_commas(cleaned)
+    
+    decoder = json.JSONDecoder()
+    candidates = [cleaned, close_truncated_json(cleaned)]
+    # 截断在键名或不完整的值上时，回退到最后一个逗号之前再补全
+    cut = cleaned.rfind(',')
+    if cut > 0:
+        candidates.append(close_truncated_json(cleaned[:cut]))
+    
+    for candidate in candidates:
+        try:
+            # raw_decode 忽略JSON之后的多余文字
+            return decoder.raw_decode(candidate)[0]
+        except JSONDecodeError:
+            continue
+    raise first_error
+
+
 def update_state_with_search_results(search_results: List[Dict[str, Any]], 
                                    paragraph_index: int, state: Any) -> Any:
     """
@@ -0,0 +1,36 @@
+"""
+测试公共配置
+
+src/utils/config.py 由使用者自行提供（含密钥），不在仓库中；缺失时在导入 src 之前以测试配置代替
+"""
+
+import os
+import sys
+import types
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 测试专用配置：固定报告类型（影响大纲提示词，进而影响录制的请求键），关闭网络搜索
+TEST_CONFIG = SimpleNamespace(
+    dashscope_api_key="test-key",
+    lightrag_url="http://lightrag.test",
+    report_type="company",
+    target_files=[],
+    enable_online_search=False,
+    tavily_api_key=None,
+)
+
+
+def install_test_config() -> None:
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    if os.path.exists(os.path.join(ROOT, "src", "utils", "config.py")) or "src.utils.config" in sys.modules:
+        return
+    module = types.ModuleType("src.utils.config")
+    module.Config = SimpleNamespace
+    module.load_config = lambda: TEST_CONFIG
+    sys.modules["src.utils.config"] = module
+
+
+install_test_config()
@@ -0,0 +1,117 @@
+"""
+回放测试：按 tests/cassettes/report_small.jsonl 离线运行 StructuredReportAgent.run，
+不访问 DashScope / LightRAG，验证整条图（大纲 → 段落检索 / 写作 / 反思 → 编译）能由录制结果完整驱动
+
+录制文件由本文件中的预设响应生成（不是真实服务的输出），修改提示词或请求参数后需重新录制:
+    python tests/test_replay.py --record
+"""
+
+import os
+import sys
+import asyncio
+import json
+
+import pytest
+
+from conftest import ROOT, TEST_CONFIG, install_test_config
+
+CASSETTE = os.path.join(ROOT, "tests", "cassettes", "report_small.jsonl")
+TOPIC = "示例科技投资价值分析"
+
+pytest.importorskip("langgraph")
+pytest.importorskip("openai")
+install_test_config()
+
+from src.agent import StructuredReportAgent  # noqa: E402
+from src.graph import builder  # noqa: E402
+from src.nodes import structure_node  # noqa: E402
+from src.llms.cassette import configure_cassette, disable_cassette  # noqa: E402
+
+
+# =========================================================
+# 录制用的预设响应
+# =========================================================
+SECTIONS = [
+    {"title": "公司概况", "content": "介绍公司主营业务与发展历程", "search_query": "主营业务 发展历程"},
+    {"title": "财务分析", "content": "分析营业收入与净利润的变化", "search_query": "营业收入 净利润"},
+]
+
+
+def _scripted_reply(params):
+    """按模型与提示词返回预设的 LLM 响应"""
+    system = params["messages"][0]["content"]
+    user = params["messages"][-1]["content"]
+    if params.get("model") == "qwen-plus":
+        return json.dumps(SECTIONS, ensure_ascii=False)
+    if params.get("model") == "qwen-max":
+        title = next(sec["title"] for sec in SECTIONS if sec["title"] in user)
+        return json.dumps({"paragraph_latest_state": f"{title}：示例科技经营稳健[1]。"}, ensure_ascii=False)
+    if "search_query" in system:
+        return json.dumps({"search_query": "", "reasoning": "内容完整"}, ensure_ascii=False)
+    raise AssertionError(f"没有预设响应的请求: {system[:60]}")
+
+
+def _scripted_search(payload):
+    query = payload.get("query", "")
+    return {"status": 200, "text": "", "data": {"results": [
+        {"title": f"{query} 资料", "url": "lightrag_source", "content": f"{query}：示例科技年报摘录，经营情况良好。",
+         "score": 0.9},
+    ]}}
+
+
+def record():
+    """用预设响应真实运行一次并录制 cassette"""
+    from src.llms.qwen_llm import QwenLLM
+    from src.tools.lightrag_search import LightRAGSearch
+
+    async def asend(self, params):
+        return _scripted_reply(params)
+
+    async def apost(self, payload, headers, timeout, url=None):
+        return _scripted_search(payload)
+
+    QwenLLM._send = lambda self, params: _scripted_reply(params)
+    QwenLLM._asend = asend
+    LightRAGSearch._post = lambda self, payload, headers, timeout, url=None: _scripted_search(payload)
+    LightRAGSearch._apost = apost
+    builder.load_config = structure_node.load_config = lambda: TEST_CONFIG
+
+    configure_cassette(CASSETTE, mode="record")
+    try:
+        print(asyncio.run(StructuredReportAgent().run(TOPIC)))
+    finally:
+        disable_cassette()
+
+
+# =========================================================
+# 回放
+# =========================================================
+@pytest.fixture
+def replay(monkeypatch):
+    monkeypatch.setattr(builder, "load_config", lambda: TEST_CONFIG)
+    monkeypatch.setattr(structure_node, "load_config", lambda: TEST_CONFIG)
+    cassette = configure_cassette(CASSETTE, mode="replay", strict=True)
+    yield cassette
+    disable_cassette()
+
+
+def test_run_replays_report(replay):
+    report = asyncio.run(StructuredReportAgent().run(TOPIC))
+
+    assert replay.stats()["misses"] == 0
+    assert replay.stats()["replayed"] > 0
+    for section in SECTIONS:
+        assert section["title"] in report
+    assert "示例科技经营稳健" in report
+
+
+def test_replay_is_deterministic(replay):
+    first = asyncio.run(StructuredReportAgent().run(TOPIC))
+    configure_cassette(CASSETTE, mode="replay", strict=True)
+    second = asyncio.run(StructuredReportAgent().run(TOPIC))
+
+    assert first == second
+
+
+if __name__ == "__main__" and "--record" in sys.argv:
+    record()
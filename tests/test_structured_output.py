@@ -0,0 +1,187 @@
+"""
+JSON 修复与结构化输出测试：repair_json 的各类本地修复、流式字段读取，以及只有本地修复失败时才发起重问
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("langgraph")
+
+from src.utils.text_processing import (  # noqa: E402
+    PartialJSONStringReader,
+    close_truncated_json,
+    extract_partial_json_string,
+    remove_trailing_commas,
+    repair_json,
+)
+from src.utils.structured_output import (  # noqa: E402
+    StructuredOutputError,
+    aresolve_json,
+    parse_json_output,
+    resolve_json,
+)
+
+
+# =========================================================
+# repair_json
+# =========================================================
+@pytest.mark.parametrize("text, expected", [
+    # 代码块标记与前后说明文字
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('以下是结果：\n{"a": [1, 2]}\n以上。', {"a": [1, 2]}),
+    # 截断在字符串值中
+    ('{"paragraph_latest_state": "第一段正文', {"paragraph_latest_state": "第一段正文"}),
+    ('{"paragraph_latest_state": "带转义\\', {"paragraph_latest_state": "带转义"}),
+    # 截断在键名处：回退到上一个完整字段
+    ('{"a": 1, "b', {"a": 1}),
+    ('[{"title": "A"}, {"title": "B", "content": "x"', [{"title": "A"}, {"title": "B", "content": "x"}]),
+    # 字符串内未转义的换行与制表符
+    ('{"a": "第一行\n第二行\t结束"}', {"a": "第一行\n第二行\t结束"}),
+    # 末尾多余的逗号
+    ('{"a": [1, 2,], "b": 3,}', {"a": [1, 2], "b": 3}),
+    # 字符串内的逗号与括号不受影响
+    ('{"a": "1, ]", "b": "x,}", "c": [1,],}', {"a": "1, ]", "b": "x,}", "c": [1]}),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "没有JSON的回复", "{{{"])
+def test_repair_json_gives_up(text):
+    with pytest.raises(ValueError):
+        repair_json(text)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('[1, 2 , ]', '[1, 2  ]'),
+    ('{"a": "x,}"}', '{"a": "x,}"}'),
+    ('{"a": "引号\\",]", }', '{"a": "引号\\",]" }'),
+])
+def test_remove_trailing_commas(text, expected):
+    assert remove_trailing_commas(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', '{"a": 1}'),
+    ('{"a": [1, 2', '{"a": [1, 2]}'),
+    ('{"a": "x\\', '{"a": "x"}'),
+    ('{"a":', '{"a": null}'),
+    ('{"a": 1,', '{"a": 1}'),
+])
+def test_close_truncated_json(text, expected):
+    assert close_truncated_json(text) == expected
+
+
+# =========================================================
+# 流式字段读取
+# =========================================================
+STREAMED = '{"paragraph_latest_state": "收入\\u589e长\\ud83d\\ude00，\\n完", "x": 1}'
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, len(STREAMED)])
+def test_partial_reader_chunking(size):
+    reader = PartialJSONStringReader("paragraph_latest_state")
+    deltas = [reader.feed(STREAMED[i:i + size]) for i in range(0, len(STREAMED), size)]
+
+    assert "".join(deltas) == reader.value == "收入增长😀，\n完"
+
+
+@pytest.mark.parametrize("text, expected", [
+    # 代理对被截断在两半之间时不输出半个字符
+    ('{"p": "a\\ud83d', "a"),
+    ('{"p": "a\\ud83d\\ude', "a"),
+    # 孤立的高位 / 低位代理以替换字符代替
+    ('{"p": "a\\ud83dxb"}', "a�xb"),
+    ('{"p": "a\\ude00b"}', "a�b"),
+    # 截断在转义序列中
+    ('{"p": "abc\\u00', "abc"),
+    ('{"p": "abc\\', "abc"),
+])
+def test_extract_partial_json_string(text, expected):
+    assert extract_partial_json_string(text, "p") == expected
+
+
+# =========================================================
+# 本地修复与重问
+# =========================================================
+class FakeLLM:
+    """记录重问次数，返回预设的回复"""
+
+    def __init__(self, reply: str):
+        self.reply = reply
+        self.calls = []
+
+    def invoke(self, messages, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(content=self.reply)
+
+    async def ainvoke(self, messages, **kwargs):
+        return self.invoke(messages, **kwargs)
+
+
+def _has_body(data):
+    return isinstance(data, dict) and bool(data.get("paragraph_latest_state"))
+
+
+@pytest.mark.parametrize("text", [
+    '```json\n{"paragraph_latest_state": "正文"}\n```',
+    '{"paragraph_latest_state": "被截断的正文',
+    '{"paragraph_latest_state": "正文", "extra": [1, 2,',
+])
+def test_resolve_json_repairs_locally_without_reask(text):
+    llm = FakeLLM('{"paragraph_latest_state": "重问结果"}')
+
+    result = resolve_json(llm, text, validate=_has_body, salvage_field="paragraph_latest_state")
+
+    assert result["paragraph_latest_state"] != "重问结果"
+    assert llm.calls == []
+
+
+def test_resolve_json_salvages_truncated_field_without_reask():
+    llm = FakeLLM('{"paragraph_latest_state": "重问结果"}')
+    # 截断在键名之后、正文之前的值里，整体无法修复为通过校验的对象，只能抢救字段
+    text = '{"other": {"k": [1, {"paragraph_latest_state": "抢救的正文'
+
+    result = resolve_json(llm, text, validate=_has_body, salvage_field="paragraph_latest_state")
+
+    assert result == {"paragraph_latest_state": "抢救的正文"}
+    assert llm.calls == []
+
+
+@pytest.mark.parametrize("text", ["抱歉，我无法完成", '{"paragraph_latest_state": ""}', "[1, 2]"])
+def test_resolve_json_reasks_after_local_repair_fails(text):
+    llm = FakeLLM('{"paragraph_latest_state": "重问结果"}')
+
+    result = resolve_json(llm, text, validate=_has_body, node="write")
+
+    assert result == {"paragraph_latest_state": "重问结果"}
+    assert len(llm.calls) == 1
+    assert llm.calls[0]["node"] == "write_repair"
+
+
+def test_resolve_json_raises_when_reask_also_fails():
+    llm = FakeLLM("仍然不是JSON")
+
+    with pytest.raises(StructuredOutputError):
+        resolve_json(llm, "不是JSON", validate=_has_body)
+    assert len(llm.calls) == 1
+
+
+def test_aresolve_json_reasks_only_after_local_repair_fails():
+    llm = FakeLLM('{"paragraph_latest_state": "重问结果"}')
+
+    repaired = asyncio.run(aresolve_json(llm, '{"paragraph_latest_state": "本地",}', validate=_has_body))
+    assert repaired == {"paragraph_latest_state": "本地"}
+    assert llm.calls == []
+
+    reasked = asyncio.run(aresolve_json(llm, "无法解析", validate=_has_body))
+    assert reasked == {"paragraph_latest_state": "重问结果"}
+    assert len(llm.calls) == 1
+
+
+def test_parse_json_output_rejects_invalid_structure():
+    with pytest.raises(StructuredOutputError):
+        parse_json_output('{"search_query": "x"}', validate=_has_body)